@@ -1,42 +1,20 @@
 import gradio as gr
-from ultralytics import YOLO
 import json
-import uuid
-from PIL import Image
-import numpy as np
 import cv2
-import os
 
-# Load model
-MODEL_PATH = 'best.pt'
-if os.path.exists(MODEL_PATH):
-    model = YOLO(MODEL_PATH)
-    print(f"✅ Model loaded successfully from {MODEL_PATH}")
-    print(f"📊 Model classes: {list(model.names.values())}")
-else:
-    raise FileNotFoundError(
-        f"❌ Model not found at {MODEL_PATH}\n"
-        "Please upload your best.pt file to the Space root directory."
-    )
+from inference import DEFAULT_CONF, PROFILES, annotate, get_engine
 
-# Class colors (BGR for OpenCV)
-COLORS = {
-    'cast': (0, 255, 0),      # Green
-    'cryst': (255, 255, 0),  # Cyan
-    'epith': (255, 0, 255),  # Magenta
-    'epithn': (255, 0, 0),   # Blue
-    'eryth': (0, 255, 255),  # Yellow
-    'leuko': (0, 165, 255),  # Orange
-    'mycete': (255, 0, 255), # Magenta
-}
+# Load model (shared with the API when run through server.py)
+engine = get_engine()
 
-def detect_sediments(image, conf_threshold=0.25):
+def detect_sediments(image, conf_threshold=None, field_type="any"):
     """
     Detect urine sediments in image and return annotated image + JSON predictions
     
     Args:
-        image: PIL Image
-        conf_threshold: Confidence threshold (0.0-1.0)
+        image: RGB numpy array
+        conf_threshold: Confidence threshold (0.0-1.0), None for the profile's own
+        field_type: "lpf" / "hpf" inference profile, or "any"
     
     Returns:
         tuple: (annotated_image, json_string, summary_dict)
@@ -45,94 +23,18 @@ def detect_sediments(image, conf_threshold=0.25):
         return None, "Please upload an image", {}
     
     try:
-        # Run inference
-        results = model(image, conf=conf_threshold, verbose=False)
-        
-        # Convert PIL to numpy for drawing
-        img_array = np.array(image)
-        if len(img_array.shape) == 2:  # Grayscale
-            img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB)
-        elif img_array.shape[2] == 4:  # RGBA
-            img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2RGB)
-        
-        # Format predictions
-        predictions = []
-        annotated_img = img_array.copy()
-        
-        for result in results:
-            boxes = result.boxes
-            if boxes is not None:
-                for box in boxes:
-                    x_center, y_center, width, height = box.xywh[0].cpu().numpy()
-                    x = float(x_center - width / 2)
-                    y = float(y_center - height / 2)
-                    
-                    class_id = int(box.cls[0].cpu().numpy())
-                    confidence = float(box.conf[0].cpu().numpy())
-                    class_name = model.names[class_id]
-                    
-                    # Draw bounding box
-                    color = COLORS.get(class_name, (255, 255, 255))
-                    x1, y1 = int(x), int(y)
-                    x2, y2 = int(x + width), int(y + height)
-                    
-                    cv2.rectangle(annotated_img, (x1, y1), (x2, y2), color, 2)
-                    
-                    # Draw label
-                    label = f"{class_name} {confidence:.2f}"
-                    (text_width, text_height), _ = cv2.getTextSize(
-                        label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1
-                    )
-                    cv2.rectangle(
-                        annotated_img,
-                        (x1, y1 - text_height - 10),
-                        (x1 + text_width, y1),
-                        color,
-                        -1
-                    )
-                    cv2.putText(
-                        annotated_img,
-                        label,
-                        (x1, y1 - 5),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        0.5,
-                        (0, 0, 0),
-                        1,
-                        cv2.LINE_AA
-                    )
-                    
-                    predictions.append({
-                        "x": x,
-                        "y": y,
-                        "width": float(width),
-                        "height": float(height),
-                        "confidence": round(confidence, 3),
-                        "class": class_name,
-                        "class_id": class_id,
-                        "detection_id": str(uuid.uuid4())
-                    })
-        
-        # Convert back to PIL for Gradio
-        annotated_pil = Image.fromarray(cv2.cvtColor(annotated_img, cv2.COLOR_BGR2RGB))
+        image_bgr = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        result_json = engine.analyze(image_bgr, conf_threshold,
+                                     field_type=None if field_type == "any" else field_type)
         
-        # Create summary
-        summary = {
-            "total_detections": len(predictions),
-            "by_class": {}
-        }
-        for pred in predictions:
-            class_name = pred["class"]
-            summary["by_class"][class_name] = summary["by_class"].get(class_name, 0) + 1
-        
-        result_json = {
-            "success": True,
-            "predictions": predictions,
-            "summary": summary
-        }
+        # Background-only field: shown as is, the model did not run
+        if result_json.get("blank_field"):
+            return image, json.dumps(result_json, indent=2), result_json["summary"]
         
+        annotated = cv2.cvtColor(annotate(image_bgr, result_json["predictions"]), cv2.COLOR_BGR2RGB)
         json_str = json.dumps(result_json, indent=2)
         
-        return annotated_pil, json_str, summary
+        return annotated, json_str, result_json["summary"]
     
     except Exception as e:
         error_msg = f"Error: {str(e)}"
@@ -140,6 +42,10 @@ def detect_sediments(image, conf_threshold=0.25):
         traceback.print_exc()
         return None, error_msg, {}
 
+def profile_conf(field_type):
+    """Confidence threshold of a field type's profile (slider default)."""
+    return PROFILES[field_type]['conf'] if field_type in PROFILES else DEFAULT_CONF
+
 # Create Gradio interface
 with gr.Blocks(title="MicroView AI - Urine Sediment Detection") as demo:
     gr.Markdown("""
@@ -159,18 +65,23 @@ with gr.Blocks(title="MicroView AI - Urine Sediment Detection") as demo:
     
     with gr.Row():
         with gr.Column():
-            image_input = gr.Image(type="pil", label="Upload Image")
+            image_input = gr.Image(type="numpy", image_mode="RGB", label="Upload Image")
             conf_slider = gr.Slider(
                 minimum=0.0,
                 maximum=1.0,
-                value=0.25,
+                value=profile_conf("any"),
                 step=0.05,
                 label="Confidence Threshold"
             )
+            field_type_radio = gr.Radio(
+                choices=["any", "lpf", "hpf"],
+                value="any",
+                label="Field Type (objective profile)"
+            )
             detect_btn = gr.Button("🔍 Detect Sediments", variant="primary", size="lg")
         
         with gr.Column():
-            image_output = gr.Image(type="pil", label="Detected Sediments (with bounding boxes)")
+            image_output = gr.Image(type="numpy", label="Detected Sediments (with bounding boxes)")
             json_output = gr.Textbox(
                 label="Predictions (JSON)",
                 lines=15,
@@ -181,16 +92,23 @@ with gr.Blocks(title="MicroView AI - Urine Sediment Detection") as demo:
     # Statistics
     stats_output = gr.JSON(label="📊 Summary Statistics")
     
+    # Each field type starts from its own profile's threshold
+    field_type_radio.change(
+        fn=profile_conf,
+        inputs=field_type_radio,
+        outputs=conf_slider
+    )
+    
     # Auto-detect on image upload or button click
     detect_btn.click(
         fn=detect_sediments,
-        inputs=[image_input, conf_slider],
+        inputs=[image_input, conf_slider, field_type_radio],
         outputs=[image_output, json_output, stats_output]
     )
     
     image_input.change(
         fn=detect_sediments,
-        inputs=[image_input, conf_slider],
+        inputs=[image_input, conf_slider, field_type_radio],
         outputs=[image_output, json_output, stats_output]
     )
     
@@ -199,6 +117,7 @@ with gr.Blocks(title="MicroView AI - Urine Sediment Detection") as demo:
     gr.Markdown("""
     - Upload a clear urine microscopy image
     - Adjust confidence threshold to filter detections (lower = more detections, higher = fewer but more confident)
+    - Choosing a field type resets the threshold to that profile's default (lpf 0.3, hpf 0.25)
     - Results include bounding boxes, class names, and confidence scores
     - JSON output can be used for API integration
     """)
@@ -1,35 +1,36 @@
 """
 FastAPI-only backend for Urine Sediment Detection
-No UI - Pure API endpoint
+No UI - Pure API endpoint (server.py serves it together with the Gradio UI)
 """
 
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Query, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from ultralytics import YOLO
-import json
-import uuid
-from PIL import Image
-import numpy as np
-import cv2
-import os
-import io
-
-# Load model
-MODEL_PATH = 'best.pt'
-if os.path.exists(MODEL_PATH):
-    model = YOLO(MODEL_PATH)
-    print(f"✅ Model loaded successfully from {MODEL_PATH}")
-    print(f"📊 Model classes: {list(model.names.values())}")
-else:
-    raise FileNotFoundError(
-        f"❌ Model not found at {MODEL_PATH}\n"
-        "Please upload your best.pt file to the Space root directory."
-    )
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+
+import blank_filter
+import color_normalize
+import preview
+import upload_limits
+from detection_archive import get_archive
+from inference import get_engine
+
+# Load model (shared with the Gradio UI when run through server.py)
+engine = get_engine()
+
+# Per-test detection store (detection_archive.py), None when disabled
+archive = get_archive()
+
+# Decoded images in flight across all requests (upload_limits.py)
+decode_budget = upload_limits.MemoryBudget()
 
 # Initialize FastAPI app
 app = FastAPI(title="Urine Sediment Detection API")
 
+# Reject oversized uploads while they stream in
+app.add_middleware(upload_limits.UploadLimitMiddleware)
+
 # Enable CORS for Next.js frontend
 app.add_middleware(
     CORSMiddleware,
@@ -46,25 +47,52 @@ async def root():
         "status": "ok",
         "message": "Urine Sediment Detection API",
         "model": "YOLO v11",
-        "classes": list(model.names.values())
+        "classes": list(engine.names.values()),
+        "profiles": engine.describe_profiles()
     }
 
 @app.get("/health")
 async def health():
     """Health check endpoint"""
-    return {"status": "healthy", "model_loaded": True}
+    return {
+        "status": "healthy",
+        "model_loaded": True,
+        "prefilter": blank_filter.get_stats(),
+        "inference": engine.get_stats(),
+        "memory": decode_budget.get_stats(),
+        "archive": archive.get_stats() if archive else None
+    }
+
+def analyze(file, conf, skip_blank, test_id=None, field_type=None, image_index=None, microscope=None):
+    """Decode the spooled upload and run it through the engine (worker thread)."""
+    response = engine.analyze(upload_limits.decode(file), conf, skip_blank, microscope, field_type)
+    if archive and test_id:
+        response["field_id"] = archive.add_field(test_id, field_type, image_index, response)
+    return response
 
 @app.post("/api/predict")
 async def detect_sediments(
     image: UploadFile = File(...),
-    conf: float = Form(0.25)
+    conf: Optional[float] = Form(None),
+    skip_blank: bool = Form(True),
+    test_id: Optional[str] = Form(None),
+    field_type: Optional[str] = Form(None),
+    image_index: Optional[int] = Form(None),
+    microscope: Optional[str] = Form(None)
 ):
     """
     Detect urine sediments in uploaded image
     
     Args:
         image: Image file (JPEG, PNG, etc.)
-        conf: Confidence threshold (0.0-1.0), default 0.25
+        conf: Confidence threshold (0.0-1.0), default 0.25 or the profile's
+        field_type: lpf / hpf inference profile (input size, classes,
+            confidence, model — inference.PROFILES); also archived
+        skip_blank: Skip the model for background-only fields (blank_filter.py)
+        test_id, image_index: Archive the field under this test
+            (detection_archive.py); re-sending an image_index replaces it
+        microscope: Colour-normalize with this microscope's calibration
+            (color_normalize.py)
     
     Returns:
         JSON with predictions in the specified format
@@ -74,63 +102,81 @@ async def detect_sediments(
         if not image.content_type or not image.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
         
-        # Read image
-        image_bytes = await image.read()
-        image_pil = Image.open(io.BytesIO(image_bytes))
-        
-        # Convert to RGB if needed
-        if image_pil.mode != 'RGB':
-            image_pil = image_pil.convert('RGB')
-        
-        # Run inference
-        results = model(image_pil, conf=conf, verbose=False)
-        
-        # Format predictions
-        predictions = []
-        
-        for result in results:
-            boxes = result.boxes
-            if boxes is not None:
-                for box in boxes:
-                    x_center, y_center, width, height = box.xywh[0].cpu().numpy()
-                    x = float(x_center - width / 2)
-                    y = float(y_center - height / 2)
-                    
-                    class_id = int(box.cls[0].cpu().numpy())
-                    confidence = float(box.conf[0].cpu().numpy())
-                    class_name = model.names[class_id]
-                    
-                    predictions.append({
-                        "x": x,
-                        "y": y,
-                        "width": float(width),
-                        "height": float(height),
-                        "confidence": round(confidence, 3),
-                        "class": class_name,
-                        "class_id": class_id,
-                        "detection_id": str(uuid.uuid4())
-                    })
-        
-        # Create summary
-        summary = {
-            "total_detections": len(predictions),
-            "by_class": {}
-        }
-        for pred in predictions:
-            class_name = pred["class"]
-            summary["by_class"][class_name] = summary["by_class"].get(class_name, 0) + 1
-        
-        return JSONResponse({
-            "success": True,
-            "predictions": predictions,
-            "summary": summary
-        })
+        # Size from the header only, then wait for room in the decode budget
+        try:
+            width, height = upload_limits.image_size(image.file)
+            async with decode_budget.reserve(upload_limits.decoded_bytes(width, height)):
+                return JSONResponse(await run_in_threadpool(
+                    analyze, image.file, conf, skip_blank, test_id, field_type, image_index, microscope))
+        except upload_limits.ImageTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+def decode_calibration(files):
+    return [upload_limits.decode(file) for file in files]
+
+@app.post("/api/color/calibrate")
+async def color_calibrate(
+    microscope: str = Form(...),
+    images: List[UploadFile] = File(...),
+    clahe: Optional[float] = Form(None)
+):
+    """Add blank and sample fields to a microscope's colour profile"""
+    try:
+        cost = 0
+        for image in images:
+            width, height = upload_limits.image_size(image.file)
+            cost += upload_limits.decoded_bytes(width, height)
+        async with decode_budget.reserve(cost):
+            decoded = await run_in_threadpool(decode_calibration, [image.file for image in images])
+            profile = await run_in_threadpool(color_normalize.calibrate, microscope, decoded, clahe)
+    except upload_limits.ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"microscope": microscope, "profile": profile}
+
+@app.get("/api/color/profiles")
+async def color_profiles():
+    """Calibrated microscopes"""
+    return color_normalize.get_profiles()
+
+@app.websocket("/ws/preview")
+async def live_preview(websocket: WebSocket):
+    """Live preview: stream small frames, get per-class counts back (preview.py)"""
+    await preview.serve(websocket)
+
+def require_archive():
+    if archive is None:
+        raise HTTPException(status_code=404, detail="Detection archive is disabled (ARCHIVE_PATH)")
+    return archive
+
+@app.get("/api/archive/tests/{test_id}")
+async def archive_test_fields(test_id: str, field_type: Optional[str] = None):
+    """Per-field class counts of one test"""
+    fields = await run_in_threadpool(require_archive().field_counts, test_id, field_type)
+    return {"test_id": test_id, "fields": fields}
+
+@app.get("/api/archive/histogram")
+async def archive_histogram(test_id: Optional[str] = None, field_type: Optional[str] = None,
+                            class_name: Optional[str] = Query(None, alias="class")):
+    """Confidence histogram per class, over one test or all of them"""
+    return await run_in_threadpool(require_archive().confidence_histogram, test_id, field_type, class_name)
+
+@app.get("/api/archive/compare")
+async def archive_compare(test_ids: str, field_type: Optional[str] = None):
+    """Per-class totals and mean count per field of several tests (comma-separated ids)"""
+    ids = [test_id for test_id in test_ids.split(",") if test_id]
+    return {"tests": await run_in_threadpool(require_archive().compare_tests, ids, field_type)}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=7860)
@@ -0,0 +1,214 @@
+"""
+Colour normalization
+Optional preprocessing that evens out illumination and stain differences
+between microscopes before inference, server side, so bench PCs do not run
+it in the browser.
+
+Each microscope is calibrated once (POST /api/color/calibrate) from a few of
+its fields:
+    - blank fields give the background level per channel → white balance
+      gains that bring the background to WHITE_LEVEL
+    - sample fields give the per-channel mean and spread → stain
+      normalization (Reinhard-style mean/std matching per channel) towards
+      the average of all calibrated microscopes
+White balance and stain normalization are both per-channel affine maps, so
+they are folded into one 256-entry lookup table per microscope, compiled
+once and cached. CLAHE (on LAB lightness) is optional per microscope.
+
+preprocess() is fused with the resize to the model's input size: the
+full-resolution frame is traversed once, by the INTER_AREA resize, and the
+lookup table and CLAHE run on the small copy. The model then sees an image
+that is already at its input size; predictions are mapped back to the
+original coordinates with the returned scale.
+
+Profiles are kept in COLOR_PROFILES (default color_profiles.json).
+"""
+
+import json
+import os
+import threading
+
+import cv2
+import numpy as np
+
+import blank_filter
+
+PROFILES_PATH = os.environ.get('COLOR_PROFILES', 'color_profiles.json')
+
+# Background level (per channel, 0-255) white balance aims for. Below
+# saturation, so bright objects on the background keep their detail.
+WHITE_LEVEL = 235.0
+# Percentile of a blank field taken as its background level; robust to dust
+# and to the darker corners of a vignetted field.
+BACKGROUND_PERCENTILE = 90
+# Width of the copy calibration statistics are measured on.
+STATS_WIDTH = 512
+CLAHE_TILES = (8, 8)
+
+DEFAULT_PROFILE = {
+    'white': None,        # background level per channel (BGR)
+    'mean': None,         # per-channel mean of sample fields (BGR)
+    'std': None,          # per-channel standard deviation of sample fields (BGR)
+    'clahe': 0.0,         # CLAHE clip limit, 0 = off
+    'blank_fields': 0,
+    'sample_fields': 0,
+}
+
+_lock = threading.Lock()
+_profiles = None
+_compiled = {}
+
+# ---------------------------------------------------------------------------
+# Profiles
+# ---------------------------------------------------------------------------
+
+def load_profiles():
+    global _profiles
+    with _lock:
+        if _profiles is None:
+            _profiles = {}
+            if os.path.exists(PROFILES_PATH):
+                with open(PROFILES_PATH) as f:
+                    _profiles = {name: dict(DEFAULT_PROFILE, **profile) for name, profile in json.load(f).items()}
+                print(f"🎨 Colour profiles loaded: {list(_profiles)}")
+        return _profiles
+
+def _save_profiles():
+    tmp = f"{PROFILES_PATH}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(_profiles, f, indent=2)
+    os.replace(tmp, PROFILES_PATH)
+
+def channel_stats(image):
+    """(mean, std) per channel of a BGR image, on a downscaled copy."""
+    height, width = image.shape[:2]
+    if width > STATS_WIDTH:
+        image = cv2.resize(image, (STATS_WIDTH, max(1, round(height * STATS_WIDTH / width))),
+                           interpolation=cv2.INTER_AREA)
+    mean, std = cv2.meanStdDev(image)
+    return mean.ravel(), std.ravel(), image
+
+def _running_mean(old, count, new):
+    if old is None or not count:
+        return [round(float(v), 3) for v in new]
+    return [round((o * count + float(v)) / (count + 1), 3) for o, v in zip(old, new)]
+
+def calibrate(microscope, images, clahe=None):
+    """Add BGR fields to a microscope's profile and return the profile.
+
+    Each field is sorted by the blank-field screen: blank fields update the
+    background level, the others the stain statistics.
+    """
+    profiles = load_profiles()
+    updates = []
+    for image in images:
+        mean, std, small = channel_stats(image)
+        if blank_filter.screen(small)['blank']:
+            background = np.percentile(small.reshape(-1, 3), BACKGROUND_PERCENTILE, axis=0)
+            updates.append(('white', background, None))
+        else:
+            updates.append(('sample', mean, std))
+
+    with _lock:
+        profile = profiles.setdefault(microscope, dict(DEFAULT_PROFILE))
+        for kind, first, second in updates:
+            if kind == 'white':
+                profile['white'] = _running_mean(profile['white'], profile['blank_fields'], first)
+                profile['blank_fields'] += 1
+            else:
+                profile['mean'] = _running_mean(profile['mean'], profile['sample_fields'], first)
+                profile['std'] = _running_mean(profile['std'], profile['sample_fields'], second)
+                profile['sample_fields'] += 1
+        if clahe is not None:
+            profile['clahe'] = float(clahe)
+        _save_profiles()
+        # The stain target is the fleet average, so every table changes.
+        _compiled.clear()
+        return dict(profile)
+
+# ---------------------------------------------------------------------------
+# Compiled lookup tables
+# ---------------------------------------------------------------------------
+
+def _gains(profile):
+    if profile['white'] is None:
+        return np.ones(3)
+    return WHITE_LEVEL / np.maximum(np.asarray(profile['white'], dtype=np.float64), 1.0)
+
+def _target(profiles):
+    """Average white-balanced stain statistics of all calibrated microscopes."""
+    means, stds = [], []
+    for profile in profiles.values():
+        if profile['mean'] is not None:
+            gains = _gains(profile)
+            means.append(np.asarray(profile['mean']) * gains)
+            stds.append(np.asarray(profile['std']) * gains)
+    if not means:
+        return None
+    return np.mean(means, axis=0), np.mean(stds, axis=0)
+
+def compiled(microscope):
+    """(lookup table, CLAHE clip limit) for a microscope, or None if unknown."""
+    profiles = load_profiles()
+    with _lock:
+        if microscope in _compiled:
+            return _compiled[microscope]
+        profile = profiles.get(microscope)
+        if profile is None:
+            return None
+        gains = _gains(profile)
+        levels = np.arange(256, dtype=np.float64)[:, None] * gains          # 256 x 3
+        target = _target(profiles)
+        if profile['mean'] is not None and target is not None:
+            mean = np.asarray(profile['mean']) * gains
+            std = np.maximum(np.asarray(profile['std']) * gains, 1e-3)
+            levels = (levels - mean) * (target[1] / std) + target[0]
+        lut = np.clip(np.rint(levels), 0, 255).astype(np.uint8).reshape(1, 256, 3)
+        _compiled[microscope] = (lut, profile['clahe'])
+        return _compiled[microscope]
+
+# ---------------------------------------------------------------------------
+# Preprocessing
+# ---------------------------------------------------------------------------
+
+def preprocess(image, microscope, size):
+    """Resize a BGR image to fit `size` and normalize its colours.
+
+    Returns (image, scale) — scale maps the result's coordinates back to the
+    input's (divide by it) — or (image, None) unchanged if the microscope has
+    no profile.
+    """
+    table = compiled(microscope)
+    if table is None:
+        return image, None
+    lut, clip = table
+
+    height, width = image.shape[:2]
+    scale = size / max(height, width)
+    if scale < 1:
+        small = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+        cv2.LUT(small, lut, dst=small)
+    else:
+        scale = 1.0
+        small = cv2.LUT(image, lut)
+
+    if clip:
+        lab = cv2.cvtColor(small, cv2.COLOR_BGR2LAB)
+        lightness = np.ascontiguousarray(lab[:, :, 0])
+        lab[:, :, 0] = cv2.createCLAHE(clipLimit=clip, tileGridSize=CLAHE_TILES).apply(lightness)
+        cv2.cvtColor(lab, cv2.COLOR_LAB2BGR, dst=small)
+    return small, scale
+
+def rescale(predictions, scale):
+    """Map predictions made on a preprocessed image back to the original."""
+    if scale != 1.0:
+        for pred in predictions:
+            for key in ("x", "y", "width", "height"):
+                pred[key] = pred[key] / scale
+    return predictions
+
+def get_profiles():
+    profiles = load_profiles()
+    with _lock:
+        return {name: dict(profile) for name, profile in profiles.items()}
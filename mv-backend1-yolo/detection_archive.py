@@ -0,0 +1,232 @@
+"""
+Detection archive
+Appends every analysed field's detections to a SQLite database so per-test
+and cross-test questions are answered by indexed queries instead of
+re-fetching and re-parsing the per-image JSON.
+
+Tables (WITHOUT ROWID, so rows are stored clustered by their primary key —
+each test / field type / class is one contiguous range, like a partition):
+
+    fields        (test_id, field_type, field_id)           one row per field
+    class_counts  (test_id, field_type, class, field_id)    count per class per field
+    conf_hist     (test_id, field_type, class, bin)         confidence histogram
+    detections    (test_id, field_type, class, field_id, n) the boxes themselves
+
+class_counts and conf_hist are maintained on insert, so counts per field,
+confidence histograms and test comparisons never read the box rows.
+
+Fields are archived when /api/predict is given a `test_id` (plus optional
+`field_type` and `image_index`). Re-sending a field (same test, field type
+and image index) replaces it.
+
+Tunable through environment variables:
+    ARCHIVE_PATH (default detections.sqlite)   ARCHIVE_PATH= disables it
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+ARCHIVE_PATH = os.environ.get('ARCHIVE_PATH', 'detections.sqlite')
+
+# Confidence histogram resolution: bins of 1 / HIST_BINS.
+HIST_BINS = 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fields (
+    test_id TEXT NOT NULL,
+    field_type TEXT NOT NULL,
+    field_id INTEGER NOT NULL,
+    image_index INTEGER,
+    created REAL NOT NULL,
+    total INTEGER NOT NULL,
+    blank INTEGER NOT NULL,
+    PRIMARY KEY (test_id, field_type, field_id)
+) WITHOUT ROWID;
+CREATE UNIQUE INDEX IF NOT EXISTS fields_image ON fields (test_id, field_type, image_index);
+CREATE INDEX IF NOT EXISTS fields_created ON fields (created);
+
+CREATE TABLE IF NOT EXISTS class_counts (
+    test_id TEXT NOT NULL,
+    field_type TEXT NOT NULL,
+    class TEXT NOT NULL,
+    field_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (test_id, field_type, class, field_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS class_counts_class ON class_counts (class, field_type);
+
+CREATE TABLE IF NOT EXISTS conf_hist (
+    test_id TEXT NOT NULL,
+    field_type TEXT NOT NULL,
+    class TEXT NOT NULL,
+    bin INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (test_id, field_type, class, bin)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS detections (
+    test_id TEXT NOT NULL,
+    field_type TEXT NOT NULL,
+    class TEXT NOT NULL,
+    field_id INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    confidence REAL NOT NULL,
+    x REAL NOT NULL,
+    y REAL NOT NULL,
+    width REAL NOT NULL,
+    height REAL NOT NULL,
+    PRIMARY KEY (test_id, field_type, class, field_id, n)
+) WITHOUT ROWID;
+"""
+
+def confidence_bin(confidence):
+    return min(HIST_BINS - 1, max(0, int(confidence * HIST_BINS)))
+
+class DetectionArchive:
+    """SQLite detection store; safe to share between threads."""
+
+    def __init__(self, path=ARCHIVE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+        print(f"🗄️ Detection archive at {path}")
+
+    # --- writing ---
+
+    def add_field(self, test_id, field_type, image_index, response):
+        """Archive one /api/predict response body. Returns the field id."""
+        test_id, field_type = str(test_id), field_type or 'unknown'
+        predictions = response.get('predictions', [])
+        counts = {}
+        hist = {}
+        for pred in predictions:
+            counts[pred['class']] = counts.get(pred['class'], 0) + 1
+            key = (pred['class'], confidence_bin(pred['confidence']))
+            hist[key] = hist.get(key, 0) + 1
+
+        with self._lock, self._db:
+            if image_index is not None:
+                self._remove_field(test_id, field_type, image_index)
+            field_id = self._db.execute(
+                'SELECT COALESCE(MAX(field_id), -1) + 1 FROM fields WHERE test_id = ? AND field_type = ?',
+                (test_id, field_type)).fetchone()[0]
+            self._db.execute(
+                'INSERT INTO fields VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (test_id, field_type, field_id, image_index, time.time(), len(predictions),
+                 int(bool(response.get('blank_field')))))
+            self._db.executemany(
+                'INSERT INTO class_counts VALUES (?, ?, ?, ?, ?)',
+                [(test_id, field_type, cls, field_id, count) for cls, count in counts.items()])
+            self._db.executemany(
+                'INSERT INTO conf_hist VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (test_id, field_type, class, bin) DO UPDATE SET count = count + excluded.count',
+                [(test_id, field_type, cls, b, count) for (cls, b), count in hist.items()])
+            self._db.executemany(
+                'INSERT INTO detections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(test_id, field_type, pred['class'], field_id, n, pred['confidence'],
+                  pred['x'], pred['y'], pred['width'], pred['height'])
+                 for n, pred in enumerate(predictions)])
+        return field_id
+
+    def _remove_field(self, test_id, field_type, image_index):
+        row = self._db.execute(
+            'SELECT field_id FROM fields WHERE test_id = ? AND field_type = ? AND image_index = ?',
+            (test_id, field_type, image_index)).fetchone()
+        if row is None:
+            return
+        field_id = row[0]
+        for cls, conf in self._db.execute(
+                'SELECT class, confidence FROM detections WHERE test_id = ? AND field_type = ? AND field_id = ?',
+                (test_id, field_type, field_id)).fetchall():
+            self._db.execute(
+                'UPDATE conf_hist SET count = count - 1 '
+                'WHERE test_id = ? AND field_type = ? AND class = ? AND bin = ?',
+                (test_id, field_type, cls, confidence_bin(conf)))
+        self._db.execute('DELETE FROM conf_hist WHERE test_id = ? AND field_type = ? AND count <= 0',
+                         (test_id, field_type))
+        for table in ('fields', 'class_counts', 'detections'):
+            self._db.execute(f'DELETE FROM {table} WHERE test_id = ? AND field_type = ? AND field_id = ?',
+                             (test_id, field_type, field_id))
+
+    # --- queries ---
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def field_counts(self, test_id, field_type=None):
+        """Per-field class counts of a test, in field order."""
+        where, params = 'test_id = ?', [test_id]
+        if field_type:
+            where += ' AND field_type = ?'
+            params.append(field_type)
+        fields = {}
+        for field_type_, field_id, image_index, total, blank in self._query(
+                f'SELECT field_type, field_id, image_index, total, blank FROM fields WHERE {where} '
+                'ORDER BY field_type, field_id', params):
+            fields[(field_type_, field_id)] = {
+                'field_type': field_type_, 'image_index': image_index,
+                'total': total, 'blank': bool(blank), 'by_class': {},
+            }
+        for field_type_, cls, field_id, count in self._query(
+                f'SELECT field_type, class, field_id, count FROM class_counts WHERE {where}', params):
+            field = fields.get((field_type_, field_id))
+            if field is not None:
+                field['by_class'][cls] = count
+        return list(fields.values())
+
+    def confidence_histogram(self, test_id=None, field_type=None, cls=None):
+        """Detections per confidence bin (bin i covers [i, i+1) / HIST_BINS), per class."""
+        clauses, params = [], []
+        for column, value in (('test_id', test_id), ('field_type', field_type), ('class', cls)):
+            if value:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        histograms = {}
+        for cls_, b, count in self._query(
+                f'SELECT class, bin, SUM(count) FROM conf_hist {where} GROUP BY class, bin', params):
+            histograms.setdefault(cls_, [0] * HIST_BINS)[b] = count
+        return {'bins': [round(i / HIST_BINS, 3) for i in range(HIST_BINS + 1)], 'by_class': histograms}
+
+    def compare_tests(self, test_ids, field_type=None):
+        """Fields, total and mean count per field of every class, per test and field type."""
+        marks = ','.join('?' * len(test_ids))
+        where, params = f'test_id IN ({marks})', list(test_ids)
+        if field_type:
+            where += ' AND field_type = ?'
+            params.append(field_type)
+        tests = {test_id: {} for test_id in test_ids}
+        for test_id, field_type_, fields in self._query(
+                f'SELECT test_id, field_type, COUNT(*) FROM fields WHERE {where} GROUP BY test_id, field_type',
+                params):
+            tests[test_id][field_type_] = {'fields': fields, 'by_class': {}}
+        for test_id, field_type_, cls, total in self._query(
+                f'SELECT test_id, field_type, class, SUM(count) FROM class_counts WHERE {where} '
+                'GROUP BY test_id, field_type, class', params):
+            entry = tests[test_id].get(field_type_)
+            if entry is not None:
+                entry['by_class'][cls] = {'total': total, 'per_field': round(total / entry['fields'], 3)}
+        return tests
+
+    def get_stats(self):
+        fields, tests = self._query('SELECT COUNT(*), COUNT(DISTINCT test_id) FROM fields')[0]
+        return {'path': self.path, 'fields': fields, 'tests': tests}
+
+_archive = None
+_archive_lock = threading.Lock()
+
+def get_archive():
+    """The process-wide archive, or None when ARCHIVE_PATH is empty."""
+    global _archive
+    if not ARCHIVE_PATH:
+        return None
+    with _archive_lock:
+        if _archive is None:
+            _archive = DetectionArchive()
+        return _archive
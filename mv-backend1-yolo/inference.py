@@ -0,0 +1,356 @@
+"""
+Shared inference engine
+One YOLO model per process, used by both front-ends (app.py Gradio UI and
+app_fastapi.py API — served together by server.py) and by reanalyze.py's
+result formatting.
+
+- Requests from any thread are queued to a single inference thread, which
+  gathers whatever arrives within MAX_WAIT_MS (up to MAX_BATCH images with
+  the same confidence threshold) into one forward pass.
+- Results are cached by image content and threshold (CACHE_SIZE entries,
+  LRU), so a re-sent field — a retry, or the UI re-running after a slider
+  change back — skips the model. Cached detections get fresh detection ids.
+- Each objective has an inference profile (PROFILES, chosen by the
+  `field_type` of a request: lpf / hpf as the motor server names them) with
+  its own input size, class subset, confidence and optionally its own
+  model. LPF fields are only graded for large sediments, so they run at a
+  smaller input size on the classes reported /LPF.
+- Live preview frames (preview.py) share the model but not the wait: they
+  are queued ahead of full-quality requests, run in a pass of their own
+  and are never cached.
+- Images are BGR numpy arrays throughout, as cv2 decodes them.
+
+Tunable through environment variables:
+    MODEL_PATH (default best.pt)
+    LPF_MODEL, HPF_MODEL (default MODEL_PATH)   per-objective model
+    INFER_MAX_BATCH (default 8)      images per forward pass
+    INFER_MAX_WAIT_MS (default 10)   how long a pass waits to fill up
+    INFER_CACHE_SIZE (default 256)   cached results, 0 disables the cache
+"""
+
+import copy
+import hashlib
+import itertools
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+import blank_filter
+import color_normalize
+
+MODEL_PATH = os.environ.get('MODEL_PATH', 'best.pt')
+MAX_BATCH = int(os.environ.get('INFER_MAX_BATCH', '8'))
+MAX_WAIT = float(os.environ.get('INFER_MAX_WAIT_MS', '10')) / 1000
+CACHE_SIZE = int(os.environ.get('INFER_CACHE_SIZE', '256'))
+
+# Inference profiles per field type. `classes` are class-name prefixes (as
+# in the report's class mapping), None for every class; `imgsz` None is the
+# model's own input size; `model` None is MODEL_PATH. An explicit `conf` in
+# the request overrides the profile's.
+PROFILES = {
+    # 10x: casts, squamous epithelial cells and crystals, all large
+    'lpf': {'imgsz': 416, 'classes': ('cast', 'epith', 'cryst'), 'conf': 0.3,
+            'model': os.environ.get('LPF_MODEL')},
+    # 40x: small cells need the full input size and every class
+    'hpf': {'imgsz': None, 'classes': None, 'conf': 0.25,
+            'model': os.environ.get('HPF_MODEL')},
+}
+DEFAULT_CONF = 0.25
+
+# Queue priorities: lower runs first.
+PRIORITY_PREVIEW = 0
+PRIORITY_ANALYSIS = 1
+
+# Class colors (BGR for OpenCV)
+COLORS = {
+    'cast': (0, 255, 0),      # Green
+    'cryst': (255, 255, 0),  # Cyan
+    'epith': (255, 0, 255),  # Magenta
+    'epithn': (255, 0, 0),   # Blue
+    'eryth': (0, 255, 255),  # Yellow
+    'leuko': (0, 165, 255),  # Orange
+    'mycete': (255, 0, 255), # Magenta
+}
+
+# ---------------------------------------------------------------------------
+# Formatting
+# ---------------------------------------------------------------------------
+
+def format_result(result, names):
+    """One ultralytics result as the /api/predict predictions + summary."""
+    predictions = []
+    boxes = result.boxes
+    if boxes is not None and len(boxes):
+        for (x_center, y_center, width, height), class_id, confidence in zip(
+                boxes.xywh.cpu().numpy(), boxes.cls.cpu().numpy(), boxes.conf.cpu().numpy()):
+            class_id = int(class_id)
+            predictions.append({
+                "x": float(x_center - width / 2),
+                "y": float(y_center - height / 2),
+                "width": float(width),
+                "height": float(height),
+                "confidence": round(float(confidence), 3),
+                "class": names[class_id],
+                "class_id": class_id,
+                "detection_id": str(uuid.uuid4())
+            })
+    return predictions, summarize(predictions)
+
+def class_ids(names, prefixes):
+    """Ids of the model classes whose name starts with one of `prefixes`
+    (a profile's `classes`); None for every class."""
+    if not prefixes:
+        return None
+    return [class_id for class_id, name in names.items() if name.lower().startswith(tuple(prefixes))] or None
+
+def summarize(predictions):
+    by_class = {}
+    for pred in predictions:
+        by_class[pred["class"]] = by_class.get(pred["class"], 0) + 1
+    return {"total_detections": len(predictions), "by_class": by_class}
+
+def annotate(image, predictions):
+    """Copy of a BGR image with the predictions' boxes and labels drawn."""
+    annotated = image.copy()
+    for pred in predictions:
+        color = COLORS.get(pred["class"], (255, 255, 255))
+        x1, y1 = int(pred["x"]), int(pred["y"])
+        x2, y2 = int(pred["x"] + pred["width"]), int(pred["y"] + pred["height"])
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
+
+        label = f"{pred['class']} {pred['confidence']:.2f}"
+        (text_width, text_height), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+        cv2.rectangle(annotated, (x1, y1 - text_height - 10), (x1 + text_width, y1), color, -1)
+        cv2.putText(annotated, label, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                    (0, 0, 0), 1, cv2.LINE_AA)
+    return annotated
+
+# ---------------------------------------------------------------------------
+# Engine
+# ---------------------------------------------------------------------------
+
+class _Job:
+    def __init__(self, image, conf, profile, imgsz=None, priority=PRIORITY_ANALYSIS):
+        self.image = image
+        self.conf = conf
+        self.profile = profile
+        self.imgsz = imgsz
+        self.priority = priority
+        self.result = None
+        self.error = None
+        self.seconds = 0.0         # forward pass time of the job's group
+        self.done = threading.Event()
+
+class InferenceEngine:
+    """The process's model plus its batching thread and result cache."""
+
+    def __init__(self, model_path=MODEL_PATH, max_batch=MAX_BATCH, max_wait=MAX_WAIT, cache_size=CACHE_SIZE):
+        # Imported here so reanalyze.py can use the formatting helpers
+        # without loading torch in its parent process.
+        from ultralytics import YOLO
+
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"❌ Model not found at {model_path}\n"
+                "Please upload your best.pt file to the Space root directory."
+            )
+        self._models = {}
+        self.model = self._load(YOLO, model_path)
+        self.names = self.model.names
+        self.imgsz = self._input_size(self.model)
+        print(f"✅ Model loaded successfully from {model_path}")
+        print(f"📊 Model classes: {list(self.names.values())}")
+
+        # Resolved profiles; None is the plain model, for requests without a field type
+        self.profiles = {None: {'model': self.model, 'imgsz': self.imgsz, 'classes': None, 'conf': DEFAULT_CONF}}
+        for field_type, settings in PROFILES.items():
+            model = self._load(YOLO, settings['model']) if settings['model'] else self.model
+            classes = class_ids(model.names, settings['classes'])
+            self.profiles[field_type] = {
+                'model': model,
+                'imgsz': settings['imgsz'] or self._input_size(model),
+                'classes': classes,
+                'conf': settings['conf'],
+            }
+            print(f"🔭 {field_type} profile: imgsz {self.profiles[field_type]['imgsz']}, "
+                  f"classes {[model.names[c] for c in classes] if classes else 'all'}, "
+                  f"model {settings['model'] or model_path}")
+
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self.stats = {'requests': 0, 'cache_hits': 0, 'batches': 0, 'batched_images': 0}
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _load(self, YOLO, path):
+        if path not in self._models:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"❌ Model not found at {path}")
+            self._models[path] = YOLO(path)
+        return self._models[path]
+
+    @staticmethod
+    def _input_size(model):
+        imgsz = getattr(model, 'overrides', {}).get('imgsz', 640)
+        return max(imgsz) if isinstance(imgsz, (list, tuple)) else int(imgsz)
+
+    def profile(self, field_type):
+        """Resolved inference profile of a field type (None for the default)."""
+        if field_type not in self.profiles:
+            raise ValueError(f"Unknown field_type '{field_type}', expected one of {sorted(PROFILES)}")
+        return self.profiles[field_type]
+
+    def _submit(self, job):
+        self._queue.put((job.priority, next(self._sequence), job))
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job
+
+    def predict(self, image, conf=None, field_type=None):
+        """Detections for one BGR image. Returns (predictions, summary)."""
+        profile = self.profile(field_type)
+        conf = profile['conf'] if conf is None else conf
+        image = np.ascontiguousarray(image)
+        key = None
+        if self.cache_size:
+            key = (hashlib.blake2b(image, digest_size=16).digest(), image.shape, round(conf, 4), field_type)
+            with self._lock:
+                self.stats['requests'] += 1
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    self.stats['cache_hits'] += 1
+            if cached is not None:
+                predictions = copy.deepcopy(cached)
+                for pred in predictions:
+                    pred["detection_id"] = str(uuid.uuid4())
+                return predictions, summarize(predictions)
+        else:
+            with self._lock:
+                self.stats['requests'] += 1
+
+        predictions, summary = self._submit(_Job(image, conf, field_type)).result
+
+        if key is not None:
+            with self._lock:
+                self._cache[key] = copy.deepcopy(predictions)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return predictions, summary
+
+    def preview(self, image, conf=None, field_type=None, imgsz=None):
+        """Live preview of one BGR image at input size `imgsz`.
+
+        Queued ahead of full-quality requests, so it waits for at most the
+        pass already running, and not cached. Returns (summary, seconds of
+        the forward pass itself, without the wait).
+        """
+        profile = self.profile(field_type)
+        conf = profile['conf'] if conf is None else conf
+        job = self._submit(_Job(np.ascontiguousarray(image), conf, field_type, imgsz, PRIORITY_PREVIEW))
+        return job.result[1], job.seconds
+
+    def analyze(self, image, conf=None, skip_blank=True, microscope=None, field_type=None):
+        """The /api/predict response body for one BGR image.
+
+        `field_type` (lpf / hpf) selects the inference profile. With a
+        calibrated `microscope`, the image is colour-normalized and resized
+        to the profile's input size first (color_normalize.py).
+        """
+        profile = self.profile(field_type)
+        if blank_filter.ENABLED and skip_blank:
+            blank, screen = blank_filter.is_blank(image)
+            if blank:
+                return blank_filter.blank_response(screen)
+        scale = None
+        if microscope:
+            image, scale = color_normalize.preprocess(image, microscope, profile['imgsz'])
+        predictions, summary = self.predict(image, conf, field_type)
+        response = {
+            "success": True,
+            "predictions": color_normalize.rescale(predictions, scale) if scale else predictions,
+            "summary": summary
+        }
+        if microscope:
+            response["color_profile"] = microscope if scale else None
+        return response
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()[2]]
+            # A preview frame does not wait for the batch to fill up.
+            deadline = time.monotonic() + (self.max_wait if batch[0].priority != PRIORITY_PREVIEW else 0)
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining)[2])
+                except queue.Empty:
+                    break
+
+            groups = {}
+            for job in batch:
+                groups.setdefault((job.priority, job.profile, job.conf, job.imgsz), []).append(job)
+            # Preview groups first
+            for (_, field_type, conf, imgsz), jobs in sorted(groups.items(), key=lambda item: item[0][0]):
+                profile = self.profiles[field_type]
+                model = profile['model']
+                try:
+                    started = time.perf_counter()
+                    results = model([job.image for job in jobs], conf=conf, imgsz=imgsz or profile['imgsz'],
+                                    classes=profile['classes'], verbose=False)
+                    seconds = time.perf_counter() - started
+                    for job, result in zip(jobs, results):
+                        job.seconds = seconds
+                        job.result = format_result(result, model.names)
+                except Exception as e:
+                    for job in jobs:
+                        job.error = e
+                finally:
+                    for job in jobs:
+                        job.image = None
+                        job.done.set()
+                with self._lock:
+                    self.stats['batches'] += 1
+                    self.stats['batched_images'] += len(jobs)
+
+    def describe_profiles(self):
+        return {
+            field_type: {
+                'imgsz': profile['imgsz'],
+                'classes': [profile['model'].names[c] for c in profile['classes']] if profile['classes'] else None,
+                'conf': profile['conf'],
+                'separate_model': profile['model'] is not self.model,
+            }
+            for field_type, profile in self.profiles.items() if field_type is not None
+        }
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['cached'] = len(self._cache)
+        stats['mean_batch'] = round(stats['batched_images'] / stats['batches'], 2) if stats['batches'] else 0.0
+        return stats
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """The process-wide engine, loading the model on first use."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = InferenceEngine()
+        return _engine
@@ -0,0 +1,177 @@
+"""
+Live preview
+Coarse, low-latency detection for positioning the slide (before /get_samples
+and during /manual_move): the client streams small, downscaled frames over
+one WebSocket (/ws/preview) and gets per-class counts back for each frame
+the server gets to.
+
+- Latest frame wins: frames that arrive while the previous one is still
+  being analysed replace each other, and only the newest is run. A lagging
+  server therefore drops frames instead of building up a backlog, and every
+  reply describes what the camera sees now.
+- Preview runs on the shared engine of inference.py at PREVIEW_IMGSZ, so
+  it costs no second copy of the model in memory. Its frames jump ahead of
+  the engine's full-quality queue (waiting at most for the pass already
+  running) and are never cached. With PREVIEW_MODEL set (a smaller model
+  meant for preview), that model is loaded instead and run on the preview
+  thread, off the engine altogether.
+- Latency budget: when a frame's forward pass overruns PREVIEW_BUDGET_MS,
+  the input size steps down (to PREVIEW_MIN_IMGSZ at the lowest) and steps
+  back up once there is headroom again. Only model time counts, so a busy
+  /api/predict does not shrink the preview; `inference_ms` is that model
+  time and `latency_ms` the end-to-end time from frame arrival to reply.
+
+Protocol: binary messages are JPEG/PNG frames; a text message is JSON
+settings, e.g. {"field_type": "lpf", "conf": 0.3}. Each reply:
+
+    {"frame": 12, "by_class": {"eryth": 4}, "total_detections": 4,
+     "latency_ms": 41.2, "inference_ms": 28.0, "imgsz": 320, "dropped": 3}
+
+Tunable through environment variables:
+    PREVIEW_MODEL (default: the shared engine)   a separate, smaller model
+    PREVIEW_IMGSZ (default 320)
+    PREVIEW_MIN_IMGSZ (default 192)
+    PREVIEW_BUDGET_MS (default 150)
+    PREVIEW_MAX_KB (default 512)          largest accepted frame
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from starlette.websockets import WebSocketDisconnect
+
+import inference
+from inference import summarize
+
+PREVIEW_MODEL = os.environ.get('PREVIEW_MODEL')
+PREVIEW_IMGSZ = int(os.environ.get('PREVIEW_IMGSZ', '320'))
+MIN_IMGSZ = int(os.environ.get('PREVIEW_MIN_IMGSZ', '192'))
+BUDGET = float(os.environ.get('PREVIEW_BUDGET_MS', '150')) / 1000
+MAX_FRAME_BYTES = int(os.environ.get('PREVIEW_MAX_KB', '512')) * 1024
+
+# Input size step (YOLO strides are multiples of 32).
+IMGSZ_STEP = 32
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='preview')
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    """The PREVIEW_MODEL model, loaded on the first preview connection."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            from ultralytics import YOLO
+            _model = YOLO(PREVIEW_MODEL)
+            print(f"👁️ Preview model loaded from {PREVIEW_MODEL}")
+        return _model
+
+def class_subset(model, field_type):
+    """Class ids of a field type's profile (inference.PROFILES), None for all."""
+    return inference.class_ids(model.names, inference.PROFILES.get(field_type, {}).get('classes'))
+
+def count_frame(data, conf, imgsz, field_type):
+    """Decode a frame and count detections per class (preview thread).
+    Returns (summary, forward pass seconds)."""
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Not a readable image")
+    if not PREVIEW_MODEL:
+        return inference.get_engine().preview(image, conf, field_type, imgsz)
+    model = get_model()
+    started = time.perf_counter()
+    result = model(image, conf=conf, imgsz=imgsz, classes=class_subset(model, field_type), verbose=False)[0]
+    elapsed = time.perf_counter() - started
+    names = [model.names[int(c)] for c in result.boxes.cls.cpu().numpy()] if result.boxes is not None else []
+    return summarize([{"class": name} for name in names]), elapsed
+
+def next_imgsz(imgsz, elapsed):
+    """Step the input size down on a budget overrun, back up with headroom."""
+    if elapsed > BUDGET:
+        return max(MIN_IMGSZ, imgsz - IMGSZ_STEP)
+    if elapsed < BUDGET / 2:
+        return min(PREVIEW_IMGSZ, imgsz + IMGSZ_STEP)
+    return imgsz
+
+async def serve(websocket):
+    """Run one preview session until the client disconnects."""
+    await websocket.accept()
+    loop = asyncio.get_running_loop()
+    settings = {'conf': inference.DEFAULT_CONF, 'field_type': None}
+    imgsz = PREVIEW_IMGSZ
+    latest = None          # (frame number, arrival time, bytes) — the only queued frame
+    received = 0
+    dropped = 0
+    closed = False
+    wake = asyncio.Event()
+
+    async def receive():
+        nonlocal latest, received, dropped, closed
+        try:
+            while True:
+                message = await websocket.receive()
+                if message['type'] == 'websocket.disconnect':
+                    break
+                if message.get('bytes') is not None:
+                    received += 1
+                    if len(message['bytes']) > MAX_FRAME_BYTES:
+                        dropped += 1
+                        continue
+                    if latest is not None:
+                        dropped += 1
+                    latest = (received, time.perf_counter(), message['bytes'])
+                elif message.get('text'):
+                    try:
+                        update = json.loads(message['text'])
+                        if 'field_type' in update and (update['field_type'] is None
+                                                       or update['field_type'] in inference.PROFILES):
+                            settings['field_type'] = update['field_type']
+                            settings['conf'] = inference.PROFILES.get(update['field_type'], {}).get(
+                                'conf', inference.DEFAULT_CONF)
+                        if update.get('conf') is not None:
+                            settings['conf'] = float(update['conf'])
+                    except (ValueError, TypeError, AttributeError):
+                        pass
+                    continue
+                wake.set()
+        finally:
+            closed = True
+            wake.set()
+
+    receiver = asyncio.create_task(receive())
+    try:
+        while True:
+            await wake.wait()
+            wake.clear()
+            if closed:
+                break
+            if latest is None:
+                continue
+            number, arrived, data = latest
+            latest = None
+            try:
+                summary, elapsed = await loop.run_in_executor(
+                    _executor, count_frame, data, settings['conf'], imgsz, settings['field_type'])
+            except Exception as e:
+                # Report it and keep the session: the next frame may well work.
+                if closed:
+                    break
+                await websocket.send_json({"frame": number, "error": str(e)})
+                continue
+            reply = dict(summary, frame=number, imgsz=imgsz, dropped=dropped,
+                         latency_ms=round((time.perf_counter() - arrived) * 1000, 1),
+                         inference_ms=round(elapsed * 1000, 1))
+            imgsz = next_imgsz(imgsz, elapsed)
+            if closed:
+                break
+            await websocket.send_json(reply)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
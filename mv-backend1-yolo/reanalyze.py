@@ -0,0 +1,308 @@
+"""
+Bulk re-analysis of archived scan images
+Re-runs detection over a directory tree or manifest of stored LPF/HPF images
+(e.g. after deploying a new best.pt) without going through /api/predict one
+image at a time.
+
+Each worker process runs a small pipeline over its share of the images:
+
+    decode pool (threads, prefetching) ──▶ batched inference ──▶ writer thread
+
+so JPEG decoding, the forward pass and result writing overlap, and several
+worker processes split the CPU cores between them (torch threads per process
+= cores / workers). Results are appended as JSON lines, one file per worker,
+in the /api/predict response format plus the image path:
+
+    out/results-<worker>.jsonl
+    out/summary.json            totals, throughput
+
+Images already in a results file are skipped, so an interrupted run resumes
+where it stopped — just run the same command again.
+
+Each image is analysed with the inference profile of its field type
+(inference.PROFILES: input size, class subset, confidence, model), taken
+from a manifest's "field_type" or "sample" key, or from an lpf_N / hpf_N
+sample name in the file name. Images of neither type use the plain model.
+
+    python reanalyze.py /data/scans --out reanalysis/2024-06-best
+    python reanalyze.py manifest.txt --model best.pt --workers 4 --batch 8
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+import blank_filter
+from inference import DEFAULT_CONF, PROFILES, InferenceEngine, class_ids, format_result
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+PROGRESS_INTERVAL = 10.0  # seconds between throughput reports
+
+# Sample names as the motor server gives them: lpf_3, hpf_12.
+SAMPLE_NAME = re.compile(r'(?<![a-z])(lpf|hpf)_\d+')
+
+# ---------------------------------------------------------------------------
+# Inputs and checkpoint
+# ---------------------------------------------------------------------------
+
+def field_type_of(name):
+    """'lpf' / 'hpf' from a sample name in `name`, None if there is none."""
+    match = SAMPLE_NAME.search(os.path.basename(name).lower())
+    return match.group(1) if match else None
+
+def list_images(source):
+    """(path, field type) of the images in a directory (recursive) or a manifest file.
+
+    A manifest holds one path per line, or JSON lines with an "image" or
+    "path" key and optionally "field_type" or "sample"; relative paths are
+    taken relative to the manifest.
+    """
+    if os.path.isdir(source):
+        paths = glob.glob(os.path.join(source, '**', '*'), recursive=True)
+        return sorted((p, field_type_of(p)) for p in paths if p.lower().endswith(IMAGE_EXTENSIONS))
+    base = os.path.dirname(os.path.abspath(source))
+    images = []
+    with open(source) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            field_type = None
+            if line.startswith('{'):
+                record = json.loads(line)
+                line = record.get('image') or record.get('path')
+                field_type = str(record.get('field_type') or '').lower() or field_type_of(record.get('sample') or '')
+            if field_type not in PROFILES:
+                field_type = field_type_of(line)
+            images.append((os.path.join(base, line), field_type))
+    return images
+
+def load_done(out_dir):
+    """Images already written by an earlier run (its checkpoint).
+
+    A last line cut short by a crash is removed, so that image is redone and
+    new results are appended on a line of their own.
+    """
+    done = set()
+    for path in glob.glob(os.path.join(out_dir, 'results-*.jsonl')):
+        with open(path, 'rb+') as f:
+            data = f.read()
+            complete = data.rfind(b'\n') + 1
+            if complete < len(data):
+                f.truncate(complete)
+        for line in data[:complete].splitlines():
+            try:
+                done.add(json.loads(line)['image'])
+            except (ValueError, KeyError):
+                pass
+    return done
+
+# ---------------------------------------------------------------------------
+# Worker pipeline
+# ---------------------------------------------------------------------------
+
+def decode(path):
+    image = cv2.imread(path)
+    if image is None:
+        raise ValueError("not a readable image")
+    return image
+
+def run_worker(index, paths, args, counter):
+    """Process `paths`, appending to results-<index>.jsonl."""
+    import torch
+    from ultralytics import YOLO
+
+    torch.set_num_threads(args.threads)
+    models = {}
+
+    def load(path):
+        if path not in models:
+            models[path] = YOLO(path)
+        return models[path]
+
+    # Resolved profiles as in InferenceEngine; None is the plain model.
+    model = load(args.model)
+    profiles = {None: {'model': model, 'imgsz': InferenceEngine._input_size(model), 'classes': None, 'conf': DEFAULT_CONF}}
+    for field_type, settings in PROFILES.items():
+        profile_model = load(settings['model']) if settings['model'] else model
+        profiles[field_type] = {
+            'model': profile_model,
+            'imgsz': settings['imgsz'] or InferenceEngine._input_size(profile_model),
+            'classes': class_ids(profile_model.names, settings['classes']),
+            'conf': settings['conf'],
+        }
+    out_path = os.path.join(args.out, f"results-{index}.jsonl")
+    timings = {'decode_wait': 0.0, 'inference': 0.0}
+    lines = queue.Queue(maxsize=args.batch * 4)
+
+    def writer():
+        with open(out_path, 'a') as f:
+            while True:
+                batch = lines.get()
+                if batch is None:
+                    break
+                f.write(''.join(json.dumps(record) + '\n' for record in batch))
+                f.flush()
+                with counter.get_lock():
+                    counter.value += len(batch)
+
+    writer_thread = threading.Thread(target=writer, daemon=True)
+    writer_thread.start()
+
+    def flush(batch):
+        records = []
+        groups = {}
+        for (path, field_type), image, error in batch:
+            if error is not None:
+                records.append({"image": path, "field_type": field_type, "success": False, "error": error})
+                continue
+            if args.skip_blank:
+                blank, screen = blank_filter.is_blank(image)
+                if blank:
+                    records.append(dict(blank_filter.blank_response(screen), image=path, field_type=field_type))
+                    continue
+            groups.setdefault(field_type, []).append((path, image))
+        # One forward pass per field type, each with its own profile.
+        for field_type, images in groups.items():
+            profile = profiles[field_type]
+            started = time.perf_counter()
+            results = profile['model']([image for _, image in images],
+                                       conf=profile['conf'] if args.conf is None else args.conf,
+                                       imgsz=profile['imgsz'], classes=profile['classes'], verbose=False)
+            timings['inference'] += time.perf_counter() - started
+            for (path, _), result in zip(images, results):
+                predictions, summary = format_result(result, profile['model'].names)
+                records.append({"image": path, "field_type": field_type, "success": True,
+                                "predictions": predictions, "summary": summary})
+        lines.put(records)
+
+    with ThreadPoolExecutor(max_workers=args.decoders) as pool:
+        pending = deque()
+        remaining = iter(paths)
+        batch = []
+        while True:
+            # Keep the decode pool a few batches ahead of inference.
+            while len(pending) < args.batch * args.prefetch:
+                item = next(remaining, None)
+                if item is None:
+                    break
+                pending.append((item, pool.submit(decode, item[0])))
+            if not pending:
+                break
+            item, future = pending.popleft()
+            started = time.perf_counter()
+            try:
+                batch.append((item, future.result(), None))
+            except Exception as e:
+                batch.append((item, None, str(e)))
+            timings['decode_wait'] += time.perf_counter() - started
+            if len(batch) >= args.batch:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+
+    lines.put(None)
+    writer_thread.join()
+    return timings
+
+def _worker_entry(index, paths, args, counter, results):
+    results.put((index, run_worker(index, paths, args, counter)))
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+def parse_args():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help='image directory or manifest file')
+    parser.add_argument('--out', default='reanalysis', help='output directory (also the resume checkpoint)')
+    parser.add_argument('--model', default='best.pt')
+    parser.add_argument('--conf', type=float, default=None,
+                        help="confidence threshold (default: the field type's profile)")
+    parser.add_argument('--batch', type=int, default=8, help='images per forward pass')
+    parser.add_argument('--workers', type=int, default=max(1, min(4, cores // 2)),
+                        help='inference processes (the cores are split between them)')
+    parser.add_argument('--decoders', type=int, default=2, help='decode threads per worker')
+    parser.add_argument('--prefetch', type=int, default=3, help='batches decoded ahead per worker')
+    parser.add_argument('--skip-blank', action='store_true', help='apply the blank-field pre-filter')
+    args = parser.parse_args()
+    args.threads = max(1, cores // args.workers)
+    return args
+
+def main():
+    args = parse_args()
+    os.makedirs(args.out, exist_ok=True)
+    paths = list_images(args.source)
+    done = load_done(args.out)
+    todo = [(p, field_type) for p, field_type in paths if p not in done]
+    print(f"📂 {len(paths)} images, {len(paths) - len(todo)} already done, {len(todo)} to process")
+    if not todo:
+        return 0
+    print(f"🚀 {args.workers} workers x {args.threads} threads, batch {args.batch}")
+
+    ctx = multiprocessing.get_context('spawn')
+    counter = ctx.Value('l', 0)
+    results = ctx.Queue()
+    # Round-robin split, so every worker gets a mix of LPF and HPF images.
+    workers = [ctx.Process(target=_worker_entry, args=(i, todo[i::args.workers], args, counter, results))
+               for i in range(args.workers)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+
+    last = started
+    while any(worker.is_alive() for worker in workers):
+        time.sleep(0.5)
+        now = time.perf_counter()
+        if now - last >= PROGRESS_INTERVAL:
+            last = now
+            processed = counter.value
+            rate = processed / (now - started)
+            eta = (len(todo) - processed) / rate if rate else float('inf')
+            print(f"⏱️  {processed}/{len(todo)} images, {rate:.1f} img/s, ETA {eta / 60:.1f} min")
+    timings = {}
+    for _ in range(sum(1 for worker in workers if worker.exitcode == 0)):
+        try:
+            index, worker_timings = results.get(timeout=5)
+        except queue.Empty:
+            break
+        timings[index] = {k: round(v, 2) for k, v in worker_timings.items()}
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    summary = {
+        'source': args.source,
+        'model': args.model,
+        'images': len(paths),
+        'processed': counter.value,
+        'skipped_done': len(paths) - len(todo),
+        'seconds': round(elapsed, 2),
+        'images_per_second': round(counter.value / elapsed, 2) if elapsed else 0.0,
+        'workers': args.workers,
+        'threads_per_worker': args.threads,
+        'batch': args.batch,
+        'worker_timings': timings,
+    }
+    with open(os.path.join(args.out, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"✅ {counter.value} images in {elapsed:.1f}s ({summary['images_per_second']} img/s)")
+    failed = [w.exitcode for w in workers if w.exitcode]
+    if failed:
+        print(f"❌ {len(failed)} worker(s) failed — rerun to resume")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
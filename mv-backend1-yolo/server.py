@@ -0,0 +1,19 @@
+"""
+Combined server: the FastAPI API and the Gradio UI in one process
+Both front-ends go through the same inference engine (inference.py), so the
+Space holds one model in memory and warms it up once.
+
+    /api/predict, /health, /    API (app_fastapi.py)
+    /ui                         Gradio UI (app.py)
+"""
+
+import gradio as gr
+
+from app import demo
+from app_fastapi import app
+
+app = gr.mount_gradio_app(app, demo, path="/ui")
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=7860)
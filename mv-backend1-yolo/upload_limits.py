@@ -0,0 +1,227 @@
+"""
+Upload limits
+Keeps the memory an /api/predict request can take bounded, whatever the
+image size or the number of clients uploading at once.
+
+- UploadLimitMiddleware counts request body bytes as they arrive and answers
+  413 as soon as an upload passes MAX_UPLOAD_MB (Content-Length is checked
+  up front when the client sends one). Starlette spools the file part to a
+  SpooledTemporaryFile — in memory up to 1 MB, on disk beyond — so the raw
+  upload never sits in memory as a whole.
+- image_size() reads only the image header, so the cost of decoding is
+  known before any pixels are decoded.
+- decode() hands OpenCV the spooled file itself (its in-memory buffer, or a
+  read-only mmap of the temp file) and decodes into a single BGR array —
+  no bytes copy, no PIL image, no RGB conversion copy. File objects without
+  either are read once instead.
+- MemoryBudget admits a decode only while the decoded images in flight fit
+  in DECODE_BUDGET_MB; other requests wait their turn.
+
+Tunable through environment variables:
+    MAX_UPLOAD_MB (default 20)       largest accepted request body
+    MAX_IMAGE_PIXELS (default 50e6)  largest accepted width x height
+    DECODE_BUDGET_MB (default 512)   decoded image memory shared by requests
+"""
+
+import asyncio
+import io
+import mmap
+import os
+from contextlib import asynccontextmanager
+
+import cv2
+import numpy as np
+from PIL import Image
+
+MAX_UPLOAD_BYTES = int(float(os.environ.get('MAX_UPLOAD_MB', '20')) * 1024 * 1024)
+MAX_IMAGE_PIXELS = int(float(os.environ.get('MAX_IMAGE_PIXELS', '50e6')))
+DECODE_BUDGET_BYTES = int(float(os.environ.get('DECODE_BUDGET_MB', '512')) * 1024 * 1024)
+
+# Paths whose request bodies are limited.
+LIMITED_PATHS = ('/api/predict', '/api/color/calibrate')
+
+# Decoded BGR image plus what the model allocates per image on top of it
+# (letterboxed 640x640 float input tensor and activations, roughly).
+BYTES_PER_PIXEL = 3
+INFERENCE_OVERHEAD_BYTES = 32 * 1024 * 1024
+
+# Color and orientation as the previous PIL path produced them: 3 channels,
+# EXIF orientation not applied.
+DECODE_FLAGS = cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+
+class UploadTooLarge(Exception):
+    pass
+
+class ImageTooLarge(ValueError):
+    pass
+
+# ---------------------------------------------------------------------------
+# Request body limit
+# ---------------------------------------------------------------------------
+
+class UploadLimitMiddleware:
+    """ASGI middleware rejecting request bodies over `max_bytes` with 413."""
+
+    def __init__(self, app, max_bytes=MAX_UPLOAD_BYTES, paths=LIMITED_PATHS):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope['headers']:
+            if name == b'content-length' and value.isdigit() and int(value) > self.max_bytes:
+                await self.reject(send)
+                return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise UploadTooLarge()
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            # The app may turn the aborted read into its own error response
+            # (FastAPI answers 400 for a body it could not parse); drop it.
+            if exceeded and not started:
+                return
+            if message['type'] == 'http.response.start':
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except UploadTooLarge:
+            if started:
+                raise
+        if exceeded and not started:
+            await self.reject(send)
+
+    async def reject(self, send):
+        body = f'{{"detail":"Upload exceeds {self.max_bytes // (1024 * 1024)} MB"}}'.encode()
+        await send({
+            'type': 'http.response.start',
+            'status': 413,
+            'headers': [(b'content-type', b'application/json'),
+                        (b'content-length', str(len(body)).encode()),
+                        (b'connection', b'close')],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+# ---------------------------------------------------------------------------
+# Decoding from the spooled file
+# ---------------------------------------------------------------------------
+
+def image_size(file):
+    """(width, height) from the image header, without decoding pixels."""
+    file.seek(0)
+    try:
+        with Image.open(file) as header:
+            width, height = header.size
+    except Exception as e:
+        raise ValueError("Not a readable image") from e
+    finally:
+        file.seek(0)
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ImageTooLarge(f"Image is {width}x{height}, above {MAX_IMAGE_PIXELS} pixels")
+    return width, height
+
+def decoded_bytes(width, height):
+    """Memory a request holds while its image is decoded and inferred."""
+    return width * height * BYTES_PER_PIXEL + INFERENCE_OVERHEAD_BYTES
+
+def _file_descriptor(file):
+    """The file's OS-level descriptor, or None if it has none."""
+    try:
+        return file.fileno()
+    except (AttributeError, OSError, ValueError):  # io.UnsupportedOperation is both
+        return None
+
+def decode(file):
+    """Decode an uploaded (spooled) file into a BGR numpy array.
+
+    The spooled file's in-memory buffer (CPython keeps it in the `_file`
+    attribute until it rolls over to disk) is decoded in place; a file on
+    disk is memory-mapped. Anything else is read through the public file
+    interface, which costs one bytes copy.
+    """
+    spooled = getattr(file, '_file', None)
+    fd = None if isinstance(spooled, io.BytesIO) else _file_descriptor(spooled or file)
+    if isinstance(spooled, io.BytesIO):
+        with spooled.getbuffer() as buffer:
+            image = cv2.imdecode(np.frombuffer(buffer, np.uint8), DECODE_FLAGS)
+    elif fd is not None:
+        file.flush()
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as buffer:
+            image = cv2.imdecode(np.frombuffer(buffer, np.uint8), DECODE_FLAGS)
+    else:
+        file.seek(0)
+        image = cv2.imdecode(np.frombuffer(file.read(), np.uint8), DECODE_FLAGS)
+    if image is None:
+        raise ValueError("Not a readable image")
+    return image
+
+# ---------------------------------------------------------------------------
+# Decode memory budget
+# ---------------------------------------------------------------------------
+
+class MemoryBudget:
+    """Counting semaphore over bytes: `async with budget.reserve(n)` waits
+    until n bytes fit next to the reservations already held. Admission is
+    first come, first served, so a large image is not starved by small ones."""
+
+    def __init__(self, capacity=DECODE_BUDGET_BYTES):
+        self.capacity = capacity
+        self.in_use = 0
+        self.peak = 0
+        self.waiting = 0
+        self._condition = None
+        self._queue = []
+
+    @asynccontextmanager
+    async def reserve(self, nbytes):
+        if nbytes > self.capacity:
+            raise ImageTooLarge(f"Image needs {nbytes // (1024 * 1024)} MB to decode, "
+                                f"budget is {self.capacity // (1024 * 1024)} MB")
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        ticket = object()
+        async with self._condition:
+            self._queue.append(ticket)
+            self.waiting += 1
+            try:
+                await self._condition.wait_for(
+                    lambda: self._queue[0] is ticket and self.in_use + nbytes <= self.capacity)
+            finally:
+                self.waiting -= 1
+                self._queue.remove(ticket)
+                self._condition.notify_all()
+            self.in_use += nbytes
+            self.peak = max(self.peak, self.in_use)
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_use -= nbytes
+                self._condition.notify_all()
+
+    def get_stats(self):
+        return {
+            'budget_mb': round(self.capacity / (1024 * 1024), 1),
+            'in_use_mb': round(self.in_use / (1024 * 1024), 1),
+            'peak_mb': round(self.peak / (1024 * 1024), 1),
+            'waiting': self.waiting,
+            'max_upload_mb': round(MAX_UPLOAD_BYTES / (1024 * 1024), 1),
+        }
@@ -0,0 +1,119 @@
+"""
+Adaptive Scan
+Decides when a pass has seen enough fields, from the per-field YOLO counts
+(`summary.by_class` of /api/predict) posted back to /field_result.
+
+Counts are summed into the report's buckets (casts /LPF, RBC /HPF, ...) and
+each bucket's mean per field gets a confidence interval:
+
+    mean ± z * sqrt(max(variance, mean) / n)
+
+(the variance is floored at the Poisson value, so a few identical fields do
+not look certain), with an upper end of at least -ln(1 - confidence) / n —
+the Poisson bound for seeing nothing in n fields — so an empty slide still
+needs a few fields before it counts as negative.
+
+A bucket has converged once its whole interval falls inside one reporting
+range; the pass may stop early when every bucket has. A pass that reaches
+its planned end with a bucket still straddling a range boundary is
+borderline and is extended field by field, up to a budget.
+
+Results arrive a field or two behind the stage (detection runs while the
+stage moves on), so decisions are made on the fields analysed so far.
+"""
+
+import math
+import threading
+from bisect import bisect_left
+from statistics import NormalDist, fmean, variance
+
+# Reporting buckets per objective: YOLO class-name prefixes (as mapped in
+# src/app/report/page.tsx) and the per-field range boundaries of
+# src/data/strasinger-reference.ts. Qualitative buckets (yeast, mucus) have
+# no numeric ranges and do not take part.
+REPORTING_BUCKETS = {
+    'lpf': {
+        'casts': (('cast',), (2, 5, 10)),
+        'squamous_epithelial': (('epith',), (5, 20, 100)),
+        'abnormal_crystals': (('cryst',), (2, 5, 20)),
+    },
+    'hpf': {
+        'rbc': (('eryth', 'rbc'), (2, 5, 10, 25, 50, 100)),
+        'wbc': (('leuko', 'wbc'), (2, 5, 10, 25, 50, 100)),
+        'epithelial_cells': (('epith',), (5, 20, 100)),
+        'crystals': (('cryst',), (2, 5, 20)),
+    },
+}
+
+DEFAULT_ADAPTIVE = {
+    'enabled': False,
+    'confidence': 0.95,
+    'min_fields': 4,         # never stop a pass before this many analysed fields
+    'max_extra_fields': 5,   # fields a borderline pass may add beyond its plan
+}
+
+def bucket_counts(field_type, by_class):
+    """Per-bucket counts for one field from a YOLO by_class summary."""
+    counts = {bucket: 0 for bucket in REPORTING_BUCKETS[field_type]}
+    for name, count in (by_class or {}).items():
+        name = name.lower()
+        for bucket, (prefixes, _) in REPORTING_BUCKETS[field_type].items():
+            if name.startswith(prefixes):
+                counts[bucket] += int(count)
+                break
+    return counts
+
+def range_label(thresholds, index):
+    """Report range for bucket index `index`, e.g. '0-2', '2-5', '>10'."""
+    if index >= len(thresholds):
+        return f">{thresholds[-1]}"
+    low = thresholds[index - 1] if index else 0
+    return f"{low}-{thresholds[index]}"
+
+class PassEstimate:
+    """Per-field bucket counts for one objective's pass."""
+
+    def __init__(self, field_type, fields=None):
+        self.field_type = field_type
+        self.lock = threading.Lock()
+        # sample index -> {bucket: count}; keyed so a re-sent result is not counted twice
+        self.fields = {int(k): v for k, v in (fields or {}).items()}
+
+    def record(self, index, by_class):
+        with self.lock:
+            self.fields[index] = bucket_counts(self.field_type, by_class)
+
+    @property
+    def analysed(self):
+        with self.lock:
+            return len(self.fields)
+
+    def estimate(self, confidence):
+        """Interval and reporting range of every bucket's mean count per field."""
+        with self.lock:
+            fields = list(self.fields.values())
+        n = len(fields)
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        zero_bound = -math.log(1 - confidence) / n if n else math.inf
+        buckets = {}
+        for bucket, (_, thresholds) in REPORTING_BUCKETS[self.field_type].items():
+            counts = [field[bucket] for field in fields]
+            mean = fmean(counts) if counts else 0.0
+            spread = max(variance(counts) if n > 1 else 0.0, mean)
+            half = z * math.sqrt(spread / n) if n else math.inf
+            low, high = max(0.0, mean - half), max(mean + half, zero_bound)
+            low_index = bisect_left(thresholds, low)
+            high_index = bisect_left(thresholds, high)
+            buckets[bucket] = {
+                'mean': round(mean, 3),
+                'low': round(low, 3),
+                'high': round(high, 3) if n else None,
+                'range': range_label(thresholds, bisect_left(thresholds, mean)),
+                'converged': n > 0 and low_index == high_index,
+            }
+        return {'fields': n, 'buckets': buckets}
+
+    def converged(self, confidence, min_fields):
+        if self.analysed < min_fields:
+            return False
+        return all(b['converged'] for b in self.estimate(confidence)['buckets'].values())
@@ -0,0 +1,124 @@
+"""
+Autofocus
+Finds the sharpest focus (Z) position for the current field by stepping the
+focus motor and scoring camera frames.
+
+- focus_score(): sharpness of a frame, measured on a downscaled grayscale
+  copy so one score costs a resize and two vectorized filter passes:
+      laplacian — variance of the Laplacian
+      tenengrad — mean squared Sobel gradient magnitude
+- autofocus(): coarse-to-fine hill climb. It steps `coarse_step` in the
+  direction that improves the score until the score drops, then halves the
+  step around the best position until it falls below `min_step`.
+  Neighbouring fields sit at almost the same height, so a field that is
+  already close to focus costs a handful of moves instead of a full sweep.
+"""
+
+import logging
+import time
+
+try:
+    import cv2
+    import numpy as np
+    CV2_AVAILABLE = True
+except ImportError:
+    cv2 = None
+    np = None
+    CV2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+FOCUS_METHODS = ('laplacian', 'tenengrad')
+
+# Frame size the score is computed on. Large enough to keep cell edges,
+# small enough that scoring never outlasts the focus move itself.
+FOCUS_SIZE = (320, 240)
+
+# Frames read and thrown away after each focus move, so the scored frame was
+# exposed after the move finished.
+STALE_FRAMES = 1
+
+DEFAULT_AUTOFOCUS = {
+    'enabled': False,
+    'camera': 0,
+    'method': 'laplacian',
+    'coarse_step': 40,   # focus motor steps
+    'min_step': 5,
+    'range': 200,        # max steps either side of the power-on focus position
+}
+
+def focus_score(frame, method='laplacian'):
+    """Sharpness of a BGR (or gray) frame; higher is sharper."""
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    gray = cv2.resize(frame, FOCUS_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+    if method == 'tenengrad':
+        gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
+        gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+        return float(np.mean(gx * gx + gy * gy))
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+def autofocus(camera, move_focus, coarse_step, min_step, low, high, method='laplacian'):
+    """Hill-climb the focus motor to the sharpest position.
+
+    `move_focus(dz)` moves the focus motor by dz steps and returns True on
+    success. The search stays within [low, high] steps of where it started.
+    Returns a dict with the best `score`, its `offset` from the start, the
+    number of focus `moves` and scored `frames`, and `elapsed` seconds — or
+    None if the camera or the focus motor failed (the motor is then left
+    wherever the last successful move put it).
+    """
+    started = time.perf_counter()
+    position = 0
+    moves = 0
+    scores = {}
+
+    def score_at(offset):
+        nonlocal position, moves
+        if offset in scores:
+            return scores[offset]
+        if offset != position:
+            if not move_focus(offset - position):
+                raise RuntimeError(f"focus move to {offset:+d} failed")
+            moves += 1
+            position = offset
+        for _ in range(STALE_FRAMES):
+            camera.read()
+        frame = camera.read()
+        if frame is None:
+            raise RuntimeError("camera returned no frame")
+        scores[offset] = focus_score(frame, method)
+        return scores[offset]
+
+    try:
+        best = 0
+        score_at(best)
+        step = coarse_step
+        while step >= min_step:
+            for direction in (1, -1):
+                climbed = False
+                while low <= best + direction * step <= high:
+                    candidate = best + direction * step
+                    if score_at(candidate) <= scores[best]:
+                        break
+                    best = candidate
+                    climbed = True
+                if climbed:
+                    # Came from the other side, which is known to be worse.
+                    break
+            step //= 2
+        if position != best:
+            if not move_focus(best - position):
+                raise RuntimeError(f"focus move to {best:+d} failed")
+            moves += 1
+    except RuntimeError as e:
+        logger.warning(f"Autofocus aborted: {e}")
+        return None
+
+    return {
+        'score': scores[best],
+        'offset': best,
+        'moves': moves,
+        'frames': len(scores),
+        'elapsed': time.perf_counter() - started,
+    }
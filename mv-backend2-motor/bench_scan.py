@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Scan Throughput Benchmark
+Runs complete LPF + HPF scans through the real Flask routes of
+motor_server.py (laptop or Raspberry Pi edition) against the simulated
+stage (stage_sim.py) and reports the
+end-to-end scan cycle time, per-route latency and per-command latency.
+No hardware needed, so it can run on CI.
+
+    python bench_scan.py                          # real-time firmware timing
+    python bench_scan.py --time-scale 0.05 --runs 5
+    python bench_scan.py --max-scan-seconds 45    # exit 1 on regression
+    python bench_scan.py --json bench.json
+    python bench_scan.py --error-rate 0.2 --max-retries 5
+    python bench_scan.py --edition rasp
+
+Simulated motion and settle delays are multiplied by --time-scale. Reported
+times are wall-clock, so with a scale below 1 they show the server and
+serial overhead on a proportionally faster stage.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'mean': round(sum(values) / len(values), 4) if values else 0.0,
+        'p50': round(percentile(values, 50), 4),
+        'p95': round(percentile(values, 95), 4),
+        'max': round(max(values), 4) if values else 0.0,
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--edition', choices=['laptop', 'rasp'], default='laptop', help='which motor server to drive')
+    parser.add_argument('--runs', type=int, default=1, help='number of full scans')
+    parser.add_argument('--time-scale', type=float, default=1.0, help='simulated delay multiplier')
+    parser.add_argument('--settle-ms', type=float, default=None, help='simulated settle time per move')
+    parser.add_argument('--steps-per-sec', type=float, default=None, help='simulated motor speed')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of moves answering ERROR')
+    parser.add_argument('--max-retries', type=int, default=3, help='resumable failures in a row before a run is abandoned')
+    parser.add_argument('--capture-ms', type=float, default=0.0, help='simulated camera capture per field')
+    parser.add_argument('--max-scan-seconds', type=float, default=None, help='fail if mean scan time exceeds this')
+    parser.add_argument('--json', help='write results to this file')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    # Configure the simulated stage before the server module reads it.
+    os.environ['MOTOR_STAGE_BACKEND'] = 'sim'
+    os.environ['MOTOR_SIM_TIME_SCALE'] = str(args.time_scale)
+    os.environ['MOTOR_SIM_ERROR_RATE'] = str(args.error_rate)
+    if args.settle_ms is not None:
+        os.environ['MOTOR_SIM_SETTLE_MS'] = str(args.settle_ms)
+    if args.steps_per_sec is not None:
+        os.environ['MOTOR_SIM_STEPS_PER_SEC'] = str(args.steps_per_sec)
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    server_dir = here if args.edition == 'laptop' else os.path.join(here, '..', 'mv-backend2-motor-rasp')
+    os.chdir(server_dir)
+    sys.path.insert(0, here)
+    sys.path.insert(0, server_dir)
+    import logging
+    import motor_server
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    # Time every serial command, keyed by its verb (MOVE, HOME, ...).
+    command_times = defaultdict(list)
+    driver = motor_server.controller.driver
+    send_command = driver.send_command
+
+    def timed_send_command(command, timeout=None):
+        start = time.perf_counter()
+        try:
+            return send_command(command, timeout)
+        finally:
+            command_times[command.split()[0]].append(time.perf_counter() - start)
+
+    driver.send_command = timed_send_command
+
+    client = motor_server.app.test_client()
+    route_times = defaultdict(list)
+
+    def call(route, method='post'):
+        start = time.perf_counter()
+        response = getattr(client, method)(route)
+        route_times[route].append(time.perf_counter() - start)
+        return response.status_code, response.get_json(silent=True) or {}
+
+    capture = args.capture_ms / 1000.0 * args.time_scale
+    scan_times, fields, failures, failed_runs = [], 0, 0, 0
+
+    for run in range(args.runs):
+        started = time.perf_counter()
+        code, data = call('/get_samples')
+        if code != 200:
+            print(f"run {run + 1}: /get_samples failed ({code}): {data.get('message')}")
+            return 2
+        fields += 1
+        retries = 0
+        while True:
+            time.sleep(capture)
+            call('/status', 'get')
+            code, data = call('/next_sample')
+            status = data.get('status')
+            if status == 'success':
+                fields += 1
+                retries = 0
+            elif status == 'switch_objective':
+                code, data = call('/continue_after_switch')
+                if data.get('status') != 'success':
+                    failures += 1
+                    failed_runs += 1
+                    break
+                fields += 1
+                retries = 0
+            elif status == 'complete':
+                break
+            else:
+                failures += 1
+                retries += 1
+                if not data.get('resumable') or retries > args.max_retries:
+                    print(f"run {run + 1}: abandoned after {retries} failure(s) in a row ({code}): {data.get('message')}")
+                    failed_runs += 1
+                    break
+        scan_times.append(time.perf_counter() - started)
+        call('/stop')
+
+    mean_scan = sum(scan_times) / len(scan_times)
+    results = {
+        'runs': args.runs,
+        'time_scale': args.time_scale,
+        'fields': fields,
+        'failures': failures,
+        'failed_runs': failed_runs,
+        'scan_seconds': summarize(scan_times),
+        'fields_per_minute': round(fields / sum(scan_times) * 60, 2) if scan_times else 0.0,
+        'routes': {route: summarize(v) for route, v in sorted(route_times.items())},
+        'commands': {cmd: summarize(v) for cmd, v in sorted(command_times.items())},
+    }
+
+    print(f"Scans: {args.runs}  fields: {fields}  failures: {failures}  failed runs: {failed_runs}")
+    print(f"Scan cycle: mean {mean_scan:.2f}s  ({results['fields_per_minute']} fields/min)")
+    for title, table in (('Route', results['routes']), ('Command', results['commands'])):
+        print(f"\n{title:<24}{'n':>6}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+        for name, stats in table.items():
+            print(f"{name:<24}{stats['count']:>6}{stats['mean']:>10.3f}{stats['p50']:>10.3f}"
+                  f"{stats['p95']:>10.3f}{stats['max']:>10.3f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    if failed_runs:
+        print(f"\nFAIL: {failed_runs} of {args.runs} scan(s) did not complete")
+        return 1
+    if args.max_scan_seconds is not None and mean_scan > args.max_scan_seconds:
+        print(f"\nFAIL: mean scan {mean_scan:.2f}s exceeds {args.max_scan_seconds}s")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
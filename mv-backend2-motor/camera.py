@@ -0,0 +1,128 @@
+"""
+Camera Sources
+Frame sources the motor-side services read the microscope camera through.
+
+    OpenCVCamera      — a live camera via cv2.VideoCapture (index or URL)
+    FileReplayCamera  — replays image files from a directory or list; a
+                        stand-in for tests, benchmarks and re-runs
+
+Both expose open() / read() / close(); read() returns a BGR numpy frame or
+None. open_camera() builds one from a config value: an int (device index),
+a "file:<dir or glob>" spec, or any other string (stream URL / device path).
+shared_camera() does the same but hands every caller in the process the same
+open camera, so the settle watcher and autofocus never fight over a device.
+
+OpenCV is optional for the motor server; without it no camera is opened.
+"""
+
+import glob
+import logging
+import os
+import threading
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    cv2 = None
+    CV2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+class OpenCVCamera:
+    """A live camera read through cv2.VideoCapture."""
+
+    def __init__(self, source=0, width=None, height=None):
+        self.source = source
+        self.width = width
+        self.height = height
+        self.capture = None
+
+    def open(self):
+        if not CV2_AVAILABLE:
+            logger.warning("OpenCV not installed — camera unavailable")
+            return False
+        self.capture = cv2.VideoCapture(self.source)
+        if not self.capture.isOpened():
+            logger.warning(f"Could not open camera {self.source}")
+            self.capture = None
+            return False
+        # Keep the driver queue short so read() returns a current frame,
+        # not one captured while the stage was still moving.
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        if self.width and self.height:
+            self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        logger.info(f"Camera {self.source} opened")
+        return True
+
+    def read(self):
+        if self.capture is None:
+            return None
+        ok, frame = self.capture.read()
+        return frame if ok else None
+
+    def close(self):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+class FileReplayCamera:
+    """Replays image files in name order, looping by default."""
+
+    def __init__(self, paths, loop=True):
+        if isinstance(paths, str):
+            pattern = paths
+            if os.path.isdir(paths):
+                pattern = os.path.join(paths, '*')
+            paths = sorted(p for p in glob.glob(pattern) if p.lower().endswith(IMAGE_EXTENSIONS))
+        self.paths = list(paths)
+        self.loop = loop
+        self.position = 0
+
+    def open(self):
+        if not CV2_AVAILABLE:
+            logger.warning("OpenCV not installed — file replay unavailable")
+            return False
+        if not self.paths:
+            logger.warning("File replay camera has no images")
+            return False
+        return True
+
+    def read(self):
+        if self.position >= len(self.paths):
+            if not self.loop or not self.paths:
+                return None
+            self.position = 0
+        path = self.paths[self.position]
+        self.position += 1
+        return cv2.imread(path)
+
+    def close(self):
+        pass
+
+def open_camera(spec):
+    """Build and open a camera from a config value. Returns None on failure."""
+    if spec is None:
+        return None
+    if isinstance(spec, str) and spec.startswith('file:'):
+        camera = FileReplayCamera(spec[len('file:'):])
+    else:
+        camera = OpenCVCamera(int(spec) if str(spec).isdigit() else spec)
+    return camera if camera.open() else None
+
+def shared_camera(spec):
+    """open_camera(), opened once per spec and shared. Failures are not cached."""
+    key = str(spec)
+    with _shared_lock:
+        camera = _shared.get(key)
+        if camera is None:
+            camera = open_camera(spec)
+            if camera is not None:
+                _shared[key] = camera
+        return camera
@@ -0,0 +1,132 @@
+"""
+Config Store
+In-memory, validated copy of motor_config.json.
+
+- Reads are served from memory; the file is only re-read when its mtime
+  changes (checked at most every CHECK_INTERVAL seconds), so hand edits to
+  e.g. grid_params are picked up without a restart.
+- Updates apply to memory at once and are written back after DEBOUNCE
+  seconds without further changes, so a sensitivity slider drag costs one
+  write, not one per event.
+- Writes go to a temp file that is then renamed over the config, so a crash
+  or a concurrent writer never leaves a half-written file behind.
+- A file that fails to parse or validate is ignored and the last good copy
+  is kept.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds of quiet before a pending update is written.
+DEBOUNCE = 0.5
+# Minimum seconds between mtime checks.
+CHECK_INTERVAL = 1.0
+
+class ConfigStore:
+    """Cached JSON config with atomic, debounced writes and hot reload.
+
+    `validate(config)` raises ValueError for a config that must not be used;
+    `on_change(config)` is called with every newly loaded or updated config.
+    """
+
+    def __init__(self, path, validate=None, on_change=None, debounce=DEBOUNCE):
+        self.path = path
+        self.validate = validate or (lambda config: None)
+        self.on_change = on_change or (lambda config: None)
+        self.debounce = debounce
+        self.lock = threading.RLock()
+        self.data = {}
+        self.mtime = None
+        self.checked = 0.0
+        self.timer = None
+        self.load()
+        atexit.register(self.flush)
+
+    def snapshot(self):
+        """Deep copy of the current config."""
+        with self.lock:
+            return copy.deepcopy(self.data)
+
+    def get(self, key, default=None):
+        with self.lock:
+            return copy.deepcopy(self.data.get(key, default))
+
+    # --- reading ---
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def load(self):
+        """(Re)read the file. Returns True if a new config was adopted."""
+        with self.lock:
+            mtime = self._file_mtime()
+            self.mtime = mtime
+            if mtime is None:
+                return False
+            try:
+                with open(self.path, 'r') as f:
+                    loaded = json.load(f)
+                self.validate(loaded)
+            except (OSError, ValueError) as e:
+                logger.error(f"Ignoring invalid config {self.path}: {e}")
+                return False
+            self.data = loaded
+            self.on_change(copy.deepcopy(loaded))
+            logger.info(f"Loaded config {self.path}: {sorted(loaded)}")
+            return True
+
+    def refresh(self):
+        """Reload if the file changed on disk since it was last read or written."""
+        now = time.monotonic()
+        if now - self.checked < CHECK_INTERVAL:
+            return False
+        self.checked = now
+        with self.lock:
+            if self.timer is not None or self._file_mtime() == self.mtime:
+                # Unchanged, or our own pending update is newer than the file.
+                return False
+            logger.info(f"{self.path} changed on disk — reloading")
+            return self.load()
+
+    # --- writing ---
+
+    def update(self, changes):
+        """Merge `changes` into the config. Raises ValueError if invalid."""
+        with self.lock:
+            merged = dict(self.data, **changes)
+            self.validate(merged)
+            self.data = merged
+            self.on_change(copy.deepcopy(merged))
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.debounce, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        """Write any pending update now."""
+        with self.lock:
+            if self.timer is None:
+                return
+            self.timer.cancel()
+            self.timer = None
+            tmp = f"{self.path}.tmp"
+            try:
+                with open(tmp, 'w') as f:
+                    json.dump(self.data, f, indent=4)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+                self.mtime = self._file_mtime()
+            except OSError as e:
+                logger.error(f"Error saving config: {e}")
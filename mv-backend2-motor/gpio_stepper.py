@@ -0,0 +1,206 @@
+"""
+GPIO Stepping Engine (Raspberry Pi)
+Drives the X/Y step/dir drivers without per-step Python sleeps.
+
+A move is turned into a precomputed pulse train before any pin toggles:
+
+- the major axis follows a trapezoidal profile — ramp up from START_RATE at
+  ACCEL steps/s², cruise at MAX_RATE, ramp down symmetrically (triangular
+  when the move is too short to reach cruise);
+- the minor axis is interleaved with Bresenham, so both axes move at once
+  and arrive together instead of X-then-Y.
+
+The train is then played by pigpio's DMA waveforms when the pigpio daemon is
+running (hardware-timed, immune to Python scheduling jitter). Otherwise a
+dedicated thread plays it against absolute perf_counter deadlines — with
+SCHED_FIFO priority when the process is allowed to — so timing errors
+don't accumulate from step to step.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+
+try:
+    import pigpio
+    PIGPIO_AVAILABLE = True
+except ImportError:
+    PIGPIO_AVAILABLE = False
+    pigpio = None
+
+logger = logging.getLogger(__name__)
+
+# Step pulse width (A4988 / DRV8825 need >= 2 µs).
+PULSE_US = 5
+# Delay between setting DIR and the first STEP edge.
+DIR_SETUP_US = 20
+# pigpio limits pulses per waveform; longer trains are streamed in chunks.
+MAX_PULSES_PER_WAVE = 4000
+
+# ---------------------------------------------------------------------------
+# Pulse train construction
+# ---------------------------------------------------------------------------
+
+def step_intervals(steps, start_rate, max_rate, accel):
+    """Seconds between consecutive steps for a trapezoidal profile.
+
+    The rate at step i is limited by how far it is from both ends of the
+    move, v = sqrt(v0² + 2·a·d), and capped at `max_rate`.
+    """
+    intervals = []
+    v0_sq = start_rate * start_rate
+    for i in range(steps):
+        distance = min(i, steps - 1 - i)
+        rate = min(max_rate, math.sqrt(v0_sq + 2.0 * accel * distance))
+        intervals.append(1.0 / rate)
+    return intervals
+
+def build_pulse_train(steps_x, steps_y, start_rate, max_rate, accel):
+    """Return [(axes, interval_s), ...]: which axes step at each tick.
+
+    The axis with more steps sets the timing; the other is spread evenly
+    across it (Bresenham), so both finish on the same tick.
+    """
+    n_x, n_y = abs(steps_x), abs(steps_y)
+    major, minor = ('x', 'y') if n_x >= n_y else ('y', 'x')
+    n_major, n_minor = max(n_x, n_y), min(n_x, n_y)
+    train = []
+    error = n_major // 2
+    for interval in step_intervals(n_major, start_rate, max_rate, accel):
+        axes = [major]
+        error -= n_minor
+        if error < 0:
+            error += n_major
+            axes.append(minor)
+        train.append((tuple(axes), interval))
+    return train
+
+def train_duration(train):
+    return sum(interval for _, interval in train)
+
+# ---------------------------------------------------------------------------
+# Engine
+# ---------------------------------------------------------------------------
+
+class StepperEngine:
+    """Plays coordinated X/Y moves on step/dir drivers."""
+
+    def __init__(self, gpio, pins, start_rate, max_rate, accel):
+        self.gpio = gpio
+        self.pins = pins
+        self.start_rate = start_rate
+        self.max_rate = max_rate
+        self.accel = accel
+        self.pi = None
+        if PIGPIO_AVAILABLE:
+            pi = pigpio.pi()
+            if pi.connected:
+                self.pi = pi
+                for axis_pins in pins.values():
+                    for pin in axis_pins.values():
+                        pi.set_mode(pin, pigpio.OUTPUT)
+            else:
+                logger.warning("pigpio daemon not running — using real-time thread stepping")
+        logger.info(f"Stepper engine: {'pigpio DMA waveforms' if self.pi else 'real-time thread'}, "
+                    f"{start_rate}->{max_rate} steps/s @ {accel} steps/s²")
+
+    @property
+    def mode(self):
+        return 'pigpio' if self.pi else 'thread'
+
+    def move(self, steps_x, steps_y):
+        """Step both axes together; blocks until the train has been played."""
+        steps = {'x': steps_x, 'y': steps_y}
+        active = [axis for axis, n in steps.items() if n]
+        if not active:
+            return 0.0
+        train = build_pulse_train(steps_x, steps_y, self.start_rate, self.max_rate, self.accel)
+        started = time.perf_counter()
+        for axis in active:
+            self._write(self.pins[axis]['enable'], 0)
+            self._write(self.pins[axis]['dir'], 1 if steps[axis] > 0 else 0)
+        time.sleep(DIR_SETUP_US / 1e6)
+        try:
+            if self.pi:
+                self._play_pigpio(train)
+            else:
+                self._play_thread(train)
+        finally:
+            for axis in active:
+                self._write(self.pins[axis]['enable'], 1)
+        elapsed = time.perf_counter() - started
+        logger.info(f"Stepped X={steps_x} Y={steps_y} in {elapsed:.3f}s (profile {train_duration(train):.3f}s)")
+        return elapsed
+
+    def _write(self, pin, level):
+        if self.pi:
+            self.pi.write(pin, level)
+        else:
+            self.gpio.output(pin, self.gpio.HIGH if level else self.gpio.LOW)
+
+    # --- pigpio: DMA-timed waveforms ---
+
+    def _play_pigpio(self, train):
+        pulses = []
+        for axes, interval in train:
+            mask = 0
+            for axis in axes:
+                mask |= 1 << self.pins[axis]['step']
+            low_us = max(1, int(round(interval * 1e6)) - PULSE_US)
+            pulses.append(pigpio.pulse(mask, 0, PULSE_US))
+            pulses.append(pigpio.pulse(0, mask, low_us))
+
+        pi = self.pi
+        pi.wave_clear()
+        previous = None
+        for start in range(0, len(pulses), MAX_PULSES_PER_WAVE):
+            pi.wave_add_generic(pulses[start:start + MAX_PULSES_PER_WAVE])
+            wave_id = pi.wave_create()
+            # SYNC mode queues this chunk to start exactly when the previous
+            # one ends, so the train is seamless across chunks.
+            pi.wave_send_using_mode(wave_id, pigpio.WAVE_MODE_ONE_SHOT_SYNC)
+            if previous is not None:
+                while pi.wave_tx_at() == previous:
+                    time.sleep(0.001)
+                pi.wave_delete(previous)
+            previous = wave_id
+        while pi.wave_tx_busy():
+            time.sleep(0.001)
+        if previous is not None:
+            pi.wave_delete(previous)
+
+    # --- fallback: dedicated real-time thread ---
+
+    def _play_thread(self, train):
+        error = []
+
+        def run():
+            try:
+                try:
+                    os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(50))
+                except (AttributeError, PermissionError, OSError):
+                    pass
+                gpio = self.gpio
+                step_pins = {axis: self.pins[axis]['step'] for axis in self.pins}
+                deadline = time.perf_counter()
+                for axes, interval in train:
+                    pins = [step_pins[axis] for axis in axes]
+                    gpio.output(pins, gpio.HIGH)
+                    pulse_end = time.perf_counter() + PULSE_US / 1e6
+                    while time.perf_counter() < pulse_end:
+                        pass
+                    gpio.output(pins, gpio.LOW)
+                    # Absolute deadlines: a late step doesn't delay the rest.
+                    deadline += interval
+                    while time.perf_counter() < deadline:
+                        pass
+            except Exception as e:
+                error.append(e)
+
+        thread = threading.Thread(target=run, name='stepper-rt', daemon=True)
+        thread.start()
+        thread.join()
+        if error:
+            raise error[0]
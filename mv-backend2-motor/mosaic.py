@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Scan Mosaic
+Stitches the fields of a finished scan (scan_orchestrator.py output) into one
+slide image per objective and writes it as a Deep Zoom tile pyramid, so a
+viewer (e.g. OpenSeadragon) fetches only the tiles on screen at the zoom it
+shows instead of every full-resolution field.
+
+- Placement starts from the stage position recorded for each field (the scan
+  plan's positions, in motor units) times PIXELS_PER_UNIT.
+- Where a field overlaps one already placed, the nominal offset is refined
+  with cv2.phaseCorrelate on the overlap, downscaled by REFINE_SCALE — the
+  28BYJ-48 gear train loses a few steps of backlash, and that shows up as
+  seams. Fields that do not overlap keep their nominal position.
+- Tiles are JPEG-encoded on a thread pool (cv2.imencode releases the GIL).
+
+Output, next to the scan's results.jsonl:
+
+    mosaic/<field_type>.dzi                      Deep Zoom descriptor
+    mosaic/<field_type>_files/<level>/<col>_<row>.jpg
+    mosaic/<field_type>.json                     size + each field's rectangle
+
+    python mosaic.py scans/<scan_id>             # (re)build a scan's mosaics
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import cv2
+    import numpy as np
+    CV2_AVAILABLE = True
+except ImportError:
+    cv2 = None
+    np = None
+    CV2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Image pixels per motor unit of stage travel, per objective. Signed: the
+# slide moves under a fixed camera, and the optics may mirror it again — flip
+# a sign if the mosaic comes out mirrored. Calibrate by moving one unit with
+# /manual_move and measuring the image shift; the 40x HPF objective magnifies
+# four times as much as the 10x LPF one.
+PIXELS_PER_UNIT = {
+    'lpf': (-1600.0, -1600.0),
+    'hpf': (-6400.0, -6400.0),
+}
+
+TILE_SIZE = 256
+TILE_QUALITY = 85
+# Downscale applied to overlaps before phase correlation.
+REFINE_SCALE = 0.25
+# Overlap (full-resolution pixels, both axes) needed to attempt a refinement.
+MIN_OVERLAP = 64
+# Weakest phase-correlation peak trusted, and the largest correction (pixels)
+# accepted — anything beyond that is a false match, not backlash.
+MIN_RESPONSE = 0.1
+MAX_CORRECTION = 200
+TILE_WORKERS = 4
+
+# ---------------------------------------------------------------------------
+# Placement
+# ---------------------------------------------------------------------------
+
+def nominal_offsets(fields, pixels_per_unit):
+    """Top-left pixel offset of every field from its recorded stage position."""
+    ppu_x, ppu_y = pixels_per_unit
+    return [(field['position']['x'] * ppu_x, field['position']['y'] * ppu_y) for field in fields]
+
+def overlap_rect(a, b, size):
+    """Intersection of two equally sized rectangles at offsets a and b, or None."""
+    width, height = size
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[0], b[0]) + width, min(a[1], b[1]) + height
+    if x1 - x0 < MIN_OVERLAP or y1 - y0 < MIN_OVERLAP:
+        return None
+    return x0, y0, x1, y1
+
+def _gray_crop(image, origin, rect):
+    x0, y0, x1, y1 = (int(round(v)) for v in (rect[0] - origin[0], rect[1] - origin[1],
+                                               rect[2] - origin[0], rect[3] - origin[1]))
+    crop = image[y0:y1, x0:x1]
+    if crop.ndim == 3:
+        crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    crop = cv2.resize(crop, None, fx=REFINE_SCALE, fy=REFINE_SCALE, interpolation=cv2.INTER_AREA)
+    return crop.astype(np.float32)
+
+def refine_offset(placed_image, placed_offset, image, offset):
+    """Correct `offset` against an already placed neighbour.
+
+    Returns (corrected offset, peak response); the offset is None when the
+    fields do not overlap enough or the correlation peak is not trustworthy.
+    """
+    size = (image.shape[1], image.shape[0])
+    rect = overlap_rect(placed_offset, offset, size)
+    if rect is None:
+        return None, 0.0
+    reference = _gray_crop(placed_image, placed_offset, rect)
+    moving = _gray_crop(image, offset, rect)
+    if min(reference.shape) < 8:
+        return None, 0.0
+    window = cv2.createHanningWindow(reference.shape[::-1], cv2.CV_32F)
+    (shift_x, shift_y), response = cv2.phaseCorrelate(reference, moving, window)
+    # Content that appears shifted by +s in this field sits s further along
+    # the slide, so the field itself belongs s earlier.
+    dx, dy = -shift_x / REFINE_SCALE, -shift_y / REFINE_SCALE
+    if response < MIN_RESPONSE or math.hypot(dx, dy) > MAX_CORRECTION:
+        return None, response
+    return (offset[0] + dx, offset[1] + dy), response
+
+def place_fields(images, offsets):
+    """Refined offsets: each field is registered against its best-matching
+    neighbour among the fields placed before it."""
+    placed = []
+    for image, offset in zip(images, offsets):
+        best, best_response = offset, 0.0
+        for other_image, other_offset in placed:
+            candidate, response = refine_offset(other_image, other_offset, image, offset)
+            if candidate is not None and response > best_response:
+                best, best_response = candidate, response
+        placed.append((image, best))
+    return [offset for _, offset in placed]
+
+def compose(images, offsets):
+    """Paste fields onto one canvas. Returns (canvas, integer field rectangles)."""
+    origin_x = min(x for x, _ in offsets)
+    origin_y = min(y for _, y in offsets)
+    rects = []
+    for image, (x, y) in zip(images, offsets):
+        left, top = int(round(x - origin_x)), int(round(y - origin_y))
+        rects.append((left, top, image.shape[1], image.shape[0]))
+    width = max(left + w for left, _, w, _ in rects)
+    height = max(top + h for _, top, _, h in rects)
+    canvas = np.zeros((height, width, 3), dtype=np.uint8)
+    for image, (left, top, w, h) in zip(images, rects):
+        canvas[top:top + h, left:left + w] = image if image.ndim == 3 else cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    return canvas, rects
+
+# ---------------------------------------------------------------------------
+# Deep Zoom pyramid
+# ---------------------------------------------------------------------------
+
+def write_pyramid(image, out_dir, name, tile_size=TILE_SIZE, quality=TILE_QUALITY):
+    """Write `image` as a Deep Zoom pyramid: <name>.dzi plus <name>_files/.
+
+    Level max_level is full resolution; each level below halves it, down to
+    a single pixel, as Deep Zoom viewers expect.
+    """
+    height, width = image.shape[:2]
+    max_level = math.ceil(math.log2(max(width, height))) if max(width, height) > 1 else 0
+    tiles_dir = os.path.join(out_dir, f"{name}_files")
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+
+    def write_tile(job):
+        level_image, path, x, y = job
+        tile = level_image[y:y + tile_size, x:x + tile_size]
+        ok, encoded = cv2.imencode('.jpg', tile, params)
+        if ok:
+            with open(path, 'wb') as f:
+                f.write(encoded.tobytes())
+
+    level_image = image
+    with ThreadPoolExecutor(max_workers=TILE_WORKERS) as pool:
+        for level in range(max_level, -1, -1):
+            level_dir = os.path.join(tiles_dir, str(level))
+            os.makedirs(level_dir, exist_ok=True)
+            h, w = level_image.shape[:2]
+            jobs = [(level_image, os.path.join(level_dir, f"{x // tile_size}_{y // tile_size}.jpg"), x, y)
+                    for y in range(0, h, tile_size) for x in range(0, w, tile_size)]
+            list(pool.map(write_tile, jobs))
+            if level:
+                level_image = cv2.resize(level_image, (max(1, (w + 1) // 2), max(1, (h + 1) // 2)),
+                                         interpolation=cv2.INTER_AREA)
+
+    with open(os.path.join(out_dir, f"{name}.dzi"), 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" TileSize="{tile_size}" '
+                f'Overlap="0" Format="jpg"><Size Width="{width}" Height="{height}"/></Image>\n')
+    return max_level
+
+# ---------------------------------------------------------------------------
+# Scan folders
+# ---------------------------------------------------------------------------
+
+def load_fields(scan_dir):
+    """Successfully stored fields of a scan, grouped by objective, in scan order."""
+    by_objective = {}
+    with open(os.path.join(scan_dir, 'results.jsonl')) as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get('position') and record.get('image'):
+                by_objective.setdefault(record['field_type'], []).append(record)
+    for fields in by_objective.values():
+        fields.sort(key=lambda r: r['sample_number'])
+    return by_objective
+
+def build_mosaic(scan_dir, field_type, fields, pixels_per_unit=None):
+    """Stitch one objective's fields and write its pyramid. Returns the layout."""
+    images, kept = [], []
+    for field in fields:
+        image = cv2.imread(os.path.join(scan_dir, field['image']))
+        if image is None:
+            logger.warning(f"Skipping {field['image']}: not readable")
+            continue
+        images.append(image)
+        kept.append(field)
+    if not images:
+        return None
+    offsets = place_fields(images, nominal_offsets(kept, pixels_per_unit or PIXELS_PER_UNIT[field_type]))
+    canvas, rects = compose(images, offsets)
+
+    out_dir = os.path.join(scan_dir, 'mosaic')
+    os.makedirs(out_dir, exist_ok=True)
+    levels = write_pyramid(canvas, out_dir, field_type)
+    layout = {
+        'field_type': field_type,
+        'width': canvas.shape[1],
+        'height': canvas.shape[0],
+        'tile_size': TILE_SIZE,
+        'max_level': levels,
+        'dzi': f"{field_type}.dzi",
+        'fields': [{'sample': field['sample'], 'image': field['image'], 'rect': rect}
+                   for field, rect in zip(kept, rects)],
+    }
+    with open(os.path.join(out_dir, f"{field_type}.json"), 'w') as f:
+        json.dump(layout, f, indent=4)
+    logger.info(f"Mosaic {field_type}: {len(kept)} fields → {layout['width']}x{layout['height']}, {levels + 1} levels")
+    return layout
+
+def build_scan_mosaics(scan_dir):
+    """Build the mosaic of every objective in a scan folder."""
+    return {field_type: build_mosaic(scan_dir, field_type, fields)
+            for field_type, fields in load_fields(scan_dir).items()}
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('scan_dir', help='scan folder written by scan_orchestrator.py')
+    args = parser.parse_args()
+    if not CV2_AVAILABLE:
+        logger.error("OpenCV is required: pip install opencv-python-headless")
+        return 1
+    build_scan_mosaics(args.scan_dir)
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
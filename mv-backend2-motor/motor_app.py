@@ -0,0 +1,116 @@
+"""
+Motor HTTP API
+The Flask routes shared by every motor server edition. Each route hands its
+request to the ScanController and returns what it answers:
+
+    GET  /status, /ports, /get_config, /scan_plan?field_type=, /metrics
+    POST /initialize, /update_config, /get_samples, /next_sample,
+         /continue_after_switch, /resume_scan, /field_result, /stop,
+         /manual_zero, /manual_home, /manual_move, /autofocus, /test_motors
+"""
+
+import serial.tools.list_ports
+from flask import Flask, Response, request, jsonify
+from flask_cors import CORS
+
+from port_discovery import candidate_ports
+from telemetry import PROMETHEUS_CONTENT_TYPE, metrics
+
+def list_serial_ports():
+    """All serial ports, Bluetooth ones flagged (and skipped by discovery)."""
+    usable = {p.device for p in candidate_ports()}
+    return [{
+        'device': p.device,
+        'description': p.description,
+        'manufacturer': p.manufacturer,
+        'is_bluetooth': p.device not in usable,
+    } for p in serial.tools.list_ports.comports()]
+
+def create_app(controller):
+    app = Flask(__name__)
+    CORS(app, resources={r"/*": {"origins": ["*"]}})
+
+    def respond(result):
+        payload, code = result
+        return jsonify(payload), code
+
+    @app.route('/status')
+    def get_status():
+        return respond(controller.status())
+
+    @app.route('/initialize', methods=['POST'])
+    def init_endpoint():
+        return respond(controller.connect())
+
+    @app.route('/ports')
+    def list_ports():
+        driver = controller.driver
+        return jsonify({
+            'ports': list_serial_ports(),
+            'arduino_connected': driver.initialized,
+            'arduino_port': getattr(driver, 'port', None),
+        })
+
+    @app.route('/metrics')
+    def get_metrics():
+        return Response(metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+    @app.route('/get_config')
+    def get_config():
+        return respond(controller.get_config())
+
+    @app.route('/update_config', methods=['POST'])
+    def update_config():
+        return respond(controller.update_config(request.json))
+
+    @app.route('/scan_plan')
+    def get_scan_plan():
+        """Preview the plan for ?field_type=lpf|hpf without moving the stage."""
+        return respond(controller.preview_plan(request.args.get('field_type', 'lpf').lower()))
+
+    @app.route('/get_samples', methods=['POST'])
+    def get_samples():
+        return respond(controller.start_scan())
+
+    @app.route('/next_sample', methods=['POST'])
+    def next_sample():
+        return respond(controller.next_sample())
+
+    @app.route('/continue_after_switch', methods=['POST'])
+    def handle_continue():
+        return respond(controller.continue_after_switch())
+
+    @app.route('/resume_scan', methods=['POST'])
+    def resume_scan():
+        return respond(controller.resume_scan())
+
+    @app.route('/field_result', methods=['POST'])
+    def field_result():
+        """Per-field YOLO counts for the adaptive scan length."""
+        return respond(controller.record_field_result(request.json or {}))
+
+    @app.route('/stop', methods=['POST'])
+    def stop_scan():
+        return respond(controller.stop())
+
+    @app.route('/manual_zero', methods=['POST'])
+    def manual_zero():
+        return respond(controller.manual_zero())
+
+    @app.route('/manual_home', methods=['POST'])
+    def manual_home():
+        return respond(controller.manual_home())
+
+    @app.route('/manual_move', methods=['POST'])
+    def manual_move():
+        return respond(controller.manual_move(request.json or {}))
+
+    @app.route('/autofocus', methods=['POST'])
+    def manual_autofocus():
+        return respond(controller.manual_autofocus())
+
+    @app.route('/test_motors', methods=['POST'])
+    def test_motors():
+        return respond(controller.test_motors(request.json or {}))
+
+    return app
@@ -0,0 +1,168 @@
+"""
+Motor HTTP API (ASGI)
+The motor API of motor_app.py on FastAPI, for `python motor_server.py --asgi`.
+
+Stage operations are queued as jobs (motor_jobs.py) instead of holding a
+worker thread for the whole move, so status reads and emergency stops from
+several UI tabs are answered while a long HOME is running.
+
+Every motor route accepts `?wait=<seconds>`:
+    - default: answer when the operation finishes, exactly like the Flask
+      server (waiting costs no thread, just a suspended coroutine);
+    - wait=0 (or a wait shorter than the move): answer 202 with a `job_id`
+      to poll at GET /jobs/<id>?wait=<seconds> (long-poll).
+
+/stop ends the scan as soon as it arrives (a step still moving finishes its
+move but not its field), drops any queued motor jobs and homes the stage as
+soon as the current move allows; duplicate /stop and /manual_home requests join the job already
+in flight.
+"""
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+
+from motor_app import list_serial_ports
+from motor_jobs import JobRunner
+from telemetry import PROMETHEUS_CONTENT_TYPE, metrics
+
+# Longest a motor route waits by default — covers a full-travel HOME.
+DEFAULT_WAIT = 150.0
+# Upper bound for a single long-poll.
+MAX_WAIT = 300.0
+
+def create_asgi_app(controller):
+    app = FastAPI(title="Motor Control API")
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    runner = JobRunner()
+
+    def job_response(job):
+        if not job.done:
+            return JSONResponse(dict(job.describe(), status='pending', poll=f"/jobs/{job.id}"), status_code=202)
+        return JSONResponse(dict(job.payload, **job.describe()), status_code=job.code)
+
+    async def run(kind, fn, *args, wait=DEFAULT_WAIT, coalesce=False, preempt=False):
+        job = runner.submit(kind, fn, *args, coalesce=coalesce, preempt=preempt)
+        await runner.wait(job, min(max(wait, 0.0), MAX_WAIT))
+        return job_response(job)
+
+    async def body(request):
+        try:
+            return await request.json() or {}
+        except ValueError:
+            return {}
+
+    # --- cheap reads: never queued behind a move ---
+    # Status, config and plan reads go through ConfigStore.refresh(), whose
+    # hot reload re-applies the settle mode over serial (and so can wait on
+    # the port lock behind a move), so they run in the threadpool.
+
+    @app.get('/status')
+    async def get_status():
+        payload, code = await run_in_threadpool(controller.status)
+        current = runner.current
+        payload['job'] = current.describe() if current else None
+        return JSONResponse(payload, status_code=code)
+
+    @app.get('/ports')
+    async def list_ports():
+        driver = controller.driver
+        return {
+            'ports': list_serial_ports(),
+            'arduino_connected': driver.initialized,
+            'arduino_port': getattr(driver, 'port', None),
+        }
+
+    @app.get('/metrics')
+    async def get_metrics():
+        return Response(metrics.render(), headers={'Content-Type': PROMETHEUS_CONTENT_TYPE})
+
+    @app.get('/get_config')
+    async def get_config():
+        payload, code = await run_in_threadpool(controller.get_config)
+        return JSONResponse(payload, status_code=code)
+
+    @app.get('/scan_plan')
+    async def get_scan_plan(field_type: str = 'lpf'):
+        payload, code = await run_in_threadpool(controller.preview_plan, field_type.lower())
+        return JSONResponse(payload, status_code=code)
+
+    @app.get('/jobs')
+    async def list_jobs():
+        return {'jobs': [job.describe() for job in runner.jobs.values()]}
+
+    @app.get('/jobs/{job_id}')
+    async def get_job(job_id: int, wait: float = 0.0):
+        job = runner.get(job_id)
+        if job is None:
+            return JSONResponse({'status': 'error', 'message': f"Unknown job {job_id}"}, status_code=404)
+        await runner.wait(job, min(max(wait, 0.0), MAX_WAIT))
+        return job_response(job)
+
+    # --- motor operations: queued jobs ---
+
+    @app.post('/initialize')
+    async def init_endpoint(wait: float = DEFAULT_WAIT):
+        return await run('initialize', controller.connect, wait=wait, coalesce=True)
+
+    @app.post('/update_config')
+    async def update_config(request: Request):
+        payload, code = await run_in_threadpool(controller.update_config, await body(request))
+        return JSONResponse(payload, status_code=code)
+
+    @app.post('/field_result')
+    async def field_result(request: Request):
+        payload, code = await run_in_threadpool(controller.record_field_result, await body(request))
+        return JSONResponse(payload, status_code=code)
+
+    @app.post('/get_samples')
+    async def get_samples(wait: float = DEFAULT_WAIT):
+        return await run('get_samples', controller.start_scan, wait=wait)
+
+    @app.post('/next_sample')
+    async def next_sample(wait: float = DEFAULT_WAIT):
+        return await run('next_sample', controller.next_sample, wait=wait)
+
+    @app.post('/continue_after_switch')
+    async def handle_continue(wait: float = DEFAULT_WAIT):
+        return await run('continue_after_switch', controller.continue_after_switch, wait=wait)
+
+    @app.post('/resume_scan')
+    async def resume_scan(wait: float = DEFAULT_WAIT):
+        return await run('resume_scan', controller.resume_scan, wait=wait)
+
+    @app.post('/stop')
+    async def stop_scan(wait: float = DEFAULT_WAIT):
+        # The scan ends now, not after the move in progress: /status reports
+        # it stopped and scan steps are refused until the stage is homed.
+        await run_in_threadpool(controller.abort_scan)
+        # Nothing queued behind the current move should run after a stop.
+        return await run('stop', controller.stop_stage, wait=wait, coalesce=True, preempt=True)
+
+    @app.post('/manual_zero')
+    async def manual_zero(wait: float = DEFAULT_WAIT):
+        return await run('manual_zero', controller.manual_zero, wait=wait)
+
+    @app.post('/manual_home')
+    async def manual_home(wait: float = DEFAULT_WAIT):
+        return await run('manual_home', controller.manual_home, wait=wait, coalesce=True)
+
+    @app.post('/manual_move')
+    async def manual_move(request: Request, wait: float = DEFAULT_WAIT):
+        return await run('manual_move', controller.manual_move, await body(request), wait=wait)
+
+    @app.post('/autofocus')
+    async def manual_autofocus(wait: float = DEFAULT_WAIT):
+        return await run('autofocus', controller.manual_autofocus, wait=wait, coalesce=True)
+
+    @app.post('/test_motors')
+    async def test_motors(request: Request, wait: float = DEFAULT_WAIT):
+        return await run('test_motors', controller.test_motors, await body(request), wait=wait)
+
+    return app
@@ -0,0 +1,121 @@
+"""
+Motor Jobs
+Runs stage operations as jobs, one at a time, on a dedicated worker thread,
+so an async server never blocks its event loop on a serial command.
+
+Each submitted operation becomes a Job with an id that can be awaited or
+polled. Because there is only one stage, jobs run strictly in order.
+Idempotent operations (stop, home) coalesce: if the same kind is already
+queued or running, callers get that job back instead of queueing another
+120 s HOME behind it.
+"""
+
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from telemetry import PHASE_BUCKETS, metrics
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs kept for polling.
+JOB_HISTORY = 50
+
+class Job:
+    """One stage operation and, once it has run, its (payload, code) result."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, kind):
+        self.id = next(self._ids)
+        self.kind = kind
+        self.state = 'queued'          # queued | running | done | failed | cancelled
+        self.payload = None
+        self.code = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None             # concurrent.futures.Future
+
+    @property
+    def done(self):
+        return self.state in ('done', 'failed', 'cancelled')
+
+    def describe(self):
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'state': self.state,
+            'queued_s': round((self.started or time.time()) - self.created, 3),
+            'run_s': round((self.finished or time.time()) - self.started, 3) if self.started else None,
+        }
+
+class JobRunner:
+    """Serializes stage operations on one worker thread."""
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stage-job')
+        self.jobs = OrderedDict()
+        self.current = None
+        self.lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, coalesce=False, preempt=False):
+        """Queue fn(*args) -> (payload, code). Returns the Job.
+
+        `preempt` first cancels every other job that has not started yet.
+        """
+        with self.lock:
+            if preempt:
+                self._cancel_queued(kind)
+            if coalesce:
+                for job in self.jobs.values():
+                    if job.kind == kind and not job.done:
+                        return job
+            job = Job(kind)
+            job.future = self.executor.submit(self._run, job, fn, args)
+            self.jobs[job.id] = job
+            while len(self.jobs) > JOB_HISTORY:
+                oldest = next(iter(self.jobs.values()))
+                if not oldest.done:
+                    break
+                self.jobs.popitem(last=False)
+        return job
+
+    def _run(self, job, fn, args):
+        job.state = 'running'
+        job.started = time.time()
+        self.current = job
+        try:
+            job.payload, job.code = fn(*args)
+            job.state = 'done'
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.kind}) failed: {e}")
+            job.payload, job.code = {'status': 'error', 'message': str(e)}, 500
+            job.state = 'failed'
+        finally:
+            job.finished = time.time()
+            self.current = None
+            metrics.observe('motor_job_seconds', job.started - job.created, PHASE_BUCKETS, kind=job.kind, stage='queued')
+            metrics.observe('motor_job_seconds', job.finished - job.started, PHASE_BUCKETS, kind=job.kind, stage='run')
+
+    def _cancel_queued(self, by_kind):
+        for job in self.jobs.values():
+            if job.kind != by_kind and job.state == 'queued' and job.future.cancel():
+                job.state = 'cancelled'
+                job.payload, job.code = {'status': 'cancelled', 'message': f"Cancelled by {by_kind}"}, 409
+                job.finished = time.time()
+                logger.info(f"Job {job.id} ({job.kind}) cancelled by {by_kind}")
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    async def wait(self, job, timeout):
+        """Wait up to `timeout` seconds without blocking the event loop."""
+        if not job.done and timeout > 0:
+            # asyncio.wait never cancels the job when the timeout expires.
+            await asyncio.wait([asyncio.wrap_future(job.future)], timeout=timeout)
+        return job.done
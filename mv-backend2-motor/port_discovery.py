@@ -0,0 +1,167 @@
+"""
+Serial Port Discovery
+Finds the Arduino without paying a fixed boot delay per port.
+
+1. The last-known-good port (matched by hardware id first, then by device
+   name, since a replugged board often comes back as a different COM/ACM
+   number) is probed on its own.
+2. Only if that fails are the remaining candidates probed in parallel
+   threads; the first board to answer wins and the other probes are aborted.
+
+Each probe sends STATUS straight away and returns as soon as an "OK" line
+arrives — either the STATUS reply or the boot banner after the auto-reset —
+instead of sleeping 3 s and then asking. A board that did not reset answers
+within milliseconds, so reconnecting after a USB hiccup is near-instant.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+import serial.tools.list_ports
+
+logger = logging.getLogger(__name__)
+
+# How long to wait for "OK" on a single port (covers bootloader + setup()).
+PROBE_TIMEOUT = 4.0
+# Re-send STATUS if the port stays silent this long (first one may have been
+# swallowed by the bootloader).
+STATUS_RETRY_INTERVAL = 1.0
+# Timeout used for the returned connection, as before.
+SERIAL_TIMEOUT = 3
+
+LIKELY_NAMES = ['USB', 'ARDUINO', 'CH340', 'ACM']
+
+def candidate_ports():
+    """List serial ports, Bluetooth excluded, likely Arduinos first."""
+    ports = list(serial.tools.list_ports.comports())
+    ports = [p for p in ports if 'BLUETOOTH' not in (p.device + ' ' + (p.description or '')).upper()
+             and 'BTHENUM' not in (p.hwid or '').upper()]
+    ports.sort(key=lambda p: not any(name in (p.device + ' ' + (p.description or '')).upper()
+                                     for name in LIKELY_NAMES))
+    return ports
+
+# ---------------------------------------------------------------------------
+# Last-known-good cache
+# ---------------------------------------------------------------------------
+
+def load_last_port(cache_file):
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        with open(cache_file, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable port cache {cache_file}: {e}")
+        return None
+
+def save_last_port(cache_file, port):
+    try:
+        with open(cache_file, 'w') as f:
+            json.dump({'device': port.device, 'hwid': port.hwid, 'description': port.description}, f, indent=4)
+    except Exception as e:
+        logger.warning(f"Could not write port cache {cache_file}: {e}")
+
+def split_cached(ports, cached):
+    """Split `ports` into (cached matches, everything else).
+
+    A hardware id match ranks above a bare device-name match.
+    """
+    if not cached:
+        return [], ports
+    by_hwid = [p for p in ports if cached.get('hwid') and p.hwid == cached['hwid']]
+    by_device = [p for p in ports if p.device == cached.get('device') and p not in by_hwid]
+    preferred = by_hwid + by_device
+    return preferred, [p for p in ports if p not in preferred]
+
+# ---------------------------------------------------------------------------
+# Probing
+# ---------------------------------------------------------------------------
+
+def probe_port(device, baud, timeout=PROBE_TIMEOUT, cancel=None):
+    """Open `device` and wait for the Arduino to say OK.
+
+    Returns the open Serial on success, otherwise None. `cancel` is an
+    optional threading.Event that aborts the probe early.
+    """
+    ser = None
+    try:
+        ser = serial.Serial(device, baud, timeout=0.1)
+        start = time.time()
+        last_status = 0.0
+        lines = []
+        while (time.time() - start) < timeout:
+            if cancel is not None and cancel.is_set():
+                break
+            now = time.time()
+            if now - last_status >= STATUS_RETRY_INTERVAL:
+                ser.write(b"STATUS\n")
+                ser.flush()
+                last_status = now
+            line = ser.readline().decode('utf-8', errors='ignore').strip()
+            if not line:
+                continue
+            lines.append(line)
+            if "OK" in line.upper():
+                logger.info(f"Arduino identified on {device} after {time.time() - start:.2f}s")
+                if len(lines) > 1:
+                    logger.info(f"  Boot messages: {lines[:-1]}")
+                # Swallow the reply to any STATUS still queued behind the
+                # banner so it can't be mistaken for the next command's OK.
+                time.sleep(0.1)
+                ser.timeout = SERIAL_TIMEOUT
+                ser.reset_input_buffer()
+                return ser
+        ser.close()
+    except Exception as e:
+        logger.warning(f"  Port {device} failed: {e}")
+        if ser is not None and ser.is_open:
+            ser.close()
+    return None
+
+def probe_parallel(ports, baud):
+    """Probe `ports` concurrently and return (port, serial) for the first OK."""
+    if not ports:
+        return None, None
+    cancel = threading.Event()
+    winner = {}
+    lock = threading.Lock()
+
+    def attempt(port):
+        ser = probe_port(port.device, baud, cancel=cancel)
+        if ser is None:
+            return
+        with lock:
+            if winner:
+                ser.close()
+                return
+            winner['port'], winner['serial'] = port, ser
+        cancel.set()
+
+    with ThreadPoolExecutor(max_workers=len(ports), thread_name_prefix='port-probe') as pool:
+        for port in ports:
+            pool.submit(attempt, port)
+    return winner.get('port'), winner.get('serial')
+
+def find_arduino_port(cache_file, baud):
+    """Find the Arduino, trying the last-known-good port before the rest."""
+    ports = candidate_ports()
+    preferred, others = split_cached(ports, load_last_port(cache_file))
+    logger.info(f"Scanning {len(ports)} serial ports (Bluetooth excluded, {len(preferred)} cached)...")
+
+    for port in preferred:
+        logger.info(f"Trying last-known port {port.device} ({port.description})...")
+        ser = probe_port(port.device, baud)
+        if ser is not None:
+            save_last_port(cache_file, port)
+            return ser
+
+    logger.info(f"Probing {len(others)} ports in parallel: {[p.device for p in others]}")
+    port, ser = probe_parallel(others, baud)
+    if ser is not None:
+        save_last_port(cache_file, port)
+    return ser
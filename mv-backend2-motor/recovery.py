@@ -0,0 +1,109 @@
+"""
+Scan Recovery
+Keeps a scan alive across Arduino resets and USB drop-outs.
+
+- ConnectionSupervisor: a background thread that is told when the serial
+  link is lost and keeps calling the server's reconnect function until it
+  succeeds. Request handlers can wait on it for a short while instead of
+  failing the scan outright.
+- Checkpoints: the scan progress (field, index, remaining plan, absolute
+  step position) is written to disk after every confirmed field, so a scan
+  can be resumed from the last captured field — even after a server
+  restart — instead of being repeated from the start.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Connection supervisor
+# ---------------------------------------------------------------------------
+
+class ConnectionSupervisor:
+    """Reconnects the stage in the background after a reported disconnect."""
+
+    def __init__(self, reconnect, retry_interval=0.5):
+        self._reconnect = reconnect
+        self._retry_interval = retry_interval
+        self._lost = threading.Event()
+        self._connected = threading.Event()
+        self._thread = None
+        self.reconnects = 0
+        self.last_error = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='stage-supervisor', daemon=True)
+            self._thread.start()
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def report_connected(self):
+        self._lost.clear()
+        self._connected.set()
+
+    def report_lost(self, reason):
+        if self._lost.is_set():
+            return
+        logger.warning(f"Stage connection lost: {reason}. Reconnecting in background...")
+        self.last_error = str(reason)
+        self._connected.clear()
+        self._lost.set()
+
+    def wait_connected(self, timeout):
+        """Block up to `timeout` seconds for the link to come back."""
+        return self._connected.wait(timeout)
+
+    def _run(self):
+        while True:
+            self._lost.wait()
+            started = time.time()
+            try:
+                ok = self._reconnect()
+            except Exception as e:
+                logger.error(f"Reconnect attempt failed: {e}")
+                ok = False
+            if ok:
+                self.reconnects += 1
+                logger.info(f"Stage reconnected in {time.time() - started:.2f}s (reconnect #{self.reconnects})")
+                self.report_connected()
+            else:
+                time.sleep(self._retry_interval)
+
+# ---------------------------------------------------------------------------
+# Scan checkpoints
+# ---------------------------------------------------------------------------
+
+def save_checkpoint(path, data):
+    """Write the checkpoint atomically (temp file + rename)."""
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(dict(data, updated=time.time()), f, indent=4)
+        os.replace(tmp, path)
+    except Exception as e:
+        logger.error(f"Error saving scan checkpoint: {e}")
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"Error loading scan checkpoint: {e}")
+        return None
+
+def clear_checkpoint(path):
+    try:
+        if os.path.exists(path):
+            os.remove(path)
+    except Exception as e:
+        logger.error(f"Error clearing scan checkpoint: {e}")
@@ -0,0 +1,689 @@
+"""
+Scan Controller
+The scan state machine behind every motor server edition.
+
+    idle ──get_samples──▶ LPF pass ──next_sample…──▶ switch_objective
+      ▲                                                   │
+      │                                      continue_after_switch
+      │                                                   ▼
+      └──────── stop / complete ◀──next_sample…── HPF pass
+
+Each operation returns a (payload, http_status) pair, so the web layer
+(motor_app.py) only turns it into a response. The stage itself is reached
+through a driver from stage_drivers.py; an edition may offer several
+(e.g. Arduino first, GPIO second) and the first one that connects is used.
+
+With `autofocus.enabled` in motor_config.json every field is brought into
+focus (autofocus.py) once the stage has arrived, and its focus score is
+reported next to the position.
+
+With `adaptive.enabled`, per-field YOLO counts posted to /field_result decide
+the length of each pass (adaptive_scan.py): it ends early once the counts
+have converged and runs past its plan while they are borderline.
+"""
+
+import logging
+import threading
+import time
+
+from adaptive_scan import DEFAULT_ADAPTIVE, PassEstimate
+from autofocus import DEFAULT_AUTOFOCUS, FOCUS_METHODS, autofocus
+from camera import shared_camera
+from config_store import ConfigStore
+from recovery import save_checkpoint, load_checkpoint, clear_checkpoint
+from scan_planner import build_plan, extend_plan, grid_pitch
+from stage_drivers import SETTLE_MODES
+from telemetry import PhaseTimer, metrics
+
+logger = logging.getLogger(__name__)
+
+def config_block(config, name):
+    """A settings block of the config as a dict ({} when absent or null)."""
+    block = config.get(name)
+    if block is None:
+        return {}
+    if not isinstance(block, dict):
+        raise ValueError(f"{name} must be an object, got {block!r}")
+    return block
+
+def validate_config(config):
+    """Reject a motor_config.json the scan could not run with (ValueError)."""
+    if not isinstance(config, dict):
+        raise ValueError("the config must be a JSON object")
+    try:
+        sensitivity = float(config.get('sensitivity', 1.0))
+    except (TypeError, ValueError):
+        raise ValueError(f"sensitivity must be a number, got {config.get('sensitivity')!r}")
+    if sensitivity <= 0:
+        raise ValueError(f"sensitivity must be positive, got {sensitivity}")
+    grid_params = config_block(config, 'grid_params')
+    for field_type, params in grid_params.items():
+        try:
+            grid_pitch(params)
+        except (AttributeError, TypeError, ValueError) as e:
+            raise ValueError(f"grid_params.{field_type}: {e}")
+    settle = config_block(config, 'settle')
+    if settle and settle.get('mode') not in SETTLE_MODES:
+        raise ValueError(f"settle.mode must be one of {SETTLE_MODES}")
+    focus = dict(DEFAULT_AUTOFOCUS, **config_block(config, 'autofocus'))
+    if focus['method'] not in FOCUS_METHODS:
+        raise ValueError(f"autofocus.method must be one of {FOCUS_METHODS}")
+    for key in ('coarse_step', 'min_step', 'range'):
+        if not isinstance(focus[key], int) or focus[key] <= 0:
+            raise ValueError(f"autofocus.{key} must be a positive integer")
+    if focus['min_step'] > focus['coarse_step']:
+        raise ValueError("autofocus.min_step must not exceed autofocus.coarse_step")
+    adaptive = dict(DEFAULT_ADAPTIVE, **config_block(config, 'adaptive'))
+    if not isinstance(adaptive['confidence'], (int, float)) or not 0 < adaptive['confidence'] < 1:
+        raise ValueError("adaptive.confidence must be between 0 and 1")
+    if not isinstance(adaptive['min_fields'], int) or adaptive['min_fields'] < 1:
+        raise ValueError("adaptive.min_fields must be a positive integer")
+    if not isinstance(adaptive['max_extra_fields'], int) or adaptive['max_extra_fields'] < 0:
+        raise ValueError("adaptive.max_extra_fields must be a non-negative integer")
+
+class ScanController:
+    """Scan state, config and stage operations for one motor server."""
+
+    def __init__(self, drivers, config_file, checkpoint_file):
+        self.drivers = list(drivers)
+        self.driver = self.drivers[0]
+        self.config_file = config_file
+        self.checkpoint_file = checkpoint_file
+        self.state = {'sensitivity': 1.0, 'grid_params': {}}
+        self.focus = {
+            'config': dict(DEFAULT_AUTOFOCUS),
+            'available': True,         # False after a failed sweep, until the config changes
+            'last': None,              # result for the current field
+        }
+        self.adaptive = dict(DEFAULT_ADAPTIVE)
+        # field_type -> PassEstimate of the current scan
+        self.estimates = {}
+        self.scan = {
+            'active': False,
+            'field_type': 'lpf',       # 'lpf' or 'hpf'
+            'index': 0,                # current sample index (1-based)
+            'moves': [],               # remaining (dx, dy) moves
+            'total': 0,                # fields in the current objective's plan
+            'plan': None,              # plan dict from scan_planner.build_plan
+            'extra': 0,                # fields added beyond the plan (adaptive)
+            'ended': False,            # pass finished, waiting for the objective switch
+            'stopping': False,         # /stop accepted, the stage not yet homed
+        }
+        # Guards self.scan and self.estimates between the thread running stage
+        # operations and request threads (/field_result, /stop). Never held
+        # across a stage move.
+        self.scan_lock = threading.RLock()
+        # lpf_pass → objective_switch → hpf_pass, plus HOME (see telemetry.py)
+        self.phases = PhaseTimer()
+        self.config = ConfigStore(config_file, validate=validate_config, on_change=self.apply_config)
+
+    # --- config ---
+
+    def apply_config(self, config):
+        """ConfigStore callback: adopt a loaded or updated config."""
+        self.state['sensitivity'] = float(config.get('sensitivity', 1.0))
+        self.state['grid_params'] = config_block(config, 'grid_params')
+        self.adaptive = dict(DEFAULT_ADAPTIVE, **config_block(config, 'adaptive'))
+        focus = dict(DEFAULT_AUTOFOCUS, **config_block(config, 'autofocus'))
+        if focus != self.focus['config']:
+            self.focus['config'] = focus
+            self.focus['available'] = True
+        for driver in self.drivers:
+            driver.configure(config)
+        logger.debug(f"Config: sensitivity={self.state['sensitivity']}, grid_params: {sorted(self.state['grid_params'])}")
+
+    # --- stage connection ---
+
+    @property
+    def initialized(self):
+        return self.driver.initialized
+
+    def initialize(self):
+        """Connect the first driver that finds its hardware."""
+        if self.driver.initialized:
+            return True
+        for driver in self.drivers:
+            logger.info(f"Initializing stage (driver={driver.name})...")
+            if driver.connect():
+                self.driver = driver
+                return True
+        logger.error("Hardware init failed")
+        return False
+
+    def ensure_initialized(self):
+        return self.driver.initialized or self.initialize()
+
+    # --- scan state ---
+
+    def plan_scan(self, field_type, start=None):
+        """Build the scan plan for one objective from grid_params + sensitivity.
+
+        Field 1 is captured where the pass starts, so the plan holds
+        `fields - 1` relative moves. With `start` (current position) the plan
+        also carries an `approach` move to its first field.
+        """
+        self.config.refresh()
+        return build_plan(self.state['grid_params'], field_type, self.state['sensitivity'], start=start)
+
+    def start_pass(self, field_type, start=None):
+        """Reset scan state to field 1 of a freshly planned pass.
+        Returns the plan, or None while a /stop is being carried out."""
+        plan = self.plan_scan(field_type, start)
+        with self.scan_lock:
+            if self.scan['stopping']:
+                return None
+            scan = self.scan
+            scan['active'] = True
+            scan['field_type'] = field_type
+            scan['index'] = 1
+            scan['moves'] = list(plan['moves'])  # copy
+            scan['total'] = plan['fields']
+            scan['plan'] = plan
+            scan['extra'] = 0
+            scan['ended'] = False
+            self.estimates[field_type] = PassEstimate(field_type)
+            self.checkpoint_scan()
+        logger.info(f"{field_type.upper()} plan: {plan['pattern']} {plan['rows']}x{plan['cols']}"
+                    f"{' column-major' if plan['column_major'] else ''}, sensitivity={self.state['sensitivity']}, "
+                    f"travel={plan['travel']}, reversals={plan['reversals']}")
+        logger.info(f"Move sequence ({len(plan['moves'])} moves): {plan['moves']}")
+        return plan
+
+    def checkpoint_scan(self):
+        """Persist scan progress so an interrupted scan can be resumed."""
+        save_checkpoint(self.checkpoint_file, {
+            'field_type': self.scan['field_type'],
+            'index': self.scan['index'],
+            'total': self.scan['total'],
+            'moves': self.scan['moves'],
+            'plan': self.scan['plan'],
+            'extra': self.scan['extra'],
+            'counts': {field_type: estimate.fields for field_type, estimate in self.estimates.items()},
+            'x_steps': self.driver.x_steps,
+            'y_steps': self.driver.y_steps,
+        })
+
+    def restore_scan(self, checkpoint):
+        """Rebuild scan state and tracked position from a checkpoint."""
+        with self.scan_lock:
+            scan = self.scan
+            scan['active'] = True
+            scan['field_type'] = checkpoint['field_type']
+            scan['index'] = checkpoint['index']
+            scan['total'] = checkpoint['total']
+            scan['moves'] = [tuple(m) for m in checkpoint['moves']]
+            scan['plan'] = checkpoint['plan']
+            scan['extra'] = checkpoint.get('extra', 0)
+            self.estimates = {field_type: PassEstimate(field_type, fields)
+                              for field_type, fields in checkpoint.get('counts', {}).items()}
+        self.driver.restore_position(checkpoint['x_steps'], checkpoint['y_steps'])
+
+    def end_scan(self):
+        with self.scan_lock:
+            scan = self.scan
+            scan['active'] = False
+            scan['moves'] = []
+            scan['index'] = 0
+            scan['total'] = 0
+            self.estimates = {}
+            clear_checkpoint(self.checkpoint_file)
+
+    def current_position(self):
+        x, y = self.driver.position_units()
+        return {'x': round(x, 6), 'y': round(y, 6), 'z': self.driver.z_steps}
+
+    def current_sample_name(self):
+        """Return the sample name like 'lpf_3' from scan state."""
+        if not self.scan['active']:
+            return None
+        return f"{self.scan['field_type']}_{self.scan['index']}"
+
+    def sample_payload(self, **extra):
+        """Response body for "the stage is on a field, capture it"."""
+        payload = {
+            'status': 'success',
+            'sample': self.current_sample_name(),
+            'sample_number': self.scan['index'],
+            'field_type': self.scan['field_type'],
+            'total_samples': self.scan['total'],
+            'position': self.current_position(),
+            'position_verified': self.driver.verified,
+            'focus_score': self.focus['last']['score'] if self.focus['last'] else None,
+            'focus': self.focus['last'],
+            'ready_for_capture': True,
+        }
+        payload.update(extra)
+        return payload
+
+    # --- adaptive pass length ---
+
+    def pass_estimate(self):
+        """Estimate for the current pass, or None when adaptive scanning is off."""
+        estimate = self.estimates.get(self.scan['field_type'])
+        if not self.adaptive['enabled'] or estimate is None:
+            return None
+        return estimate.estimate(self.adaptive['confidence'])
+
+    def pass_converged(self):
+        """True once the analysed fields pin every reporting bucket down."""
+        estimate = self.estimates.get(self.scan['field_type'])
+        return (self.adaptive['enabled'] and estimate is not None
+                and self.scan['index'] >= self.adaptive['min_fields']
+                and estimate.converged(self.adaptive['confidence'], self.adaptive['min_fields']))
+
+    def extend_pass(self):
+        """Add one field past the plan to a borderline pass. Returns True if added.
+
+        Only a pass with enough analysed fields to judge is extended, so a
+        scan whose results are not posted back keeps its planned length.
+        """
+        scan = self.scan
+        estimate = self.estimates.get(scan['field_type'])
+        if (not self.adaptive['enabled'] or estimate is None or scan['ended']
+                or scan['extra'] >= self.adaptive['max_extra_fields']
+                or estimate.analysed < self.adaptive['min_fields']
+                or self.pass_converged()):
+            return False
+        scan['moves'].extend(extend_plan(scan['plan']))
+        scan['total'] = scan['plan']['fields']
+        scan['extra'] += 1
+        logger.info(f"{scan['field_type'].upper()} counts borderline — extending pass to {scan['total']} fields")
+        self.checkpoint_scan()
+        return True
+
+    def record_field_result(self, data):
+        """Per-field YOLO counts: {"sample": "lpf_3", "by_class": {...}}."""
+        sample = (data or {}).get('sample') or ''
+        field_type, _, index = sample.partition('_')
+        with self.scan_lock:
+            estimate = self.estimates.get(field_type)
+            if estimate is None or not index.isdigit():
+                return {'status': 'error', 'message': f"No active pass for sample '{sample}'"}, 400
+            by_class = data.get('by_class', data.get('summary', {}).get('by_class', {}))
+            try:
+                estimate.record(int(index), by_class)
+            except (AttributeError, TypeError, ValueError) as e:
+                return {'status': 'error', 'message': f"Invalid by_class: {e}"}, 400
+            return {'status': 'success', 'analysed': estimate.analysed}, 200
+
+    # --- focus ---
+
+    def focus_field(self, force=False):
+        """Autofocus on the field the stage is on, if enabled (or `force`).
+
+        The sweep stays within autofocus.range steps of the focus position
+        the server started with. A failed sweep turns autofocus off until its
+        config changes, so firmware without a focus motor costs one timeout,
+        not one per field. Returns the result reported with the field.
+        """
+        config = self.focus['config']
+        self.focus['last'] = None
+        if not force and not (config['enabled'] and self.focus['available']):
+            return None
+        if not self.driver.has_focus:
+            return None
+        camera = shared_camera(config['camera'])
+        if camera is None:
+            logger.warning(f"Autofocus camera {config['camera']} unavailable")
+            self.focus['available'] = False
+            return None
+
+        z = self.driver.z_steps
+        result = autofocus(camera, self.driver.focus, config['coarse_step'], config['min_step'],
+                           low=-config['range'] - z, high=config['range'] - z, method=config['method'])
+        if result is None:
+            self.focus['available'] = False
+            logger.warning("Autofocus disabled until the autofocus config changes")
+            return None
+        self.focus['available'] = True
+        metrics.observe('motor_autofocus_seconds', result['elapsed'], field_type=self.scan['field_type'])
+        self.focus['last'] = {
+            'score': round(result['score'], 3),
+            'method': config['method'],
+            'offset': result['offset'],
+            'moves': result['moves'],
+            'frames': result['frames'],
+        }
+        logger.info(f"Autofocus: score={result['score']:.1f} at z={self.driver.z_steps} "
+                    f"({result['offset']:+d} steps, {result['moves']} moves, {result['elapsed']:.2f}s)")
+        return self.focus['last']
+
+    # --- operations (one per route) ---
+
+    def status(self):
+        self.config.refresh()
+        payload = {
+            'status': 'ready' if self.driver.initialized else 'not_initialized',
+            'backend': self.driver.name,
+            'current_sample': self.current_sample_name(),
+            'sensitivity': self.state['sensitivity'],
+            'scan_active': self.scan['active'],
+            'scan_stopping': self.scan['stopping'],
+            'position': self.current_position(),
+            'position_verified': self.driver.verified,
+            'connected': self.driver.connected,
+        }
+        if self.scan['active'] and self.adaptive['enabled']:
+            payload['adaptive'] = self.pass_estimate()
+        payload.update(self.driver.status())
+        return payload, 200
+
+    def connect(self):
+        success = self.initialize()
+        return {
+            'status': 'success' if success else 'error',
+            'message': 'Hardware connected' if success else 'No hardware found'
+        }, 200 if success else 503
+
+    def get_config(self):
+        self.config.refresh()
+        return {'sensitivity': self.state['sensitivity'], 'grid_params': self.state['grid_params']}, 200
+
+    def update_config(self, data):
+        """Update sensitivity and/or grid_params. Written to disk debounced."""
+        changes = {key: data[key] for key in ('sensitivity', 'grid_params') if key in (data or {})}
+        if not changes:
+            return {'status': 'error', 'message': 'Nothing to update'}, 400
+        try:
+            if 'sensitivity' in changes:
+                changes['sensitivity'] = float(changes['sensitivity'])
+            self.config.update(changes)
+        except (TypeError, ValueError) as e:
+            return {'status': 'error', 'message': str(e)}, 400
+        return {'status': 'success'}, 200
+
+    def preview_plan(self, field_type):
+        """Plan for field_type without moving the stage."""
+        try:
+            return {'status': 'success', 'plan': self.plan_scan(field_type)}, 200
+        except ValueError as e:
+            return {'status': 'error', 'message': str(e)}, 400
+
+    def start_scan(self):
+        """Start a scan. The user has already positioned the stage at top-left.
+
+        1. ZERO the stage (mark current position as origin — no movement)
+        2. Plan the LPF pass from grid_params + sensitivity
+        3. Return success for sample 1 (captured at current position)
+        """
+        if self.scan['stopping']:
+            return self.scan_stopped()
+        if not self.ensure_initialized():
+            return {'status': 'error', 'message': 'Hardware not connected. Is the Arduino plugged in?'}, 503
+
+        # "Wherever you are now = origin". No motor movement.
+        if not self.driver.zero():
+            logger.warning("ZERO command failed — attempting to continue anyway")
+
+        try:
+            if self.start_pass('lpf') is None:
+                return self.scan_stopped()
+        except ValueError as e:
+            return {'status': 'error', 'message': f"Invalid grid_params: {e}"}, 400
+        self.phases.start('lpf_pass')
+        self.focus_field()
+        return self.sample_payload(), 200
+
+    def next_sample(self):
+        """Move to the next field of the current pass.
+
+        The next (dx, dy) is only consumed once the stage confirms the move,
+        so a failed move can be retried (or resumed) without skipping a field.
+        If /stop ends the scan while the stage is moving, the move is not
+        consumed and the cleared checkpoint is left alone.
+        """
+        with self.scan_lock:
+            response, step = self._next_move()
+        if response is not None:
+            return response
+        field_type, next_index, moves = step
+        dx, dy = moves[0]
+        logger.info(f"Moving to {field_type}_{next_index}: dx={dx}, dy={dy}")
+
+        started = time.perf_counter()
+        if not self.driver.move_with_recovery(dx, dy):
+            return {
+                'status': 'error',
+                'message': f"Failed to move to {field_type}_{next_index}",
+                'sample': self.current_sample_name(),
+                'resumable': True
+            }, 500 if self.driver.connected else 503
+
+        with self.scan_lock:
+            scan = self.scan
+            if scan['stopping'] or not scan['active'] or scan['moves'] is not moves or not moves:
+                return self.scan_stopped()
+            metrics.observe('motor_field_move_seconds', time.perf_counter() - started, field_type=field_type)
+            moves.pop(0)
+            scan['index'] = next_index
+            self.checkpoint_scan()
+        self.focus_field()
+        return self.sample_payload(), 200
+
+    def _next_move(self):
+        """next_sample under the scan lock: (response, None) when there is no
+        move to make, else (None, (field type, next index, remaining moves))."""
+        scan = self.scan
+        if scan['stopping']:
+            return self.scan_stopped(), None
+        if not scan['active']:
+            return ({'status': 'error', 'message': 'No active scan. Call /get_samples first.'}, 400), None
+
+        field_type = scan['field_type']
+        converged = bool(scan['moves']) and self.pass_converged()
+        if not scan['moves'] and not converged:
+            self.extend_pass()
+        if converged or scan['index'] >= scan['total'] or not scan['moves']:
+            adaptive = {}
+            if self.adaptive['enabled']:
+                adaptive = {'stopped_early': converged, 'fields_scanned': scan['index'],
+                            'estimate': self.pass_estimate()}
+                if converged:
+                    logger.info(f"{field_type.upper()} counts converged after {scan['index']} of "
+                                f"{scan['total']} fields — ending pass")
+                    scan['moves'] = []
+                    scan['total'] = scan['index']
+                    self.checkpoint_scan()
+            scan['ended'] = True
+            # After capturing the last LPF field, signal the objective switch
+            if field_type == 'lpf':
+                if self.phases.phase == 'lpf_pass':
+                    self.phases.start('objective_switch')
+                return (dict({'status': 'switch_objective', 'message': 'Please switch to 40x (HPF)'}, **adaptive), 200), None
+            self.phases.end()
+            self.scan['active'] = False
+            clear_checkpoint(self.checkpoint_file)
+            return (dict({'status': 'complete', 'message': 'All samples completed.'}, **adaptive), 200), None
+        return None, (field_type, scan['index'] + 1, scan['moves'])
+
+    def continue_after_switch(self):
+        """After the user switches objective (LPF → HPF), start the HPF pass.
+
+        The HPF pass is planned from wherever the LPF pass ended — entering
+        the grid at its nearest corner — instead of homing and re-zeroing
+        first. The origin is kept, so a later HOME still returns to the scan
+        start.
+        """
+        if self.scan['stopping']:
+            return self.scan_stopped()
+        if not self.driver.initialized:
+            return {'status': 'error', 'message': 'Hardware not connected'}, 503
+
+        try:
+            plan = self.start_pass('hpf', start=self.driver.position_units())
+        except ValueError as e:
+            return {'status': 'error', 'message': f"Invalid grid_params: {e}"}, 400
+        if plan is None:
+            return self.scan_stopped()
+
+        self.phases.start('hpf_pass')
+        dx, dy = plan['approach']
+        logger.info(f"Moving to hpf_1 directly from LPF end: dx={dx}, dy={dy}")
+        if not self.driver.move_with_recovery(dx, dy):
+            return {'status': 'error', 'message': 'Failed to move to hpf_1', 'resumable': True}, 500
+        with self.scan_lock:
+            if self.scan['stopping'] or not self.scan['active']:
+                return self.scan_stopped()
+            self.checkpoint_scan()
+        self.focus_field()
+        return self.sample_payload(), 200
+
+    def resume_scan(self):
+        """Resume an interrupted scan at its current field instead of starting over.
+
+        Uses the in-memory scan while the server is still running, otherwise
+        the on-disk checkpoint. Once the link is back the stage is driven onto
+        the current field (if it isn't there already) and reported ready to
+        capture.
+        """
+        if self.scan['stopping']:
+            return self.scan_stopped()
+        if not self.scan['active']:
+            checkpoint = load_checkpoint(self.checkpoint_file)
+            if not checkpoint:
+                return {'status': 'error', 'message': 'No interrupted scan to resume'}, 400
+            self.restore_scan(checkpoint)
+            logger.info(f"Restored scan from checkpoint at {self.current_sample_name()}")
+
+        if not self.ensure_initialized():
+            return {'status': 'error', 'message': 'Hardware not connected', 'resumable': True}, 503
+        if not self.driver.recover():
+            return {'status': 'error', 'message': 'Stage did not reconnect', 'resumable': True}, 503
+
+        target_x, target_y = self.scan['plan']['positions'][self.scan['index'] - 1]
+        x, y = self.driver.position_units()
+        if not self.driver.move_with_recovery(target_x - x, target_y - y):
+            return {'status': 'error', 'message': f"Failed to move to {self.current_sample_name()}",
+                    'resumable': True}, 500
+        with self.scan_lock:
+            if self.scan['stopping'] or not self.scan['active']:
+                return self.scan_stopped()
+            self.checkpoint_scan()
+        self.focus_field()
+        return self.sample_payload(resumed=True), 200
+
+    def scan_stopped(self):
+        """Response for a scan step overtaken by /stop."""
+        logger.info("Scan step skipped: the scan was stopped")
+        return {'status': 'error', 'message': 'Scan was stopped'}, 409
+
+    def stop(self):
+        """Emergency stop: abort scan and return motors to home position."""
+        self.abort_scan()
+        return self.stop_stage()
+
+    def abort_scan(self):
+        """First half of a stop, no stage I/O: end the scan at once, and refuse
+        scan steps until stop_stage() has homed the stage. A step already
+        moving does not consume its field or write a checkpoint."""
+        with self.scan_lock:
+            self.scan['stopping'] = True
+            self.end_scan()
+        self.phases.end('stopped')
+        logger.info("Scan stopped by user")
+
+    def stop_stage(self):
+        """Second half of a stop: return the motors to the origin."""
+        homed = False
+        try:
+            if self.driver.initialized:
+                if self.phases.timed('home', self.driver.home):
+                    self.driver.zero()
+                    homed = True
+                    logger.info("Stop: motors returned to home position")
+                else:
+                    logger.warning("Stop: HOME command failed")
+        finally:
+            self.scan['stopping'] = False
+        return {
+            'status': 'success',
+            'message': 'Scan stopped. Motors returned to home.' if homed else 'Scan stopped. Could not home motors.',
+            'homed': homed
+        }, 200
+
+    def manual_zero(self):
+        """Mark the current position as the new origin (no movement)."""
+        if not self.ensure_initialized():
+            return {'status': 'error', 'message': 'Hardware not connected'}, 503
+        if self.driver.zero():
+            logger.info("Manual ZERO: origin set to current position")
+            return {'status': 'success', 'message': 'Origin set'}, 200
+        return {'status': 'error', 'message': 'ZERO command failed'}, 500
+
+    def manual_home(self):
+        """Return motors to the origin position."""
+        if not self.ensure_initialized():
+            return {'status': 'error', 'message': 'Hardware not connected'}, 503
+        if self.phases.timed('home', self.driver.home):
+            self.driver.zero()
+            logger.info("Manual HOME: motors returned to origin")
+            return {'status': 'success', 'message': 'Returned to origin'}, 200
+        return {'status': 'error', 'message': 'HOME command failed'}, 500
+
+    def manual_move(self, data):
+        """Manually move a single axis by a specified amount.
+
+        Body: {"axis": "x"|"y"|"z", "units": float}
+        Positive units = right (X) or down (Y). Negative = opposite.
+        Z (focus) units are whole focus motor steps.
+        """
+        if not self.ensure_initialized():
+            return {'status': 'error', 'message': 'Hardware not connected'}, 503
+
+        axis = data.get('axis', '').lower()
+        units = float(data.get('units', 0))
+        if axis not in ('x', 'y', 'z'):
+            return {'status': 'error', 'message': 'axis must be "x", "y" or "z"'}, 400
+        if units == 0:
+            return {'status': 'error', 'message': 'units must be non-zero'}, 400
+
+        if axis == 'z':
+            logger.info(f"Manual focus move: {int(units)} steps")
+            if self.driver.focus(int(units)):
+                return {'status': 'success', 'axis': axis, 'units': int(units), 'z': self.driver.z_steps}, 200
+            return {'status': 'error', 'message': 'Focus motor did not respond'}, 500
+
+        dx, dy = (units, 0) if axis == 'x' else (0, units)
+        logger.info(f"Manual move: axis={axis}, units={units}")
+        if self.driver.move(dx, dy):
+            return {'status': 'success', 'axis': axis, 'units': units}, 200
+        return {'status': 'error', 'message': 'Motor did not respond'}, 500
+
+    def manual_autofocus(self):
+        """Autofocus where the stage stands now, even with autofocus disabled."""
+        if not self.ensure_initialized():
+            return {'status': 'error', 'message': 'Hardware not connected'}, 503
+        if not self.driver.has_focus:
+            return {'status': 'error', 'message': f"Stage driver '{self.driver.name}' has no focus axis"}, 400
+        result = self.focus_field(force=True)
+        if result is None:
+            return {'status': 'error', 'message': 'Autofocus failed (camera or focus motor)'}, 500
+        return {'status': 'success', 'focus': result, 'position': self.current_position()}, 200
+
+    def test_motors(self, data):
+        """Test each motor independently: X out and back, then Y out and back.
+
+        Use this to verify both motors are wired and working correctly.
+        Optional body: {"units": 2.0} to control how far each motor moves.
+        """
+        if not self.ensure_initialized():
+            return {'status': 'error', 'message': 'Hardware not connected'}, 503
+
+        units = float(data.get('units', 2.0))  # default 2.0 units = very visible movement
+        results = []
+        self.driver.zero()
+        for axis, (dx, dy) in (('X', (units, 0)), ('Y', (0, units))):
+            logger.info(f"Testing {axis} motor: {units} units")
+            results.append({'axis': axis, 'direction': 'positive', 'ok': self.driver.move(dx, dy)})
+            results.append({'axis': axis, 'direction': 'return', 'ok': self.driver.move(-dx, -dy)})
+        self.driver.zero()
+
+        x_ok = all(r['ok'] for r in results if r['axis'] == 'X')
+        y_ok = all(r['ok'] for r in results if r['axis'] == 'Y')
+        return {
+            'status': 'success',
+            'x_motor': 'working' if x_ok else 'FAILED',
+            'y_motor': 'working' if y_ok else 'FAILED',
+            'units_tested': units,
+            'details': results
+        }, 200
@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+"""
+Scan Orchestrator
+Runs a whole LPF + HPF scan without the browser in the loop: drives the
+motor server, grabs a frame per field from the camera, sends it to the YOLO
+service (/api/predict) and stores the per-field results.
+
+The work runs as a pipeline of threads joined by bounded queues, so the
+stages overlap instead of taking turns:
+
+    motion+capture ──▶ encode ──▶ detect (N workers) ──▶ store
+    (one field at a    (JPEG)     (HTTP to YOLO)         (files + summary)
+     time, in order)
+
+Only the capture has to wait for the stage; as soon as a frame is grabbed
+the next move starts while the previous field is encoded, detected and
+written. The bounded queues apply back-pressure, so a slow detector pauses
+the stage instead of piling up frames in memory. Total scan time therefore
+approaches the motion-only lower bound (moves + settle + grab).
+
+    python scan_orchestrator.py --camera 0                     # one scan, CLI
+    python scan_orchestrator.py --camera file:samples/ --auto-switch
+    python scan_orchestrator.py --serve                        # HTTP service
+
+Results go to scans/<scan_id>/: one JPEG per field, results.jsonl (one line
+per field) and summary.json (counts by class per objective, stage timings).
+The YOLO service archives each field under the scan id (its test_id), for
+per-test and cross-test queries at /api/archive/.
+Each field's counts are also posted back to the motor server's /field_result,
+which with `adaptive.enabled` ends a pass early once they have converged.
+When the scan ends, the fields are stitched into one tiled mosaic per
+objective (mosaic.py), served by the HTTP service at
+/scans/<scan_id>/mosaic/<field_type>.dzi and its _files/ tiles.
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+
+from camera import open_camera
+from mosaic import build_scan_mosaics
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    cv2 = None
+    CV2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+MOTOR_URL = os.environ.get('MOTOR_SERVER_URL', 'http://127.0.0.1:3001')
+DETECTOR_URL = os.environ.get('DETECTOR_URL', 'http://127.0.0.1:7860/api/predict')
+SCANS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scans')
+
+# Frames waiting between stages. Small on purpose: enough to keep every stage
+# busy, not enough to hide a stalled detector.
+QUEUE_DEPTH = 4
+DETECT_WORKERS = 2
+JPEG_QUALITY = 90
+# Frames read and dropped after each move so the kept frame was exposed
+# after the stage settled, not while it was still moving.
+STALE_FRAMES = 1
+MOTOR_TIMEOUT = 180
+DETECT_TIMEOUT = 60
+
+_DONE = object()
+
+# ---------------------------------------------------------------------------
+# HTTP helpers (stdlib only — the motor server has no requests dependency)
+# ---------------------------------------------------------------------------
+
+def post_json(url, payload=None, timeout=MOTOR_TIMEOUT):
+    """POST JSON, return (status_code, body dict)."""
+    request = urllib.request.Request(url, data=json.dumps(payload or {}).encode(),
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        try:
+            return e.code, json.loads(e.read() or b'{}')
+        except ValueError:
+            return e.code, {}
+
+def post_image(url, jpeg, filename, fields, timeout=DETECT_TIMEOUT):
+    """POST a JPEG as multipart/form-data field `image`, return the JSON reply."""
+    boundary = uuid.uuid4().hex
+    body = b''.join(
+        [f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+         for name, value in fields.items()]
+        + [f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="{filename}"\r\n'
+           f'Content-Type: image/jpeg\r\n\r\n'.encode(), jpeg, f'\r\n--{boundary}--\r\n'.encode()]
+    )
+    request = urllib.request.Request(url, data=body, method='POST',
+                                     headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.load(response)
+
+# ---------------------------------------------------------------------------
+# Orchestrated scan
+# ---------------------------------------------------------------------------
+
+class ScanRun:
+    """One orchestrated scan. start() launches the pipeline threads.
+
+    Args:
+        camera: object with read() -> BGR frame (see camera.py).
+        motor_url / detector_url: base URL of the motor server, YOLO predict URL.
+        conf: YOLO confidence threshold; None leaves it to the YOLO service's
+            per-objective profile.
+        auto_switch: continue to HPF without waiting for the operator
+            (file replay, or a motorized nosepiece).
+    """
+
+    def __init__(self, camera, motor_url=MOTOR_URL, detector_url=DETECTOR_URL, conf=None,
+                 auto_switch=False, out_dir=SCANS_DIR, workers=DETECT_WORKERS):
+        self.id = time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6]
+        self.camera = camera
+        self.motor_url = motor_url.rstrip('/')
+        self.detector_url = detector_url
+        self.conf = conf
+        self.auto_switch = auto_switch
+        self.workers = workers
+        self.dir = os.path.join(out_dir, self.id)
+
+        self.state = 'created'     # created | running | awaiting_switch | complete | stopped | failed
+        self.error = None
+        self.mosaics = {}          # field_type -> mosaic layout (mosaic.py)
+        self.fields = []           # per-field results, in completion order
+        self.timings = defaultdict(float)   # seconds spent per stage
+        self.lock = threading.Lock()
+        self.started = None
+        self.finished = None
+        self.switched = threading.Event()
+        self.stopping = threading.Event()
+        self.done = threading.Event()
+
+        self.frames = queue.Queue(maxsize=QUEUE_DEPTH)
+        self.encoded = queue.Queue(maxsize=QUEUE_DEPTH)
+        self.results = queue.Queue(maxsize=QUEUE_DEPTH)
+        self.threads = []
+
+    # --- control ---
+
+    def start(self):
+        os.makedirs(self.dir, exist_ok=True)
+        self.state = 'running'
+        self.started = time.perf_counter()
+        stages = [('motion', self._motion_stage), ('encode', self._encode_stage), ('store', self._store_stage)]
+        stages += [(f'detect-{i + 1}', self._detect_stage) for i in range(self.workers)]
+        for name, target in stages:
+            thread = threading.Thread(target=target, name=f'scan-{name}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        logger.info(f"Scan {self.id} started → {self.dir}")
+        return self
+
+    def continue_after_switch(self):
+        """The operator has switched to the HPF objective."""
+        self.switched.set()
+
+    def stop(self):
+        self.stopping.set()
+        self.switched.set()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def progress(self):
+        return {
+            'scan_id': self.id,
+            'state': self.state,
+            'error': self.error,
+            'fields_done': len(self.fields),
+            'queued': {'encode': self.frames.qsize(), 'detect': self.encoded.qsize(), 'store': self.results.qsize()},
+            'timings': self.summary_timings(),
+            'dir': self.dir,
+        }
+
+    def summary_timings(self):
+        end = self.finished or time.perf_counter()
+        timings = {k: round(v, 3) for k, v in self.timings.items()}
+        timings['wall'] = round(end - self.started, 3) if self.started else 0.0
+        return timings
+
+    # --- stage 1: motion + capture ---
+
+    def _motor(self, route):
+        started = time.perf_counter()
+        code, data = post_json(f"{self.motor_url}{route}")
+        self.timings['motion'] += time.perf_counter() - started
+        if code >= 500 and data.get('resumable') and not self.stopping.is_set():
+            logger.warning(f"{route} failed ({data.get('message')}) — resuming scan")
+            code, data = post_json(f"{self.motor_url}/resume_scan")
+        return code, data
+
+    def _capture(self, field):
+        started = time.perf_counter()
+        for _ in range(STALE_FRAMES):
+            self.camera.read()
+        frame = self.camera.read()
+        self.timings['capture'] += time.perf_counter() - started
+        if frame is None:
+            raise RuntimeError(f"Camera returned no frame for {field['sample']}")
+        self.frames.put((field, frame))
+
+    def _motion_stage(self):
+        try:
+            code, data = self._motor('/get_samples')
+            while not self.stopping.is_set():
+                status = data.get('status')
+                if status == 'success':
+                    self._capture({k: data.get(k) for k in ('sample', 'sample_number', 'field_type', 'position', 'focus_score')})
+                    code, data = self._motor('/next_sample')
+                elif status == 'switch_objective':
+                    if not self.auto_switch:
+                        self.state = 'awaiting_switch'
+                        logger.info("Switch to the HPF objective, then continue the scan")
+                        waited = time.perf_counter()
+                        self.switched.wait()
+                        self.timings['objective_switch'] += time.perf_counter() - waited
+                        if self.stopping.is_set():
+                            break
+                        self.state = 'running'
+                    code, data = self._motor('/continue_after_switch')
+                elif status == 'complete':
+                    break
+                else:
+                    raise RuntimeError(f"Motor server: {data.get('message', status)} (HTTP {code})")
+        except Exception as e:
+            logger.error(f"Scan {self.id} motion stage failed: {e}")
+            self.error = str(e)
+        finally:
+            if self.stopping.is_set() or self.error:
+                post_json(f"{self.motor_url}/stop")
+            self.frames.put(_DONE)
+
+    # --- stage 2: encode ---
+
+    def _encode_stage(self):
+        while True:
+            item = self.frames.get()
+            if item is _DONE:
+                break
+            field, frame = item
+            started = time.perf_counter()
+            ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+            self.timings['encode'] += time.perf_counter() - started
+            if ok:
+                self.encoded.put((field, jpeg.tobytes()))
+        for _ in range(self.workers):
+            self.encoded.put(_DONE)
+
+    # --- stage 3: detect ---
+
+    def _detect_stage(self):
+        while True:
+            item = self.encoded.get()
+            if item is _DONE:
+                break
+            field, jpeg = item
+            started = time.perf_counter()
+            try:
+                fields = {
+                    'test_id': self.id,
+                    'field_type': field['field_type'],
+                    'image_index': field['sample_number'],
+                }
+                if self.conf is not None:
+                    fields['conf'] = self.conf
+                detection = post_image(self.detector_url, jpeg, f"{field['sample']}.jpg", fields)
+            except Exception as e:
+                logger.error(f"Detection failed for {field['sample']}: {e}")
+                detection = {'success': False, 'error': str(e)}
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.timings['detect'] += elapsed
+            if detection.get('success'):
+                self._report_counts(field, detection)
+            self.results.put((field, jpeg, detection, elapsed))
+        self.results.put(_DONE)
+
+    def _report_counts(self, field, detection):
+        try:
+            post_json(f"{self.motor_url}/field_result", {
+                'sample': field['sample'],
+                'by_class': detection.get('summary', {}).get('by_class', {}),
+            }, timeout=5)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not report counts for {field['sample']}: {e}")
+
+    # --- stage 4: store ---
+
+    def _store_stage(self):
+        remaining = self.workers
+        with open(os.path.join(self.dir, 'results.jsonl'), 'a') as log:
+            while remaining:
+                item = self.results.get()
+                if item is _DONE:
+                    remaining -= 1
+                    continue
+                field, jpeg, detection, elapsed = item
+                started = time.perf_counter()
+                image_name = f"{field['sample']}.jpg"
+                with open(os.path.join(self.dir, image_name), 'wb') as f:
+                    f.write(jpeg)
+                record = dict(field, image=image_name, detect_seconds=round(elapsed, 3),
+                              success=detection.get('success', False),
+                              summary=detection.get('summary', {'total_detections': 0, 'by_class': {}}),
+                              predictions=detection.get('predictions', []), error=detection.get('error'))
+                log.write(json.dumps(record) + '\n')
+                log.flush()
+                self.fields.append(record)
+                self.timings['store'] += time.perf_counter() - started
+        self._finish()
+
+    def _finish(self):
+        if self.fields:
+            started = time.perf_counter()
+            try:
+                self.mosaics = build_scan_mosaics(self.dir)
+            except Exception as e:
+                logger.error(f"Scan {self.id} mosaic failed: {e}")
+            self.timings['mosaic'] += time.perf_counter() - started
+        self.finished = time.perf_counter()
+        if self.error:
+            self.state = 'failed'
+        elif self.stopping.is_set():
+            self.state = 'stopped'
+        else:
+            self.state = 'complete'
+        with open(os.path.join(self.dir, 'summary.json'), 'w') as f:
+            json.dump(self.summary(), f, indent=4)
+        logger.info(f"Scan {self.id} {self.state}: {len(self.fields)} fields, timings {self.summary_timings()}")
+        self.done.set()
+
+    def summary(self):
+        by_objective = {}
+        for record in self.fields:
+            totals = by_objective.setdefault(record['field_type'], {'fields': 0, 'total_detections': 0, 'by_class': {}})
+            totals['fields'] += 1
+            totals['total_detections'] += record['summary'].get('total_detections', 0)
+            for name, count in record['summary'].get('by_class', {}).items():
+                totals['by_class'][name] = totals['by_class'].get(name, 0) + count
+        return {
+            'scan_id': self.id,
+            'state': self.state,
+            'error': self.error,
+            'fields': len(self.fields),
+            'failed_detections': sum(1 for r in self.fields if not r['success']),
+            'by_objective': by_objective,
+            'mosaics': {field_type: layout and layout['dzi'] for field_type, layout in self.mosaics.items()},
+            'timings': self.summary_timings(),
+        }
+
+# ---------------------------------------------------------------------------
+# HTTP service
+# ---------------------------------------------------------------------------
+
+def create_service(args):
+    from flask import Flask, request, jsonify, send_from_directory
+    from flask_cors import CORS
+
+    app = Flask(__name__)
+    CORS(app, resources={r"/*": {"origins": ["*"]}})
+    runs = {}
+
+    def active_run():
+        return next((run for run in runs.values() if not run.done.is_set()), None)
+
+    @app.route('/scans', methods=['POST'])
+    def start_scan():
+        """Body (all optional): {"camera": spec, "conf": 0.25, "auto_switch": false}
+
+        Without "conf" the YOLO service uses its per-objective threshold.
+        """
+        if active_run():
+            return jsonify({'status': 'error', 'message': 'A scan is already running'}), 409
+        data = request.json or {}
+        camera = open_camera(data.get('camera', args.camera))
+        if camera is None:
+            return jsonify({'status': 'error', 'message': 'Camera not available'}), 503
+        conf = data.get('conf', args.conf)
+        run = ScanRun(camera, args.motor_url, args.detector_url, None if conf is None else float(conf),
+                      bool(data.get('auto_switch', args.auto_switch)), args.out, args.workers)
+        runs[run.id] = run.start()
+        return jsonify({'status': 'success', 'scan_id': run.id}), 202
+
+    @app.route('/scans/<scan_id>')
+    def scan_progress(scan_id):
+        run = runs.get(scan_id)
+        if run is None:
+            return jsonify({'status': 'error', 'message': 'Unknown scan'}), 404
+        return jsonify(run.progress())
+
+    @app.route('/scans/<scan_id>/results')
+    def scan_results(scan_id):
+        run = runs.get(scan_id)
+        if run is None:
+            return jsonify({'status': 'error', 'message': 'Unknown scan'}), 404
+        return jsonify(dict(run.summary(), results=run.fields))
+
+    @app.route('/scans/<scan_id>/mosaic/<path:path>')
+    def scan_mosaic(scan_id, path):
+        """Mosaic files: <field_type>.dzi / .json and <field_type>_files/<level>/<col>_<row>.jpg."""
+        if scan_id.startswith('.'):
+            return jsonify({'status': 'error', 'message': 'Unknown scan'}), 404
+        # send_from_directory refuses paths that leave the mosaic folder.
+        return send_from_directory(os.path.join(args.out, scan_id, 'mosaic'), path, max_age=3600)
+
+    @app.route('/scans/<scan_id>/mosaic', methods=['POST'])
+    def scan_build_mosaic(scan_id):
+        """Rebuild a finished scan's mosaics (e.g. after calibrating PIXELS_PER_UNIT)."""
+        run = runs.get(scan_id)
+        if run is not None and not run.done.is_set():
+            return jsonify({'status': 'error', 'message': 'Scan still running'}), 409
+        scan_dir = os.path.join(args.out, scan_id)
+        if scan_id.startswith('.') or not os.path.isfile(os.path.join(scan_dir, 'results.jsonl')):
+            return jsonify({'status': 'error', 'message': 'Unknown scan'}), 404
+        layouts = build_scan_mosaics(scan_dir)
+        return jsonify({'status': 'success', 'mosaics': layouts})
+
+    @app.route('/scans/<scan_id>/continue', methods=['POST'])
+    def scan_continue(scan_id):
+        run = runs.get(scan_id)
+        if run is None:
+            return jsonify({'status': 'error', 'message': 'Unknown scan'}), 404
+        run.continue_after_switch()
+        return jsonify({'status': 'success'})
+
+    @app.route('/scans/<scan_id>/stop', methods=['POST'])
+    def scan_stop(scan_id):
+        run = runs.get(scan_id)
+        if run is None:
+            return jsonify({'status': 'error', 'message': 'Unknown scan'}), 404
+        run.stop()
+        return jsonify({'status': 'success'})
+
+    return app
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--camera', default='0', help='camera index, stream URL or file:<dir> for replay')
+    parser.add_argument('--motor-url', default=MOTOR_URL)
+    parser.add_argument('--detector-url', default=DETECTOR_URL)
+    parser.add_argument('--conf', type=float, default=None,
+                        help="YOLO confidence threshold (default: the YOLO service's per-objective one)")
+    parser.add_argument('--workers', type=int, default=DETECT_WORKERS, help='concurrent detector requests')
+    parser.add_argument('--auto-switch', action='store_true', help="don't wait for the objective switch")
+    parser.add_argument('--out', default=SCANS_DIR, help='where scan folders are written')
+    parser.add_argument('--serve', action='store_true', help='run as an HTTP service instead of one scan')
+    parser.add_argument('--port', type=int, default=3002)
+    return parser.parse_args()
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args()
+    if not CV2_AVAILABLE:
+        logger.error("OpenCV is required: pip install opencv-python-headless")
+        return 1
+    if args.serve:
+        create_service(args).run(host='0.0.0.0', port=args.port)
+        return 0
+
+    camera = open_camera(args.camera)
+    if camera is None:
+        return 1
+    run = ScanRun(camera, args.motor_url, args.detector_url, args.conf, args.auto_switch, args.out, args.workers)
+    run.start()
+    try:
+        while not run.wait(0.5):
+            if run.state == 'awaiting_switch' and not run.switched.is_set():
+                input("Switch to the 40x (HPF) objective and press Enter... ")
+                run.continue_after_switch()
+    except KeyboardInterrupt:
+        run.stop()
+        run.wait()
+    camera.close()
+    print(json.dumps(run.summary(), indent=4))
+    return 0 if run.state == 'complete' else 1
+
+if __name__ == '__main__':
+    raise SystemExit(main())
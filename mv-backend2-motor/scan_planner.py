@@ -0,0 +1,244 @@
+"""
+Scan Planner
+Builds the per-objective field plan from the `grid_params` block of
+motor_config.json.
+
+A plan is the ordered list of field positions (motor units, relative to the
+scan origin where the operator parked the stage) plus the relative (dx, dy)
+moves between consecutive fields. Several visiting orders are generated —
+serpentine, raster and spiral, each row- or column-major — and the cheapest
+one is kept. Cost is total travel plus a penalty per axis reversal, because
+the 28BYJ-48 gear train loses motion (backlash) every time an axis changes
+direction.
+
+When the pass starts wherever the previous one ended (LPF -> HPF without a
+trip home), the grid may be entered from any of its four corners; the
+approach move from the current stage position is charged like any other
+move, which typically means running the serpentine in reverse.
+
+Grid coordinates are relative: the LPF column pitch maps to one sensitivity
+step, so the stock 5x2 LPF grid reproduces the original longitudinal strip
+exactly and every other spacing (e.g. the finer HPF grid) scales with it.
+
+An adaptive scan (adaptive_scan.py) may ask for more fields than planned;
+extend_plan() adds them as new rows past the grid edge where the pass ended.
+"""
+
+PATTERNS = ('serpentine', 'raster', 'spiral')
+
+# The stage starts at the top-right field: columns advance to the left (-X),
+# rows advance downwards (+Y).
+X_DIRECTION = -1
+Y_DIRECTION = 1
+
+# (flip_cols, flip_rows) start corners; the origin corner comes first.
+CORNERS = ((False, False), (True, False), (False, True), (True, True))
+
+# Extra travel, in field pitches, charged for every axis reversal.
+REVERSAL_COST = 0.5
+
+DEFAULT_GRID = {'rows': 2, 'cols': 5, 'start_x': 0, 'end_x': 4, 'start_y': 0, 'end_y': 1}
+
+# ---------------------------------------------------------------------------
+# Grid geometry
+# ---------------------------------------------------------------------------
+
+def grid_shape(params):
+    """Return validated (rows, cols) for one objective's grid params."""
+    rows = int(params.get('rows', DEFAULT_GRID['rows']))
+    cols = int(params.get('cols', DEFAULT_GRID['cols']))
+    if rows < 1 or cols < 1:
+        raise ValueError(f"Grid must have at least one row and column, got {rows}x{cols}")
+    return rows, cols
+
+def grid_pitch(params):
+    """Return the (x, y) distance between neighbouring fields, in grid units.
+
+    A single-column (or single-row) grid has no span on that axis, so it
+    borrows the pitch of the other axis.
+    """
+    rows, cols = grid_shape(params)
+    px = abs(float(params.get('end_x', 0)) - float(params.get('start_x', 0))) / (cols - 1) if cols > 1 else 0.0
+    py = abs(float(params.get('end_y', 0)) - float(params.get('start_y', 0))) / (rows - 1) if rows > 1 else 0.0
+    px = px or py or 1.0
+    py = py or px
+    return px, py
+
+def objective_params(grid_params, field_type):
+    """Grid params for `field_type`, falling back to the stock 5x2 grid."""
+    return (grid_params or {}).get(field_type) or DEFAULT_GRID
+
+def motor_scale(grid_params, sensitivity):
+    """Motor units per grid unit: one LPF column pitch == one sensitivity step."""
+    reference_pitch, _ = grid_pitch(objective_params(grid_params, 'lpf'))
+    return sensitivity / reference_pitch
+
+# ---------------------------------------------------------------------------
+# Visiting orders
+# ---------------------------------------------------------------------------
+
+def _row_major_cells(rows, cols, pattern):
+    """Visit order as (col, row) cells, starting at (0, 0), rows outermost."""
+    if pattern == 'serpentine':
+        cells = []
+        for r in range(rows):
+            cs = range(cols) if r % 2 == 0 else range(cols - 1, -1, -1)
+            cells.extend((c, r) for c in cs)
+        return cells
+    if pattern == 'raster':
+        return [(c, r) for r in range(rows) for c in range(cols)]
+    if pattern == 'spiral':
+        # Outside-in, along the first row, down the far column, back along
+        # the last row and up the near column, then repeat one ring inside.
+        cells = []
+        top, bottom, left, right = 0, rows - 1, 0, cols - 1
+        while top <= bottom and left <= right:
+            cells.extend((c, top) for c in range(left, right + 1))
+            cells.extend((right, r) for r in range(top + 1, bottom + 1))
+            if top < bottom:
+                cells.extend((c, bottom) for c in range(right - 1, left - 1, -1))
+            if left < right:
+                cells.extend((left, r) for r in range(bottom - 1, top, -1))
+            top, bottom, left, right = top + 1, bottom - 1, left + 1, right - 1
+        return cells
+    raise ValueError(f"Unknown scan pattern '{pattern}'. Expected one of {PATTERNS}")
+
+def visit_order(rows, cols, pattern, column_major=False, corner=(False, False)):
+    """Return the (col, row) cells of a rows x cols grid in visiting order.
+
+    `corner` is a (flip_cols, flip_rows) pair: the order is mirrored so it
+    starts from that corner of the grid instead of (0, 0).
+    """
+    if column_major:
+        cells = [(c, r) for r, c in _row_major_cells(cols, rows, pattern)]
+    else:
+        cells = _row_major_cells(rows, cols, pattern)
+    flip_cols, flip_rows = corner
+    return [(cols - 1 - c if flip_cols else c, rows - 1 - r if flip_rows else r) for c, r in cells]
+
+# ---------------------------------------------------------------------------
+# Cost model
+# ---------------------------------------------------------------------------
+
+def relative_moves(positions):
+    """Relative (dx, dy) moves between consecutive positions."""
+    return [(round(x1 - x0, 6), round(y1 - y0, 6))
+            for (x0, y0), (x1, y1) in zip(positions, positions[1:])]
+
+def count_reversals(moves):
+    """Number of times either axis changes direction across `moves`."""
+    reversals = 0
+    for axis in (0, 1):
+        last = 0
+        for move in moves:
+            sign = (move[axis] > 0) - (move[axis] < 0)
+            if sign == 0:
+                continue
+            if last and sign != last:
+                reversals += 1
+            last = sign
+    return reversals
+
+def travel_distance(moves):
+    """Total axis travel. The firmware drives X then Y, so distances add."""
+    return sum(abs(dx) + abs(dy) for dx, dy in moves)
+
+def plan_cost(moves, pitch):
+    return travel_distance(moves) + REVERSAL_COST * pitch * count_reversals(moves)
+
+# ---------------------------------------------------------------------------
+# Plan construction
+# ---------------------------------------------------------------------------
+
+def build_plan(grid_params, field_type, sensitivity, pattern=None, start=None):
+    """Build the cheapest scan plan for one objective.
+
+    `pattern` (or a `pattern` key in the objective's grid params) restricts
+    the search to one family; otherwise every family is considered. Returns a
+    dict with the chosen order, the field `positions`, the `moves` between
+    them and the travel/reversal figures used to pick it.
+
+    Without `start` the pass begins at the origin field. With `start` — the
+    current (x, y) stage position relative to the scan origin — any corner
+    may be used and `approach` holds the (dx, dy) move to the first field.
+    """
+    params = objective_params(grid_params, field_type)
+    rows, cols = grid_shape(params)
+    px, py = grid_pitch(params)
+    scale = motor_scale(grid_params, sensitivity)
+    step_x, step_y = px * scale, py * scale
+
+    pattern = pattern or params.get('pattern') or 'auto'
+    families = PATTERNS if pattern == 'auto' else (pattern,)
+    for family in families:
+        if family not in PATTERNS:
+            raise ValueError(f"Unknown scan pattern '{family}'. Expected one of {PATTERNS}")
+
+    corners = CORNERS if start is not None else CORNERS[:1]
+
+    best = None
+    for family in families:
+        for column_major in (False, True):
+            for corner in corners:
+                cells = visit_order(rows, cols, family, column_major, corner)
+                positions = [(round(X_DIRECTION * c * step_x, 6), round(Y_DIRECTION * r * step_y, 6))
+                             for c, r in cells]
+                moves = relative_moves(positions)
+                approach = None
+                if start is not None:
+                    approach = relative_moves([tuple(start), positions[0]])[0]
+                costed = ([approach] if approach else []) + moves
+                cost = plan_cost(costed, (step_x + step_y) / 2)
+                # Strict comparison keeps the first (serpentine, row-major) plan on ties.
+                if best is None or cost < best['cost'] - 1e-9:
+                    best = {
+                        'field_type': field_type,
+                        'pattern': family,
+                        'column_major': column_major,
+                        'corner': corner,
+                        'rows': rows,
+                        'cols': cols,
+                        'fields': len(positions),
+                        'extent': (round((cols - 1) * step_x, 6), round((rows - 1) * step_y, 6)),
+                        'pitch': (step_x, step_y),
+                        'positions': positions,
+                        'approach': approach,
+                        'moves': moves,
+                        'travel': round(travel_distance(costed), 6),
+                        'reversals': count_reversals(costed),
+                        'cost': cost,
+                    }
+    return best
+
+def extend_plan(plan, count=1):
+    """Append `count` fields beyond the grid to `plan` (in place).
+
+    Extra fields fill new rows past the grid edge nearest the pass's last
+    grid field, serpentine from that field's column, so each one is fresh
+    ground one pitch from the previous field and nothing is counted twice.
+    Returns the (dx, dy) moves to the new fields.
+    """
+    rows, cols = plan['rows'], plan['cols']
+    step_x, step_y = plan['pitch']
+    grid_fields = rows * cols
+    last_x, last_y = plan['positions'][grid_fields - 1]
+    last_col = round(abs(last_x) / step_x)
+    last_row = round(abs(last_y) / step_y)
+    # Grow away from the grid on the side the pass ended nearest to.
+    if last_row >= (rows - 1) / 2:
+        edge, side = rows - 1, 1
+    else:
+        edge, side = 0, -1
+    first_cols = list(range(cols)) if last_col <= (cols - 1) / 2 else list(range(cols - 1, -1, -1))
+
+    new = []
+    for k in range(len(plan['positions']) - grid_fields, len(plan['positions']) - grid_fields + count):
+        row, offset = divmod(k, cols)
+        order = first_cols if row % 2 == 0 else first_cols[::-1]
+        new.append((round(X_DIRECTION * order[offset] * step_x, 6),
+                    round(Y_DIRECTION * (edge + side * (row + 1)) * step_y, 6)))
+    moves = relative_moves([tuple(plan['positions'][-1])] + new)
+    plan['positions'] = [tuple(p) for p in plan['positions']] + new
+    plan['moves'] = [tuple(m) for m in plan['moves']] + moves
+    plan['fields'] = len(plan['positions'])
+    return moves
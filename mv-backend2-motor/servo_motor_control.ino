@@ -2,9 +2,10 @@
  * Stepper Motor Control for X and Y Axis
  * MicroView AI - Urinalysis System
  *
- * Controls two stepper motors (ULN2003 + 28BYJ-48)
+ * Controls three stepper motors (ULN2003 + 28BYJ-48)
  * Y-axis: Pins 4, 5, 6, 7
  * X-axis: Pins 8, 9, 10, 11
+ * Z-axis (focus knob): Pins A0, A1, A2, A3
  *
  * The Arduino is "dumb muscle" — it only moves motors.
  * The Flask server is the "brain" — it calculates WHERE to move
@@ -15,10 +16,29 @@
  *   HOME        → returns to origin (0,0), responds "STABLE_READY"
  *   ZERO        → marks current position as origin (no movement), responds "STABLE_READY"
  *   MOVE dx,dy  → relative move by dx,dy units, responds "STABLE_READY"
+ *   SETPOS x,y  → sets the step counters (no movement), responds "STABLE_READY".
+ *                 Used by the server to restore position after a reset.
+ *   SETTLE ms   → fixed settle time after each move (0 = reply immediately,
+ *                 the server then waits for the camera image to settle),
+ *                 responds "OK"
+ *   SETTLE AUTO → adaptive settle time from the move length, responds "OK"
+ *   FOCUS dz    → relative focus move by dz Z steps (not units), responds
+ *                 "STABLE_READY". The server keeps the focus position;
+ *                 HOME and ZERO do not touch Z.
  *
- * All MOVE values are in "units". Converted to steps via UNITS_TO_STEPS.
- * After every move, waits SETTLE_TIME_MS before responding — this
+ * All MOVE values are in "units". Converted to steps via UNITS_TO_STEPS,
+ * rounded to the nearest step so the server's position tracking (which
+ * quantizes moves the same way) always agrees with totalXSteps/totalYSteps.
+ * After every move, waits for the stage to settle before responding — this
  * prevents the camera from capturing while the stage is still vibrating.
+ *
+ * A reset (brown-out, USB re-enumeration) zeroes totalXSteps/totalYSteps
+ * while the stage stays where it was. Until the server sends SETPOS or ZERO
+ * after boot, MOVE and FOCUS replies are preceded by "POSITION UNSET", and
+ * HOME (which would drive to the wrong origin) is refused with
+ * "ERROR: POSITION UNSET". The server answers either by restoring its
+ * tracked position with SETPOS, so a reset whose boot banner was missed
+ * still cannot corrupt the counters.
  */
 
 #include <Stepper.h>
@@ -27,12 +47,14 @@
 // Different steps-per-revolution to compensate for hardware differences
 const int X_STEPS_PER_REV = 1024;  // X motor
 const int Y_STEPS_PER_REV = 1024;  // Y motor (needs more steps for same travel)
+const int Z_STEPS_PER_REV = 2048;  // Z motor on the fine focus knob
 const int MOTOR_SPEED = 12;        // RPM (higher = faster, but may skip steps)
 
 // Pin order for ULN2003 driver
 // X-axis: reversed (4-2-3-1) so first scan direction is counter-clockwise
 Stepper stepperX(X_STEPS_PER_REV, 11, 9, 10, 8);
 Stepper stepperY(Y_STEPS_PER_REV, 4, 6, 5, 7);
+Stepper stepperZ(Z_STEPS_PER_REV, A0, A2, A1, A3);
 
 // === TUNING ===
 // How many motor steps per 1.0 "unit" from Flask (per axis).
@@ -45,15 +67,31 @@ const float Y_UNITS_TO_STEPS = 400.0;  // 1 unit = 400 steps on Y (2048 SPR)
 // This lets vibrations die down before the camera captures.
 const int SETTLE_TIME_MS = 600;
 
+// Adaptive settle: a short field-to-field hop rings far less than a long
+// traverse, so the wait grows with the longest axis move, capped at
+// SETTLE_TIME_MS.
+const int SETTLE_MIN_MS = 80;
+const float SETTLE_MS_PER_STEP = 0.5;
+
+// Focus moves are small and barely shake the stage.
+const int FOCUS_SETTLE_MS = 50;
+
 // === STATE ===
 // Tracks accumulated steps from origin so HOME can return.
 long totalXSteps = 0;
 long totalYSteps = 0;
 
+// False from boot until SETPOS or ZERO set the counters.
+bool positionSet = false;
+
+// Settle mode set by SETTLE: fixed milliseconds (>= 0) or adaptive (-1).
+long settleMs = SETTLE_TIME_MS;
+
 void setup() {
   Serial.begin(9600);
   stepperX.setSpeed(MOTOR_SPEED);
   stepperY.setSpeed(MOTOR_SPEED);
+  stepperZ.setSpeed(MOTOR_SPEED);
 
   Serial.println("=== Stepper Control System Ready ===");
   Serial.println("OK");
@@ -72,8 +110,41 @@ void loop() {
       // Used when user manually positions stage at top-left before scanning.
       totalXSteps = 0;
       totalYSteps = 0;
+      positionSet = true;
+      Serial.println("STABLE_READY");
+    }
+    else if (command.startsWith("SETPOS ")) {
+      // Restore accumulated steps after a reset — NO motor movement.
+      // The server tracks the absolute position and pushes it back here
+      // so HOME still returns to the scan origin.
+      int commaIndex = command.indexOf(',');
+      if (commaIndex > 0) {
+        totalXSteps = command.substring(7, commaIndex).toInt();
+        totalYSteps = command.substring(commaIndex + 1).toInt();
+        positionSet = true;
+        Serial.println("STABLE_READY");
+      }
+    }
+    else if (command.startsWith("SETTLE ")) {
+      String arg = command.substring(7);
+      arg.trim();
+      settleMs = arg.equalsIgnoreCase("AUTO") ? -1 : arg.toInt();
+      Serial.println("OK");
+    }
+    else if (command.startsWith("FOCUS ")) {
+      long stepsZ = command.substring(6).toInt();
+      warnIfPositionUnset();
+      if (stepsZ != 0) {
+        stepperZ.step(stepsZ);
+        powerDown();
+        delay(FOCUS_SETTLE_MS);
+      }
       Serial.println("STABLE_READY");
     }
+    else if (command.startsWith("HOME") && !positionSet) {
+      // The counters were zeroed by a reset; HOME would stop short of the origin.
+      Serial.println("ERROR: POSITION UNSET");
+    }
     else if (command.startsWith("HOME")) {
       // Physically return to origin by reversing all accumulated steps.
       Serial.print("Returning to origin: X=");
@@ -81,11 +152,13 @@ void loop() {
       Serial.print(" Y=");
       Serial.println(-totalYSteps);
 
-      doMove(-totalXSteps, -totalYSteps);
+      long homeX = -totalXSteps;
+      long homeY = -totalYSteps;
+      doMove(homeX, homeY);
       totalXSteps = 0;
       totalYSteps = 0;
 
-      delay(SETTLE_TIME_MS);
+      settle(homeX, homeY);
       Serial.println("STABLE_READY");
     }
     else if (command.startsWith("MOVE ")) {
@@ -95,8 +168,8 @@ void loop() {
         float dx = command.substring(5, commaIndex).toFloat();
         float dy = command.substring(commaIndex + 1).toFloat();
 
-        long stepsX = (long)(dx * X_UNITS_TO_STEPS);
-        long stepsY = (long)(dy * Y_UNITS_TO_STEPS);
+        long stepsX = lround(dx * X_UNITS_TO_STEPS);
+        long stepsY = lround(dy * Y_UNITS_TO_STEPS);
 
         Serial.print("Move: dx=");
         Serial.print(dx);
@@ -107,18 +180,36 @@ void loop() {
         Serial.print(" Y=");
         Serial.print(stepsY);
         Serial.println(")");
+        warnIfPositionUnset();
 
         doMove(stepsX, stepsY);
         totalXSteps += stepsX;
         totalYSteps += stepsY;
 
-        delay(SETTLE_TIME_MS);
+        settle(stepsX, stepsY);
         Serial.println("STABLE_READY");
       }
     }
   }
 }
 
+void warnIfPositionUnset() {
+  if (!positionSet) {
+    Serial.println("POSITION UNSET");
+  }
+}
+
+void settle(long stepsX, long stepsY) {
+  long ms = settleMs;
+  if (ms < 0) {
+    long longest = max(labs(stepsX), labs(stepsY));
+    ms = min((long)SETTLE_TIME_MS, (long)(SETTLE_MIN_MS + SETTLE_MS_PER_STEP * longest));
+  }
+  if (ms > 0) {
+    delay(ms);
+  }
+}
+
 void doMove(long stepsX, long stepsY) {
   if (stepsX != 0) {
     stepperX.step(stepsX);
@@ -127,10 +218,15 @@ void doMove(long stepsX, long stepsY) {
     stepperY.step(stepsY);
   }
 
+  powerDown();
+}
 
+void powerDown() {
   // Power down all motor pins to prevent overheating
   digitalWrite(4, LOW); digitalWrite(5, LOW);
   digitalWrite(6, LOW); digitalWrite(7, LOW);
   digitalWrite(8, LOW); digitalWrite(9, LOW);
   digitalWrite(10, LOW); digitalWrite(11, LOW);
+  digitalWrite(A0, LOW); digitalWrite(A1, LOW);
+  digitalWrite(A2, LOW); digitalWrite(A3, LOW);
 }
@@ -0,0 +1,78 @@
+"""
+Settle Detection
+Decides when the stage is still enough to capture, instead of always
+waiting a fixed 600 ms after a move.
+
+- adaptive_settle_seconds(): the firmware's SETTLE AUTO rule — a short hop
+  rings far less than a long traverse, so the wait scales with the longest
+  axis move, capped at the old fixed delay.
+- wait_until_still(): watches the camera and returns as soon as consecutive
+  frames stop changing. Frames are reduced to a small grayscale thumbnail
+  first, so the per-frame cost is a resize and one vectorized absdiff.
+"""
+
+import logging
+import time
+
+try:
+    import cv2
+    import numpy as np
+    CV2_AVAILABLE = True
+except ImportError:
+    cv2 = None
+    np = None
+    CV2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Must match SETTLE_TIME_MS / SETTLE_MIN_MS / SETTLE_MS_PER_STEP in the firmware.
+SETTLE_TIME_MS = 600
+SETTLE_MIN_MS = 80
+SETTLE_MS_PER_STEP = 0.5
+
+# Thumbnail the frame difference is measured on.
+THUMBNAIL_SIZE = (80, 60)
+# Mean absolute gray-level change (0-255) below which two frames count as equal.
+STILL_THRESHOLD = 1.5
+# Consecutive still frame pairs required.
+STILL_FRAMES = 2
+
+def adaptive_settle_seconds(steps_x, steps_y):
+    """Settle time the firmware uses in SETTLE AUTO mode."""
+    longest = max(abs(steps_x), abs(steps_y))
+    return min(SETTLE_TIME_MS, SETTLE_MIN_MS + SETTLE_MS_PER_STEP * longest) / 1000.0
+
+def thumbnail(frame):
+    """Downscaled grayscale copy of a BGR (or gray) frame."""
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(frame, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+
+def frame_difference(a, b):
+    """Mean absolute difference between two thumbnails."""
+    return float(np.mean(cv2.absdiff(a, b)))
+
+def wait_until_still(camera, timeout, threshold=STILL_THRESHOLD, still_frames=STILL_FRAMES):
+    """Read frames until the image stops changing or `timeout` elapses.
+
+    Returns a dict with `settled`, `elapsed` seconds, the last `difference`
+    and the number of `frames` read. A camera that stops delivering frames
+    ends the wait unsettled.
+    """
+    started = time.perf_counter()
+    previous, difference, frames, still = None, None, 0, 0
+    while time.perf_counter() - started < timeout:
+        frame = camera.read()
+        if frame is None:
+            break
+        frames += 1
+        current = thumbnail(frame)
+        if previous is not None:
+            difference = frame_difference(previous, current)
+            still = still + 1 if difference < threshold else 0
+            if still >= still_frames:
+                return {'settled': True, 'elapsed': time.perf_counter() - started,
+                        'difference': difference, 'frames': frames}
+        previous = current
+    return {'settled': False, 'elapsed': time.perf_counter() - started,
+            'difference': difference, 'frames': frames}
@@ -0,0 +1,59 @@
+"""
+Stage Backends
+How a motor server obtains its connection to the stage. Every backend
+returns an open pyserial connection speaking the firmware protocol
+(STATUS / HOME / ZERO / SETPOS / MOVE dx,dy), or None if no stage is
+available:
+
+    serial  — a real Arduino found by port discovery (default)
+    sim     — the ArduinoSimulator from stage_sim.py on a local pty
+
+Select with MOTOR_STAGE_BACKEND=serial|sim; the simulator is tuned with
+the MOTOR_SIM_* variables (see stage_sim.simulator_from_env).
+"""
+
+import logging
+import os
+
+from port_discovery import find_arduino_port, probe_port
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = 'serial'
+
+_simulator = None
+
+def open_serial_stage(cache_file, baud):
+    return find_arduino_port(cache_file, baud)
+
+def get_simulator():
+    """The process-wide simulator, started (or re-plugged) on demand."""
+    global _simulator
+    # Imported lazily: the pty-based simulator is POSIX-only and the laptop
+    # edition also runs on Windows.
+    from stage_sim import simulator_from_env
+    if _simulator is None:
+        _simulator = simulator_from_env()
+        _simulator.start()
+    elif not _simulator.connected:
+        _simulator.replug()
+    return _simulator
+
+def open_simulated_stage(cache_file, baud):
+    return probe_port(get_simulator().port, baud)
+
+BACKENDS = {
+    'serial': open_serial_stage,
+    'sim': open_simulated_stage,
+}
+
+def configured_backend():
+    backend = os.environ.get('MOTOR_STAGE_BACKEND', DEFAULT_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown MOTOR_STAGE_BACKEND '{backend}'. Expected one of {sorted(BACKENDS)}")
+    return backend
+
+def open_stage(backend, cache_file, baud):
+    """Open the stage connection for `backend`."""
+    logger.info(f"Opening stage via '{backend}' backend")
+    return BACKENDS[backend](cache_file, baud)
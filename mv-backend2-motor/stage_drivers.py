@@ -0,0 +1,485 @@
+"""
+Stage Drivers
+One interface over the ways a motor server can move the stage, so the scan
+logic (scan_controller.py) is written once for every platform:
+
+    SerialStageDriver — Arduino running servo_motor_control.ino, found by
+                        port discovery ('serial') or the pty simulator
+                        ('sim'); reconnects in the background and restores
+                        the firmware's step counters after a reset
+    GpioStageDriver   — step/dir drivers wired to Raspberry Pi GPIO pins,
+                        played by gpio_stepper.StepperEngine
+
+Every driver keeps the absolute stage position in motor steps since the last
+ZERO/HOME and only counts a move once it has completed, so the scan
+checkpoint and the physical stage never disagree. The focus (Z) axis, where
+there is one, is counted the same way from where it stood at connect time;
+ZERO and HOME leave it alone.
+"""
+
+import logging
+import threading
+import time
+
+import serial
+
+from camera import shared_camera
+from gpio_stepper import StepperEngine
+from recovery import ConnectionSupervisor
+from settle_detector import adaptive_settle_seconds, wait_until_still
+from stage_backends import open_stage
+from telemetry import metrics
+
+try:
+    import RPi.GPIO as GPIO
+    GPIO_AVAILABLE = True
+except (ImportError, RuntimeError):
+    GPIO_AVAILABLE = False
+    GPIO = None
+
+logger = logging.getLogger(__name__)
+
+ARDUINO_BAUD = 9600
+
+# Command timeout (seconds)
+COMMAND_TIMEOUT = 60
+
+# Focus moves are a few hundred steps at most.
+FOCUS_TIMEOUT = 10
+
+# How long a scan request waits for the background reconnect before failing.
+RECONNECT_WAIT = 5
+
+# Settle after each move (`settle` in motor_config.json):
+#   fixed    — firmware waits fixed_ms (legacy 600 ms)
+#   adaptive — firmware waits in proportion to the move length (SETTLE AUTO)
+#   camera   — firmware replies at once; the server watches camera frames
+#              until the image is still (needs the camera on this machine)
+SETTLE_MODES = ('fixed', 'adaptive', 'camera')
+DEFAULT_SETTLE = {'mode': 'fixed', 'fixed_ms': 600, 'camera': 0, 'timeout_ms': 1500}
+
+class StageDriver:
+    """Position bookkeeping shared by all drivers.
+
+    Subclasses implement connect(), _step(), zero() and home(); `units_to_steps`
+    is the (x, y) conversion from motor units to whole steps. Drivers with a
+    focus motor set `has_focus` and implement _focus_step().
+    """
+
+    name = 'none'
+    units_to_steps = (1.0, 1.0)
+    has_focus = False
+
+    def __init__(self):
+        self.initialized = False
+        # Same quantity the firmware keeps in totalXSteps/totalYSteps.
+        # `verified` drops to False when a move may or may not have run.
+        self.x_steps = 0
+        self.y_steps = 0
+        self.z_steps = 0
+        self.verified = True
+
+    @property
+    def connected(self):
+        return self.initialized
+
+    def configure(self, config):
+        """Apply the settings block of motor_config.json."""
+
+    def position_units(self):
+        """Tracked (x, y) stage position in motor units, relative to the origin."""
+        return (self.x_steps / self.units_to_steps[0], self.y_steps / self.units_to_steps[1])
+
+    def restore_position(self, x_steps, y_steps):
+        """Adopt a position from a scan checkpoint."""
+        self.x_steps, self.y_steps = x_steps, y_steps
+
+    def move(self, dx, dy):
+        """Relative move in motor units, rounded to whole steps.
+
+        The move only counts towards the tracked position once it completed.
+        """
+        steps_x = round(dx * self.units_to_steps[0])
+        steps_y = round(dy * self.units_to_steps[1])
+        if steps_x == 0 and steps_y == 0:
+            return True
+        if not self._step(steps_x, steps_y):
+            return False
+        self.x_steps += steps_x
+        self.y_steps += steps_y
+        return True
+
+    def move_with_recovery(self, dx, dy):
+        return self.move(dx, dy)
+
+    def focus(self, dz):
+        """Relative focus move by dz motor steps; counted once completed."""
+        if not self.has_focus:
+            logger.warning(f"Stage driver '{self.name}' has no focus axis")
+            return False
+        dz = int(dz)
+        if dz == 0:
+            return True
+        if not self._focus_step(dz):
+            return False
+        self.z_steps += dz
+        return True
+
+    def recover(self):
+        """Wait for a lost link to come back. Returns True when usable."""
+        return self.initialized
+
+    def status(self):
+        """Driver-specific fields for /status."""
+        return {}
+
+    def _origin_reset(self):
+        self.x_steps = self.y_steps = 0
+        self.verified = True
+
+# ---------------------------------------------------------------------------
+# Arduino over serial (real board or simulator)
+# ---------------------------------------------------------------------------
+
+class SerialStageDriver(StageDriver):
+    """Arduino stepper firmware over a serial link.
+
+    `backend` selects how the link is opened ('serial' or 'sim', see
+    stage_backends.py); `cache_file` holds the last-known-good port.
+    """
+
+    # Must match X_UNITS_TO_STEPS / Y_UNITS_TO_STEPS in servo_motor_control.ino.
+    units_to_steps = (200.0, 400.0)
+    has_focus = True
+
+    def __init__(self, backend, cache_file, baud=ARDUINO_BAUD):
+        super().__init__()
+        self.name = backend
+        self.cache_file = cache_file
+        self.baud = baud
+        self.serial = None
+        # Serializes access to the port between request threads and the supervisor.
+        self.lock = threading.RLock()
+        self.needs_resync = False
+        self.settle = dict(DEFAULT_SETTLE)
+        self.settle_camera = None
+        self.supervisor = ConnectionSupervisor(self.reconnect)
+        self.supervisor.start()
+
+    @property
+    def connected(self):
+        return self.supervisor.connected
+
+    @property
+    def port(self):
+        return self.serial.port if self.serial and self.serial.is_open else None
+
+    def configure(self, config):
+        if (config.get('settle') or {}).get('mode') in SETTLE_MODES:
+            previous = dict(self.settle)
+            self.settle.update(config['settle'])
+            if self.initialized and self.settle != previous:
+                self.apply_settle_mode()
+
+    def status(self):
+        return {
+            'settle_mode': self.settle.get('active', 'firmware default'),
+            'reconnects': self.supervisor.reconnects,
+        }
+
+    # --- connection ---
+
+    def connect(self):
+        if self.serial and self.serial.is_open:
+            return True
+        with self.lock:
+            self.serial = open_stage(self.name, self.cache_file, self.baud)
+        self.initialized = self.serial is not None
+        if self.initialized:
+            logger.info("Arduino initialized successfully")
+            self.apply_settle_mode()
+            self.supervisor.report_connected()
+        else:
+            logger.warning("Arduino initialization failed — no device found")
+        return self.initialized
+
+    def reconnect(self):
+        """Supervisor callback: reopen the Arduino and restore its step counters.
+
+        A USB drop usually resets the board, which zeroes totalXSteps and
+        totalYSteps while the stage stays put, so the tracked position is
+        pushed back with SETPOS.
+        """
+        with self.lock:
+            if self.serial:
+                try:
+                    self.serial.close()
+                except Exception:
+                    pass
+            self.serial = open_stage(self.name, self.cache_file, self.baud)
+            self.initialized = self.serial is not None
+            if not self.initialized:
+                return False
+            self._mark_reset()
+            return self.resync_position()
+
+    def restore_position(self, x_steps, y_steps):
+        super().restore_position(x_steps, y_steps)
+        self.needs_resync = True
+
+    def resync_position(self):
+        """Restore the firmware's step counters from the tracked position,
+        and its settle mode if a reset reverted it to the default."""
+        result = self.send_command(f"SETPOS {self.x_steps},{self.y_steps}", timeout=5)
+        if result:
+            self.needs_resync = False
+            logger.info(f"Firmware position restored to X={self.x_steps} Y={self.y_steps} steps")
+            if 'active' not in self.settle:
+                self.apply_settle_mode()
+        return result is not None
+
+    def _mark_reset(self):
+        """The board rebooted: its counters and settle mode are back to their defaults."""
+        self.needs_resync = True
+        self.settle.pop('active', None)
+
+    def recover(self):
+        if not self.supervisor.connected and not self.supervisor.wait_connected(RECONNECT_WAIT):
+            return False
+        if self.needs_resync:
+            return self.resync_position()
+        return True
+
+    # --- settle ---
+
+    def apply_settle_mode(self):
+        """Push the configured settle mode to the firmware.
+
+        Camera mode falls back to adaptive when no camera can be opened.
+        """
+        mode = self.settle['mode']
+        if mode == 'camera' and self.settle_camera is None:
+            self.settle_camera = shared_camera(self.settle['camera'])
+            if self.settle_camera is None:
+                logger.warning("Camera settle unavailable — using adaptive settle")
+                mode = 'adaptive'
+        command = {'fixed': f"SETTLE {int(self.settle['fixed_ms'])}", 'adaptive': "SETTLE AUTO",
+                   'camera': "SETTLE 0"}[mode]
+        if self.send_command(command, timeout=2) is None:
+            logger.warning(f"Firmware did not accept '{command}' — it keeps its built-in settle delay")
+            return False
+        self.settle['active'] = mode
+        logger.info(f"Settle mode: {mode}")
+        return True
+
+    def wait_for_settle(self, steps_x, steps_y):
+        """Camera mode: wait until consecutive frames agree the stage is still.
+
+        If the image never settles (or the camera stops delivering), the rest
+        of the adaptive settle time is waited out instead.
+        """
+        result = wait_until_still(self.settle_camera, self.settle['timeout_ms'] / 1000.0)
+        if not result['settled']:
+            remaining = adaptive_settle_seconds(steps_x, steps_y) - result['elapsed']
+            if remaining > 0:
+                time.sleep(remaining)
+            logger.warning(f"Frames did not settle (diff={result['difference']}, {result['frames']} frames)")
+
+    # --- commands ---
+
+    def send_command(self, command, timeout=None):
+        """Send a command to Arduino and wait for STABLE_READY or OK.
+
+        A serial error (USB drop) hands the link to the supervisor, and the
+        firmware boot banner in place of a reply marks a board reset; both
+        return None. A banner left over from a reset while the link was idle
+        is found before the command is written, and a pending resync (SETPOS
+        of the tracked position) is always done before the command itself.
+        A reset nothing else caught shows up as the firmware's
+        "POSITION UNSET" line and queues a resync.
+        """
+        if timeout is None:
+            timeout = COMMAND_TIMEOUT
+        verb = command.split()[0]
+        with self.lock:
+            link = self.serial
+            if not link or not link.is_open:
+                logger.warning(f"Cannot send '{command}': Arduino not connected")
+                return None
+            result = 'timeout'
+            try:
+                if self._reset_while_idle(link):
+                    logger.warning(f"Arduino reset while idle, detected before '{command}'")
+                    self._mark_reset()
+                if self.needs_resync and verb not in ('SETPOS', 'ZERO'):
+                    # Restore the counters first, or the command would act on
+                    # a zeroed position (HOME would stop short of the origin).
+                    if not self.resync_position():
+                        result = 'reset'
+                        return None
+                start = time.perf_counter()
+                link.reset_input_buffer()
+                link.write(f"{command}\n".encode())
+                link.flush()
+                metrics.observe('motor_command_seconds', time.perf_counter() - start, command=verb, phase='write')
+                logger.info(f"Sent: {command}")
+                first_byte = False
+                while (time.perf_counter() - start) < timeout:
+                    if link.in_waiting > 0:
+                        if not first_byte:
+                            first_byte = True
+                            metrics.observe('motor_command_seconds', time.perf_counter() - start,
+                                            command=verb, phase='first_byte')
+                        line = link.readline().decode('utf-8', errors='ignore').strip()
+                        if line:
+                            logger.info(f"Arduino: {line}")
+                            upper = line.upper()
+                            if "SYSTEM READY" in upper:
+                                logger.warning(f"Arduino reset detected while waiting for '{command}'")
+                                self._mark_reset()
+                                result = 'reset'
+                                return None
+                            if "POSITION UNSET" in upper:
+                                # The firmware's counters were zeroed by a reset
+                                # whose banner was never seen.
+                                logger.warning(f"Arduino reports its position unset after '{command}'")
+                                self._mark_reset()
+                                if "ERROR" in upper:
+                                    result = 'reset'
+                                    return None
+                                continue
+                            if "STABLE_READY" in upper or "OK" in upper:
+                                metrics.observe('motor_command_seconds', time.perf_counter() - start,
+                                                command=verb, phase='complete')
+                                result = 'ok'
+                                return line
+                            if "ERROR" in upper:
+                                logger.error(f"Arduino error: {line}")
+                                result = 'error'
+                                return None
+                    time.sleep(0.05)
+                logger.warning(f"'{command}' timed out after {timeout}s")
+            except (serial.SerialException, OSError) as e:
+                logger.error(f"Serial link error for '{command}': {e}")
+                result = 'link_error'
+                self.supervisor.report_lost(e)
+            except Exception as e:
+                logger.error(f"Command error for '{command}': {e}")
+                result = 'error'
+            finally:
+                metrics.increment('motor_commands_total', command=verb, result=result)
+        return None
+
+    def _reset_while_idle(self, link):
+        """Drain output that arrived between commands; True if it holds the
+        boot banner, i.e. the board reset (and zeroed its counters) while idle."""
+        pending = b""
+        while link.in_waiting > 0:
+            pending += link.read(link.in_waiting)
+        for line in pending.decode('utf-8', errors='ignore').splitlines():
+            if line.strip():
+                logger.info(f"Arduino (idle): {line.strip()}")
+        return b"SYSTEM READY" in pending.upper()
+
+    def _step(self, steps_x, steps_y):
+        sx, sy = self.units_to_steps
+        if self.send_command(f"MOVE {steps_x / sx},{steps_y / sy}") is None:
+            if not self.supervisor.connected or self.needs_resync:
+                # The command may have been executed before the link went down.
+                self.verified = False
+            return False
+        if self.settle.get('active') == 'camera':
+            self.wait_for_settle(steps_x, steps_y)
+        return True
+
+    def _focus_step(self, steps_z):
+        return self.send_command(f"FOCUS {steps_z}", timeout=FOCUS_TIMEOUT) is not None
+
+    def move_with_recovery(self, dx, dy):
+        """move(), retried once after a dropped or reset link is restored."""
+        if self.move(dx, dy):
+            return True
+        if self.supervisor.connected and not self.needs_resync:
+            return False
+        logger.warning("Move interrupted by a connection problem — waiting for reconnect")
+        return self.recover() and self.move(dx, dy)
+
+    def zero(self):
+        """ZERO the Arduino: the current position becomes the origin."""
+        result = self.send_command("ZERO", timeout=5)
+        if result:
+            self._origin_reset()
+            self.needs_resync = False
+        return result is not None
+
+    def home(self):
+        """HOME the Arduino: drive back to the origin."""
+        result = self.send_command("HOME", timeout=120)
+        if result is None and self.needs_resync and self.supervisor.connected:
+            # Refused after a reset: HOME again once the counters are restored.
+            result = self.send_command("HOME", timeout=120)
+        if result:
+            self._origin_reset()
+        return result is not None
+
+# ---------------------------------------------------------------------------
+# Raspberry Pi GPIO
+# ---------------------------------------------------------------------------
+
+class GpioStageDriver(StageDriver):
+    """Step/dir drivers on Raspberry Pi GPIO, stepped by StepperEngine."""
+
+    name = 'gpio'
+
+    def __init__(self, pins, units_to_steps, start_rate, max_rate, accel):
+        super().__init__()
+        self.pins = pins
+        self.units_to_steps = units_to_steps
+        self.profile = (start_rate, max_rate, accel)
+        self.stepper = None
+
+    def connect(self):
+        if self.stepper:
+            return True
+        if not GPIO_AVAILABLE:
+            logger.warning("RPi.GPIO not available — GPIO stage disabled")
+            return False
+        try:
+            GPIO.setwarnings(False)
+            GPIO.setmode(GPIO.BCM)
+            for pins in self.pins.values():
+                GPIO.setup(pins['step'], GPIO.OUT)
+                GPIO.setup(pins['dir'], GPIO.OUT)
+                GPIO.setup(pins['enable'], GPIO.OUT)
+                GPIO.output(pins['enable'], GPIO.HIGH)
+            self.stepper = StepperEngine(GPIO, self.pins, *self.profile)
+            self.initialized = True
+            logger.info("GPIO initialized")
+        except Exception as e:
+            logger.error(f"GPIO init error: {e}")
+        return self.initialized
+
+    def status(self):
+        return {'stepping': self.stepper.mode if self.stepper else None}
+
+    def _step(self, steps_x, steps_y):
+        try:
+            # Both axes step together along a precomputed accel/decel profile
+            self.stepper.move(steps_x, steps_y)
+            # Settle by the firmware's SETTLE AUTO rule
+            time.sleep(adaptive_settle_seconds(steps_x, steps_y))
+            return True
+        except Exception as e:
+            logger.error(f"GPIO move error: {e}")
+            self.verified = False
+            return False
+
+    def zero(self):
+        self._origin_reset()
+        return True
+
+    def home(self):
+        if not self._step(-self.x_steps, -self.y_steps):
+            return False
+        self._origin_reset()
+        return True
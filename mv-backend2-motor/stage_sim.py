@@ -0,0 +1,266 @@
+"""
+Simulated Arduino Stage
+Emulates servo_motor_control.ino on a pseudo-terminal so the servers can be
+exercised — and scan throughput benchmarked — without a stage attached.
+
+The simulator speaks the same serial protocol (STATUS, HOME, ZERO, SETPOS,
+SETTLE, MOVE dx,dy, FOCUS dz) on the slave end of a pty, so the server talks to it through
+pyserial exactly as it would to the real board. Motion time is derived from
+the firmware's step rate and settle delay, and faults can be injected:
+
+    sim = ArduinoSimulator(time_scale=0.01, error_rate=0.05)
+    sim.start()
+    serial.Serial(sim.port, 9600)   # -> behaves like the Arduino
+
+Linux/macOS only (uses os.openpty).
+"""
+
+import logging
+import os
+import random
+import re
+import select
+import threading
+import time
+import tty
+
+logger = logging.getLogger(__name__)
+
+# Firmware defaults (servo_motor_control.ino)
+X_UNITS_TO_STEPS = 200.0
+Y_UNITS_TO_STEPS = 400.0
+STEPS_PER_REV = 1024
+MOTOR_RPM = 12
+SETTLE_TIME_MS = 600
+SETTLE_MIN_MS = 80
+SETTLE_MS_PER_STEP = 0.5
+FOCUS_SETTLE_MS = 50
+BOOT_BANNER = "=== Stepper Control System Ready ==="
+
+_LEADING_INT = re.compile(r'\s*[-+]?\d+')
+_LEADING_FLOAT = re.compile(r'\s*[-+]?(\d+\.?\d*|\.\d+)')
+
+def to_int(text):
+    """Arduino String.toInt(): the leading integer, 0 if there is none."""
+    match = _LEADING_INT.match(text)
+    return int(match.group()) if match else 0
+
+def to_float(text):
+    """Arduino String.toFloat(): the leading number, 0.0 if there is none."""
+    match = _LEADING_FLOAT.match(text)
+    return float(match.group()) if match else 0.0
+
+class ArduinoSimulator:
+    """Firmware emulator serving one pty. `port` is the device path to open.
+
+    Args:
+        steps_per_sec: motor speed; defaults to the firmware's 12 RPM.
+        settle_ms: delay after each move before STABLE_READY, until the
+            server changes it with SETTLE.
+        time_scale: multiplier on all simulated delays (0.01 = 100x faster).
+        error_rate: probability a MOVE/HOME answers "ERROR" instead.
+        drop_rate: probability a command gets no reply at all.
+        disconnect_after: unplug the board after this many commands.
+        reset_after: reboot the board (counters zeroed, banner) after this
+            many commands.
+        seed: seed for the fault-injection RNG.
+    """
+
+    def __init__(self, steps_per_sec=None, settle_ms=SETTLE_TIME_MS, time_scale=1.0,
+                 error_rate=0.0, drop_rate=0.0, disconnect_after=None, reset_after=None, seed=None):
+        self.steps_per_sec = steps_per_sec or STEPS_PER_REV * MOTOR_RPM / 60.0
+        self.settle_ms = settle_ms
+        self.time_scale = time_scale
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.disconnect_after = disconnect_after
+        self.reset_after = reset_after
+        self.rng = random.Random(seed)
+
+        self.total_x_steps = 0
+        self.total_y_steps = 0
+        self.position_set = False
+        self.z_steps = 0
+        self.commands = 0
+        self.connected = False
+        self.port = None
+        self._master = None
+        self._slave = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    # --- lifecycle ---
+
+    def start(self):
+        """Plug the board in: create the pty and start answering commands."""
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self.connected = True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='arduino-sim', daemon=True)
+        self._thread.start()
+        self._boot()
+        logger.info(f"Simulated Arduino listening on {self.port}")
+        return self.port
+
+    def stop(self):
+        """Unplug the board: the pty disappears and pending I/O fails."""
+        self._stop.set()
+        self.connected = False
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self._master = self._slave = None
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+
+    def replug(self):
+        """Re-enumerate after a disconnect. Like a USB re-plug, this resets
+        the board and may come back on a different device path."""
+        self.stop()
+        self.total_x_steps = self.total_y_steps = 0
+        self.position_set = False
+        self.commands = 0
+        return self.start()
+
+    # --- protocol ---
+
+    def _boot(self):
+        self._write(BOOT_BANNER)
+        self._write("OK")
+
+    def _write(self, line):
+        if self._master is not None:
+            try:
+                os.write(self._master, f"{line}\r\n".encode())
+            except OSError:
+                pass
+
+    def _wait(self, seconds):
+        self._stop.wait(seconds * self.time_scale)
+
+    def _move(self, steps_x, steps_y):
+        # The firmware drives X fully, then Y, then settles.
+        self._wait((abs(steps_x) + abs(steps_y)) / self.steps_per_sec)
+        settle_ms = self.settle_ms
+        if settle_ms < 0:
+            longest = max(abs(steps_x), abs(steps_y))
+            settle_ms = min(SETTLE_TIME_MS, SETTLE_MIN_MS + SETTLE_MS_PER_STEP * longest)
+        self._wait(settle_ms / 1000.0)
+
+    def handle(self, command):
+        """Execute one command line and return the reply lines."""
+        self.commands += 1
+        if self.drop_rate and self.rng.random() < self.drop_rate:
+            return []
+        if command.startswith("STATUS"):
+            return ["OK"]
+        if command.startswith("ZERO"):
+            self.total_x_steps = self.total_y_steps = 0
+            self.position_set = True
+            return ["STABLE_READY"]
+        if command.startswith("SETTLE "):
+            arg = command[7:].strip()
+            self.settle_ms = -1 if arg.upper() == "AUTO" else to_int(arg)
+            return ["OK"]
+        if command.startswith("SETPOS "):
+            x, comma, y = command[7:].partition(',')
+            if not comma:
+                return []  # the firmware ignores SETPOS without "x,y"
+            self.total_x_steps, self.total_y_steps = to_int(x), to_int(y)
+            self.position_set = True
+            return ["STABLE_READY"]
+        if command.startswith("FOCUS "):
+            steps_z = to_int(command[6:])
+            self._warn_if_position_unset()
+            if steps_z:
+                self._wait(abs(steps_z) / self.steps_per_sec + FOCUS_SETTLE_MS / 1000.0)
+            self.z_steps += steps_z
+            return ["STABLE_READY"]
+        if command.startswith("HOME") or command.startswith("MOVE "):
+            if self.error_rate and self.rng.random() < self.error_rate:
+                return ["ERROR: simulated fault"]
+            if command.startswith("HOME"):
+                if not self.position_set:
+                    return ["ERROR: POSITION UNSET"]
+                steps_x, steps_y = -self.total_x_steps, -self.total_y_steps
+                reply = f"Returning to origin: X={steps_x} Y={steps_y}"
+            else:
+                dx, comma, dy = command[5:].partition(',')
+                if not comma:
+                    return []  # the firmware ignores MOVE without "dx,dy"
+                dx, dy = to_float(dx), to_float(dy)
+                steps_x = round(dx * X_UNITS_TO_STEPS)
+                steps_y = round(dy * Y_UNITS_TO_STEPS)
+                reply = f"Move: dx={dx:.2f} dy={dy:.2f} (steps X={steps_x} Y={steps_y})"
+            self._write(reply)
+            self._warn_if_position_unset()
+            self._move(steps_x, steps_y)
+            self.total_x_steps += steps_x
+            self.total_y_steps += steps_y
+            return ["STABLE_READY"]
+        return []  # the firmware ignores unknown commands
+
+    def _warn_if_position_unset(self):
+        if not self.position_set:
+            self._write("POSITION UNSET")
+
+    def _after_command(self):
+        if self.reset_after and self.commands >= self.reset_after:
+            self.reset_after = None
+            logger.info("Simulated Arduino reset")
+            self.total_x_steps = self.total_y_steps = 0
+            self.position_set = False
+            self._boot()
+        if self.disconnect_after and self.commands >= self.disconnect_after:
+            self.disconnect_after = None
+            logger.info("Simulated USB disconnect")
+            threading.Thread(target=self.stop, daemon=True).start()
+
+    def _run(self):
+        buffer = b""
+        while not self._stop.is_set():
+            try:
+                ready, _, _ = select.select([self._master], [], [], 0.1)
+                if not ready:
+                    continue
+                data = os.read(self._master, 1024)
+            except (OSError, TypeError, ValueError):
+                break
+            if not data:
+                continue
+            buffer += data
+            while b"\n" in buffer:
+                raw, buffer = buffer.split(b"\n", 1)
+                command = raw.decode('utf-8', errors='ignore').strip()
+                if not command:
+                    continue
+                try:
+                    replies = self.handle(command)
+                except Exception:
+                    # Keep serving: one bad command must not unplug the board.
+                    logger.exception(f"Simulator failed on {command!r}")
+                    replies = []
+                for line in replies:
+                    self._write(line)
+                self._after_command()
+
+def simulator_from_env():
+    """Build a simulator from MOTOR_SIM_* environment variables."""
+    def env(name, cast, default=None):
+        value = os.environ.get(f"MOTOR_SIM_{name}")
+        return cast(value) if value not in (None, '') else default
+    return ArduinoSimulator(
+        steps_per_sec=env('STEPS_PER_SEC', float),
+        settle_ms=env('SETTLE_MS', float, SETTLE_TIME_MS),
+        time_scale=env('TIME_SCALE', float, 1.0),
+        error_rate=env('ERROR_RATE', float, 0.0),
+        drop_rate=env('DROP_RATE', float, 0.0),
+        disconnect_after=env('DISCONNECT_AFTER', int),
+        reset_after=env('RESET_AFTER', int),
+        seed=env('SEED', int),
+    )
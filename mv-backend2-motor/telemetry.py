@@ -0,0 +1,159 @@
+"""
+Motion Telemetry
+Where scan wall-clock time goes, exposed on /metrics in the Prometheus text
+format (no client library needed).
+
+    motor_command_seconds{command,phase}   serial command latency, split into
+                                           write (write + flush), first_byte
+                                           (first reply byte) and complete
+                                           (STABLE_READY / OK)
+    motor_commands_total{command,result}   ok | error | timeout | link_error | reset
+    motor_scan_phase_seconds{phase,outcome} lpf_pass, objective_switch,
+                                           hpf_pass, home
+    motor_field_move_seconds{field_type}   move + settle per scanned field
+    motor_autofocus_seconds{field_type}    focus sweep per scanned field
+    motor_job_seconds{kind,stage}          ASGI job queue wait and run time
+
+setup_logging() routes all log records through a QueueHandler; a background
+listener does the file and console writes, so disk I/O never sits between a
+serial command and its reply.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+COMMAND_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+PHASE_BUCKETS = (1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+HELP = {
+    'motor_command_seconds': 'Serial command latency by phase',
+    'motor_commands_total': 'Serial commands by result',
+    'motor_scan_phase_seconds': 'Duration of scan phases',
+    'motor_field_move_seconds': 'Move plus settle time per scanned field',
+    'motor_autofocus_seconds': 'Autofocus sweep time per scanned field',
+    'motor_job_seconds': 'ASGI stage job queue wait and run time',
+}
+
+# ---------------------------------------------------------------------------
+# Metrics registry
+# ---------------------------------------------------------------------------
+
+class Histogram:
+    """Cumulative-bucket histogram, as Prometheus expects."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+class Metrics:
+    """Thread-safe store of labelled histograms and counters."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}   # (name, labels) -> Histogram
+        self.counters = {}     # (name, labels) -> float
+
+    def observe(self, name, seconds, buckets=COMMAND_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(seconds)
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}' if pairs else ''
+
+        lines, seen = [], set()
+        with self.lock:
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                    lines.append(f"# TYPE {name} histogram")
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {histogram.count}")
+                lines.append(f"{name}_sum{fmt(labels)} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{fmt(labels)} {histogram.count}")
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name}{fmt(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+class PhaseTimer:
+    """Times consecutive scan phases; starting one closes the previous."""
+
+    def __init__(self):
+        self.phase = None
+        self.started = None
+
+    def start(self, phase):
+        self.end()
+        self.phase = phase
+        self.started = time.perf_counter()
+
+    def end(self, outcome='done'):
+        if self.phase is None:
+            return
+        metrics.observe('motor_scan_phase_seconds', time.perf_counter() - self.started, PHASE_BUCKETS,
+                        phase=self.phase, outcome=outcome)
+        self.phase = None
+
+    def timed(self, phase, fn):
+        """Run fn() as a standalone phase (e.g. HOME) and return its result."""
+        started = time.perf_counter()
+        result = fn()
+        metrics.observe('motor_scan_phase_seconds', time.perf_counter() - started, PHASE_BUCKETS,
+                        phase=phase, outcome='done' if result else 'failed')
+        return result
+
+# ---------------------------------------------------------------------------
+# Non-blocking logging
+# ---------------------------------------------------------------------------
+
+def setup_logging(log_file, level=logging.INFO):
+    """Log to `log_file` and the console from a background thread."""
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    handlers = [logging.FileHandler(log_file), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    return listener